@@ -0,0 +1,70 @@
+"""Compare serial and parallel block compression of merged node archives
+
+Tars up copies of the rnodes test snapshots, as merge_node does, with
+each COMPRESS_EXT codec, serially through tarfile and in parallel
+blocks across a number of threads.
+
+Run from the repository root:
+
+    $ python benchmarks/bench_compress.py [snapshots] [jobs ...]"""
+from context import archive
+
+from datetime import datetime, timedelta
+from glob import glob
+import os
+import shutil
+import sys
+import tempfile
+from time import perf_counter as tick
+
+NODE_DIR = os.path.join(os.path.dirname(__file__), '..', 'tests',
+                        'rnodes-20170823_000000')
+NODE_FMT = 'rnodes-%Y%m%d_%H%M%S'
+
+CODECS = ['gz', 'bz2', 'xz']
+
+INTERVAL = timedelta(seconds=5)
+
+
+def main():
+    num_snapshots = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    job_counts = [int(jobs) for jobs in sys.argv[2:]] or \
+        sorted({2, os.cpu_count() or 1})
+
+    csv_paths = sorted(glob(os.path.join(NODE_DIR, '*.csv')))
+    start_time = datetime(2017, 8, 23)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        timestamps = []
+        for i in range(num_snapshots):
+            timestamp = start_time + i * INTERVAL
+            path = os.path.join(tmp_dir,
+                                timestamp.strftime(NODE_FMT) + '.csv')
+
+            shutil.copy(csv_paths[i % len(csv_paths)], path)
+            paths.append(path)
+            timestamps.append(timestamp)
+
+        raw_size = sum(os.path.getsize(path) for path in paths)
+        print('Archiving {} snapshots, {:.1f} MiB, on {} CPU(s)'.format(
+            num_snapshots, raw_size / 2**20, os.cpu_count()))
+
+        for ext in CODECS:
+            for jobs in [1] + job_counts:
+                archive_path = os.path.join(tmp_dir, 'nodes.tar.' + ext)
+
+                elapsed = tick()
+                archive.write_archive(archive_path, paths, timestamps, ext,
+                                      jobs=jobs)
+                elapsed = tick() - elapsed
+
+                print('{:>3}, {:>2} job(s): {:6.1f} MiB/s, ratio {:5.1f}'
+                      .format(ext, jobs, raw_size / 2**20 / elapsed,
+                              raw_size / os.path.getsize(archive_path)))
+
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,92 @@
+"""Time reading the history of a few nodes from a node history store,
+against scanning every snapshot of a segment for them
+
+Replays the rnodes test snapshots as if slurpyd had written them every
+interval seconds for the given number of days, then times reading back
+the whole history of one node, and of three.
+
+Run from the repository root:
+
+    $ python benchmarks/bench_node_history.py [days] [interval]"""
+from context import history, segment
+
+from datetime import timedelta
+from glob import glob
+import os
+import sys
+import tempfile
+from time import perf_counter as tick
+
+import pandas as pd
+
+NODE_DIR = os.path.join(os.path.dirname(__file__), '..', 'tests',
+                        'rnodes-20170823_000000')
+ROLL_FMT = 'rnodes-%Y%m%d'
+
+NODES = ['r2n14', 'r2n05', 'r3n17']
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    interval = timedelta(seconds=int(sys.argv[2]) if len(sys.argv) > 2
+                         else 60)
+    snapshots = [pd.read_csv(csv_path) for csv_path in
+                 sorted(glob(os.path.join(NODE_DIR, '*.csv')))]
+    start_time = pd.Timestamp('2017-08-23')
+    end_time = start_time + timedelta(days=days)
+    num_snapshots = int(timedelta(days=days) / interval)
+
+    print('Storing {} snapshots of {} nodes'.format(num_snapshots,
+                                                    len(snapshots[0])))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = history.HistoryStore(os.path.join(tmp_dir, 'history'))
+        writer = segment.SegmentWriter()
+        segment_paths = []
+
+        elapsed = tick()
+        for i in range(num_snapshots):
+            timestamp = start_time + i * interval
+            store.append(timestamp, snapshots[i % len(snapshots)])
+        store.close()
+        elapsed = tick() - elapsed
+
+        print('{:>8}: ingested in {:7.3f} s'.format('history', elapsed))
+
+        for i in range(num_snapshots):
+            timestamp = start_time + i * interval
+            segment_path = os.path.join(
+                tmp_dir, timestamp.strftime(ROLL_FMT) + '.seg')
+            if segment_path not in segment_paths:
+                segment_paths.append(segment_path)
+            writer.append(segment_path, snapshots[i % len(snapshots)],
+                          timestamp)
+        writer.close()
+
+        for nodes in [NODES[:1], NODES]:
+            elapsed = tick()
+            node_df = history.node_history(nodes, start_time, end_time,
+                                           store_dir=store.path)
+            elapsed = tick() - elapsed
+
+            print('{:>8}: read {} rows of {} node(s) in {:7.3f} s'
+                  .format('history', len(node_df), len(nodes), elapsed))
+
+        elapsed = tick()
+        num_rows = scan_segments(segment_paths, NODES)
+        elapsed = tick() - elapsed
+
+        print('{:>8}: read {} rows of {} node(s) in {:7.3f} s'
+              .format('segment', num_rows, len(NODES), elapsed))
+
+
+def scan_segments(segment_paths, nodes):
+    num_rows = 0
+    for _, snapshot in segment.iter_snapshots(segment_paths):
+        num_rows += snapshot['NodeHost'].isin(nodes).sum()
+
+    return num_rows
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Compare the typed sacct parser against the old string-array path
+
+Run from the repository root:
+
+    $ python benchmarks/bench_parse.py [rows]"""
+from context import slurm
+
+import csv
+import io
+import sys
+import tracemalloc
+from time import perf_counter as tick
+
+import numpy as np
+import pandas as pd
+
+PROPERTIES = ['JobID',
+              'State',
+              'ReqCPUS',
+              'AllocCPUS',
+              'AllocNodes',
+              'NodeList',
+              'Submit',
+              'Start',
+              'ElapsedRaw',
+              'CPUTimeRAW']
+
+ROW_FMT = ('{0}|COMPLETED|{1}|{1}|1|r1n{2:02d}|2017-08-23T00:00:00|'
+           '2017-08-23T00:00:05|{3}|{4}\n')
+
+DEFAULT_ROWS = 500000
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    raw_sacct = make_raw_sacct(rows)
+
+    print('Parsing {} sacct rows'.format(rows))
+    for name, parser in [('legacy', legacy_parse), ('typed', typed_parse)]:
+        elapsed, peak = measure(parser, raw_sacct)
+        print('{:<8}: {:8.3f} s, peak {:8.1f} MiB'
+              .format(name, elapsed, peak / 2**20))
+
+    return 0
+
+
+def make_raw_sacct(rows):
+    return ''.join(ROW_FMT.format(i, i % 32 + 1, i % 64, i % 3600, i % 7200)
+                   for i in range(rows))
+
+
+def measure(parser, raw_sacct):
+    tracemalloc.start()
+    elapsed = tick()
+    parser(raw_sacct)
+    elapsed = tick() - elapsed
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak
+
+
+def legacy_parse(raw_sacct):
+    """The csv.reader -> np.array -> astype path used before typing"""
+    reader = csv.reader(io.StringIO(raw_sacct), delimiter=slurm.DELIM,
+                        strict=True)
+    job_df = pd.DataFrame(data=np.array([row for row in reader]),
+                          columns=PROPERTIES)
+
+    job_df['ReqCPUS'] = job_df['ReqCPUS'].astype(int)
+    job_df['AllocCPUS'] = job_df['AllocCPUS'].astype(int)
+    job_df['AllocNodes'] = job_df['AllocNodes'].astype(int)
+    job_df['Submit'] = pd.to_datetime(job_df['Submit'])
+    job_df['Start'] = pd.to_datetime(job_df['Start'])
+    job_df['ElapsedRaw'] = job_df['ElapsedRaw'].astype(int)
+    job_df['CPUTimeRAW'] = job_df['CPUTimeRAW'].astype(int)
+
+    return job_df
+
+
+def typed_parse(raw_sacct):
+    return slurm._extract_typed_data(raw_sacct, PROPERTIES,
+                                     slurm.JOB_PROPERTY_TYPES,
+                                     sep=slurm.DELIM)
+
+
+if __name__ == '__main__':
+    exit(main())
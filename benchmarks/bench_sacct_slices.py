@@ -0,0 +1,49 @@
+"""Time sliced sacct queries against the fake sacct in tests/bin
+
+Run from the repository root:
+
+    $ python benchmarks/bench_sacct_slices.py [days] [latency]
+
+latency is the number of seconds the fake sacct takes per day queried."""
+from context import slurm
+
+import os
+import sys
+from datetime import datetime, timedelta
+from time import perf_counter as tick
+
+FAKE_BIN = os.path.join(os.path.dirname(__file__), '..', 'tests', 'bin')
+FAKE_NOW = '2017-08-23T12:00:00'
+
+PROPERTIES = ['JobIDRaw', 'State', 'AllocCPUS', 'Submit', 'ElapsedRaw']
+
+SLICES = [1, 2, 4, 8]
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    latency = sys.argv[2] if len(sys.argv) > 2 else '0.5'
+
+    os.environ['PATH'] = os.pathsep.join([os.path.abspath(FAKE_BIN),
+                                          os.environ['PATH']])
+    os.environ['FAKE_SACCT_NOW'] = FAKE_NOW
+    os.environ['FAKE_SACCT_LATENCY'] = latency
+
+    end_time = datetime.strptime(FAKE_NOW, slurm.DATE_FORMAT)
+    period = timedelta(days=days)
+
+    print('Querying {} day(s) at {} s/day'.format(days, latency))
+    for slices in SLICES:
+        elapsed = tick()
+        jobs = slurm.query_jobs(PROPERTIES, end_time=end_time,
+                                period=period, slices=slices)
+        elapsed = tick() - elapsed
+
+        print('{:>2} slice(s): {:7.3f} s, {} jobs'
+              .format(slices, elapsed, len(jobs)))
+
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,76 @@
+"""Compare the scontrol -o tokenizer against the regex extraction it
+replaces
+
+Scales the RAW_SCONTROL test fixture up to the given number of nodes.
+
+Run from the repository root:
+
+    $ python benchmarks/bench_scontrol.py [nodes]"""
+from context import slurm
+
+import os
+import sys
+from time import perf_counter as tick
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'tests'))
+from test_slurm import RAW_SCONTROL, RAW_SCONTROL_LEN  # noqa: E402
+
+# In scontrol order, as the regex needs them
+KEYS = ['NodeName',
+        'CPUAlloc',
+        'CPUTot',
+        'FreeMem',
+        'Sockets',
+        'Boards',
+        'State']
+
+DEFAULT_NODES = 10000
+
+
+def main():
+    nodes = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_NODES
+    raw_scontrol = make_raw_scontrol(nodes)
+
+    print('Parsing {} scontrol nodes'.format(nodes))
+    for name, parser in [('regex', regex_parse),
+                         ('tokens', token_parse),
+                         ('reversed', reversed_parse),
+                         ('all', all_parse)]:
+        elapsed = tick()
+        node_df = parser(raw_scontrol)
+        elapsed = tick() - elapsed
+
+        print('{:<8}: {:8.3f} s, {} rows of {} keys'
+              .format(name, elapsed, *node_df.shape))
+
+    return 0
+
+
+def make_raw_scontrol(nodes):
+    lines = RAW_SCONTROL.splitlines()
+    return '\n'.join(lines * -(-nodes // RAW_SCONTROL_LEN)) + '\n'
+
+
+def regex_parse(raw_scontrol):
+    """The untyped regex extraction, keys in scontrol order only"""
+    return slurm._extract_scontrol_features(raw_scontrol, KEYS)
+
+
+def token_parse(raw_scontrol):
+    return slurm._extract_scontrol_data(raw_scontrol, KEYS,
+                                        slurm.SCONTROL_NODE_TYPES)
+
+
+def reversed_parse(raw_scontrol):
+    return slurm._extract_scontrol_data(raw_scontrol, KEYS[::-1] +
+                                        ['Reason', 'CfgTRES.mem'],
+                                        slurm.SCONTROL_NODE_TYPES)
+
+
+def all_parse(raw_scontrol):
+    return slurm._extract_scontrol_data(raw_scontrol, 'all',
+                                        slurm.SCONTROL_NODE_TYPES)
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,107 @@
+"""Compare CSV-per-snapshot node storage against rolling Parquet files,
+and plain and delta encoded segments
+
+Replays the rnodes test snapshots as if slurpyd had written them every
+5 seconds for the given number of hours, then times reading them back.
+
+Run from the repository root:
+
+    $ python benchmarks/bench_snapshot_storage.py [hours]"""
+from context import columnar, segment
+
+from datetime import timedelta
+from glob import glob
+import os
+import sys
+import tempfile
+from time import perf_counter as tick
+
+import pandas as pd
+
+NODE_DIR = os.path.join(os.path.dirname(__file__), '..', 'tests',
+                        'rnodes-20170823_000000')
+NODE_FMT = 'rnodes-%Y%m%d_%H%M%S'
+ROLL_FMT = 'rnodes-%Y%m%d_%H'
+
+INTERVAL = timedelta(seconds=5)
+
+
+def main():
+    hours = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    snapshots = [pd.read_csv(csv_path) for csv_path in
+                 sorted(glob(os.path.join(NODE_DIR, '*.csv')))]
+    start_time = pd.Timestamp('2017-08-23')
+    num_snapshots = int(timedelta(hours=hours) / INTERVAL)
+
+    print('Storing {} snapshots of {} nodes'.format(num_snapshots,
+                                                    len(snapshots[0])))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_dir = os.path.join(tmp_dir, 'csv')
+        parquet_dir = os.path.join(tmp_dir, 'parquet')
+        segment_dir = os.path.join(tmp_dir, 'segment')
+        delta_dir = os.path.join(tmp_dir, 'delta')
+        for path in [csv_dir, parquet_dir, segment_dir, delta_dir]:
+            os.mkdir(path)
+
+        appender = columnar.SnapshotAppender()
+        segment_writer = segment.SegmentWriter()
+        delta_writer = segment.SegmentWriter(keyframe_interval=720)
+        for i in range(num_snapshots):
+            timestamp = start_time + i * INTERVAL
+            snapshot = snapshots[i % len(snapshots)]
+
+            snapshot.to_csv(os.path.join(
+                csv_dir, timestamp.strftime(NODE_FMT) + '.csv'), index=False)
+            appender.append(os.path.join(
+                parquet_dir, timestamp.strftime(ROLL_FMT) + '.parquet'),
+                snapshot, timestamp)
+
+            for writer, path in [(segment_writer, segment_dir),
+                                 (delta_writer, delta_dir)]:
+                writer.append(os.path.join(
+                    path, timestamp.strftime(ROLL_FMT) + '.seg'),
+                    snapshot, timestamp)
+
+        appender.close()
+        segment_writer.close()
+        delta_writer.close()
+
+        for name, reader, path in [('csv', read_csv_dir, csv_dir),
+                                   ('parquet', read_parquet_dir,
+                                    parquet_dir),
+                                   ('segment', read_segment_dir,
+                                    segment_dir),
+                                   ('delta', read_segment_dir, delta_dir)]:
+            elapsed = tick()
+            num_rows = reader(path)
+            elapsed = tick() - elapsed
+
+            print('{:>8}: {:8.1f} KiB on disk, read {} rows in {:7.3f} s'
+                  .format(name, disk_usage(path) / 1024, num_rows, elapsed))
+
+    return 0
+
+
+def read_csv_dir(path):
+    return sum(len(pd.read_csv(os.path.join(path, file)))
+               for file in sorted(os.listdir(path)))
+
+
+def read_parquet_dir(path):
+    return sum(len(columnar.read_snapshots(os.path.join(path, file)))
+               for file in sorted(os.listdir(path)))
+
+
+def read_segment_dir(path):
+    return len(segment.read_snapshots(path))
+
+
+def disk_usage(path):
+    """Bytes allocated on disk, counting each file's block overhead"""
+    return sum(os.stat(os.path.join(path, file)).st_blocks * 512
+               for file in os.listdir(path))
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,55 @@
+"""Compare split_aiot against the Series.str.split it replaces
+
+Scales the CPUsState column of the rnodes test fixtures up by the given
+factor.
+
+Run from the repository root:
+
+    $ python benchmarks/bench_split_aiot.py [scale]"""
+from context import slurm
+
+from glob import glob
+import os
+import sys
+from timeit import repeat
+
+import numpy as np
+import pandas as pd
+
+NODE_DIR = os.path.join(os.path.dirname(__file__), '..', 'tests',
+                        'rnodes-20170823_000000')
+
+DEFAULT_SCALE = 50
+REPEAT = 5
+
+
+def main():
+    scale = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SCALE
+
+    cpus_state = pd.concat([pd.read_csv(csv_path)['CPUsState']
+                            for csv_path in sorted(glob(os.path.join(
+                                NODE_DIR, '*.csv')))] * scale,
+                           ignore_index=True)
+
+    assert np.all(slurm.split_aiot(cpus_state) ==
+                  legacy_split_aiot(cpus_state))
+
+    legacy_s = min(repeat(lambda: legacy_split_aiot(cpus_state),
+                          number=1, repeat=REPEAT))
+    split_s = min(repeat(lambda: slurm.split_aiot(cpus_state),
+                         number=1, repeat=REPEAT))
+
+    print('Splitting {} CPUsState values'.format(len(cpus_state)))
+    print('split_aiot: {:.2f} ms, str.split: {:.2f} ms ({:.1f}x)'
+          .format(split_s * 1000, legacy_s * 1000, legacy_s / split_s))
+
+    return 0
+
+
+def legacy_split_aiot(aiot):
+    """The Series.str.split path used before split_aiot"""
+    return aiot.str.split('/', n=4, expand=True).astype(int).values
+
+
+if __name__ == '__main__':
+    exit(main())
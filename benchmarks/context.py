@@ -0,0 +1,10 @@
+import os.path as path
+import sys
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), '..')))
+
+# Modules needed for benchmarks
+import slurpy.slurm as slurm
+import slurpy.columnar as columnar
+import slurpy.archive as archive
+import slurpy.segment as segment
+import slurpy.history as history
@@ -15,9 +15,12 @@ setup(name='slurpy',
           'apscheduler',
           'pytest',
       ],
+      extras_require={
+          'parquet': ['pyarrow'],
+      },
       entry_points={
-          'console_scripts': ['query-jobs=slurpy.cl:query_jobs',
-                              'query-nodes=slurpy.cl:query_nodes',
+          'console_scripts': ['query-jobs=slurpy.cl:query_jobs_main',
+                              'query-nodes=slurpy.cl:query_nodes_main',
                               'slurpyd=slurpy.slurpy_daemon:main',
                               'analyse-slurpy=slurpy.analysis:main'],
       },
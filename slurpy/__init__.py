@@ -2,18 +2,47 @@
 
 slurpy provides a fast way to query job and node status through SLURM"""
 
-from slurpy.slurpy import filter_df, get_node_df, get_job_df
-from slurpy.slurm import query_nodes, query_jobs, \
-                         check_node_features, check_job_properties
+from slurpy.slurpy import filter_df, get_node_df, get_job_df, get_queue_df, \
+                          get_queue_df_async, iter_job_df
+from slurpy.slurm import query_nodes, query_jobs, query_jobs_iter, \
+                         query_nodes_async, query_jobs_async, query_queue, \
+                         query_queue_async, \
+                         query_scontrol_nodes, query_scontrol_jobs, \
+                         check_node_features, check_job_properties, \
+                         check_queue_fields, NodeQueryPlanner
+from slurpy.cache import JobCache, JobTracker, QueryCache
+from slurpy.history import HistoryStore, node_history
 import slurpy.aggregate as aggregate
+import slurpy.archive as archive
+import slurpy.columnar as columnar
+import slurpy.delta as delta
+import slurpy.history as history
+import slurpy.segment as segment
 from slurpy._version import __version__
 
 __all__ = (
     filter_df,
     get_node_df,
     get_job_df,
+    get_queue_df,
+    get_queue_df_async,
+    iter_job_df,
     query_nodes,
     query_jobs,
+    query_jobs_iter,
+    query_queue,
+    query_queue_async,
+    query_nodes_async,
+    query_jobs_async,
+    query_scontrol_nodes,
+    query_scontrol_jobs,
     check_node_features,
-    check_job_properties
+    check_job_properties,
+    check_queue_fields,
+    NodeQueryPlanner,
+    JobCache,
+    JobTracker,
+    QueryCache,
+    HistoryStore,
+    node_history
 )
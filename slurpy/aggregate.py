@@ -1,82 +1,407 @@
+from .slurm import split_aiot, ALLOC, IDLE, OTHER, TOTAL, CPU_COLUMNS
+from .matcher import PatternMatcher
+
 import abc
+from collections import OrderedDict
+from datetime import timedelta
+import re
 
 import pandas as pd
 import numpy as np
 
-ALLOC = 0
-IDLE = 1
-OTHER = 2
-TOTAL = 3
+TIMESTAMP = 'Timestamp'
+TIMESTAMP_DTYPE = 'datetime64[ns]'
+METRIC_DTYPE = np.int64
+
+COUNT = 'Count'
+SUM = 'sum'
+MIN = 'min'
+MAX = 'max'
+LAST = 'last'
+MEAN = 'mean'
+LAST_TIMESTAMP = 'LastTimestamp'
+
+STATS = [(SUM, 'sum'), (MIN, 'min'), (MAX, 'max'), (LAST, 'last')]
+
+ALIGN_EPOCH = np.datetime64(0, 'ns')
+ROLLUP_UNITS = {'s': 'seconds',
+                'm': 'minutes',
+                'h': 'hours',
+                'd': 'days'}
+
+INITIAL_CAPACITY = 1024
+
+
+class ColumnBuffer(object):
+    """ColumnBuffer object
+
+    Named, typed NumPy columns that rows are appended to. Capacity
+    doubles whenever the columns fill up."""
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        super(ColumnBuffer, self).__init__()
+
+        self._columns = {}
+        self._capacity = capacity
+        self._size = 0
+
+    def add_column(self, name, dtype):
+        self._columns[name] = np.zeros(self._capacity, dtype=dtype)
+
+    def append(self, **values):
+        if self._size == self._capacity:
+            self._grow(2 * self._capacity)
+
+        for name, column in self._columns.items():
+            column[self._size] = values[name]
+
+        self._size += 1
+
+    def extend(self, **columns):
+        """Append equal length arrays to each column"""
+        num_rows = len(next(iter(columns.values())))
+
+        if self._size + num_rows > self._capacity:
+            self._grow(max(2 * self._capacity, self._size + num_rows))
+
+        for name, column in self._columns.items():
+            column[self._size:self._size + num_rows] = columns[name]
+
+        self._size += num_rows
+
+    def clear(self):
+        self._size = 0
+
+    def column(self, name):
+        """Return a view of the filled part of a column"""
+        return self._columns[name][:self._size]
+
+    def to_frame(self, index):
+        """Return a DataFrame viewing the filled part of each column"""
+        return pd.DataFrame({name: self.column(name)
+                             for name in self._columns if name != index},
+                            index=pd.Index(self.column(index), name=index,
+                                           copy=False),
+                            copy=False)
+
+    def __len__(self):
+        return self._size
+
+    def _grow(self, capacity):
+        for name, column in self._columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+        self._capacity = capacity
+
+
+class BucketState(object):
+    """BucketState object
+
+    Keeps a count, sum, min, max and last value of each metric per time
+    bucket. Buckets are resolution long, or one per timestamp when
+    resolution is None. Snapshots landing in the newest bucket update it
+    in place, so in-order snapshots add at most one row per bucket."""
+    def __init__(self, resolution=None):
+        super(BucketState, self).__init__()
+
+        self._resolution = (None if resolution is None
+                            else np.timedelta64(resolution, 'ns'))
+
+        self._buffer = ColumnBuffer()
+        self._buffer.add_column(TIMESTAMP, TIMESTAMP_DTYPE)
+        self._buffer.add_column(COUNT, METRIC_DTYPE)
+        self._buffer.add_column(LAST_TIMESTAMP, TIMESTAMP_DTYPE)
+
+        self._metrics = []
+        self._reducers = {COUNT: 'sum', LAST_TIMESTAMP: 'max'}
+
+        self._tail_bucket = None
+        self._last_bucket = None
+        self._is_compact = True
+
+    def add_metric(self, name):
+        self._metrics.append(name)
+
+        for stat, reducer in STATS:
+            self._buffer.add_column(_stat(name, stat), METRIC_DTYPE)
+            self._reducers[_stat(name, stat)] = reducer
+
+    def add(self, timestamp, metrics):
+        timestamp = np.datetime64(timestamp, 'ns')
+        bucket = self._floor(timestamp)
+
+        if bucket == self._tail_bucket:
+            self._update_tail(timestamp, metrics)
+            return
+
+        self._add_bucket(bucket)
+
+        row = {TIMESTAMP: bucket, COUNT: 1, LAST_TIMESTAMP: timestamp}
+        for name, value in metrics.items():
+            for stat, _ in STATS:
+                row[_stat(name, stat)] = value
+
+        self._buffer.append(**row)
+
+    def state(self):
+        """Return compacted state DataFrame indexed by bucket start"""
+        self._compact()
+        return self._buffer.to_frame(index=TIMESTAMP)
+
+    def merge(self, state):
+        if not len(state):
+            return
+
+        if not state.index.is_monotonic_increasing:
+            self._is_compact = False
+
+        self._add_bucket(state.index[0].to_datetime64())
+        self._add_bucket(state.index[-1].to_datetime64())
+
+        self._buffer.extend(**{TIMESTAMP: state.index.values},
+                            **{name: state[name].values
+                               for name in self._reducers})
+
+    def means(self):
+        """Return DataFrame of each metric's mean per bucket, rounded
+        down. Columns are views of the state's arrays when no bucket was
+        seen twice."""
+        state = self.state()
+        counts = state[COUNT].values
+
+        if np.all(counts == 1):
+            agg_df = state[[_stat(metric, SUM) for metric in self._metrics]]
+        else:
+            agg_df = pd.DataFrame({_stat(metric, SUM):
+                                   state[_stat(metric, SUM)].values // counts
+                                   for metric in self._metrics},
+                                  index=state.index)
+
+        agg_df.columns = self._metrics
+        return agg_df
+
+    def rollup(self):
+        """Return DataFrame of the mean, min, max and last value of each
+        metric per bucket"""
+        state = self.state()
+        counts = state[COUNT].values
+
+        columns = {}
+        for metric in self._metrics:
+            columns[_stat(metric, MEAN)] = (state[_stat(metric, SUM)].values /
+                                            counts)
+            for stat in [MIN, MAX, LAST]:
+                columns[_stat(metric, stat)] = state[_stat(metric, stat)]
+
+        return pd.DataFrame(columns, index=state.index)
+
+    def _floor(self, timestamp):
+        if self._resolution is None:
+            return timestamp
+
+        return timestamp - (timestamp - ALIGN_EPOCH) % self._resolution
+
+    def _add_bucket(self, bucket):
+        if self._last_bucket is not None and bucket <= self._last_bucket:
+            self._is_compact = False
+
+        self._tail_bucket = bucket
+        if self._last_bucket is None or bucket > self._last_bucket:
+            self._last_bucket = bucket
+
+    def _update_tail(self, timestamp, metrics):
+        tail = len(self._buffer) - 1
+        column = self._buffer.column
+
+        column(COUNT)[tail] += 1
+        is_last = timestamp >= column(LAST_TIMESTAMP)[tail]
+        if is_last:
+            column(LAST_TIMESTAMP)[tail] = timestamp
+
+        for name, value in metrics.items():
+            column(_stat(name, SUM))[tail] += value
+            min_col = column(_stat(name, MIN))
+            min_col[tail] = min(min_col[tail], value)
+            max_col = column(_stat(name, MAX))
+            max_col[tail] = max(max_col[tail], value)
+            if is_last:
+                column(_stat(name, LAST))[tail] = value
+
+    def _compact(self):
+        """Sort state by bucket and combine repeated buckets"""
+        if self._is_compact:
+            return
+
+        # Ordering by LastTimestamp lets the 'last' reducer pick the
+        # value of the latest snapshot in each bucket
+        state = (self._buffer.to_frame(index=TIMESTAMP)
+                             .sort_values([TIMESTAMP, LAST_TIMESTAMP],
+                                          kind='mergesort')
+                             .groupby(level=TIMESTAMP, sort=True)
+                             .agg(self._reducers))
+
+        self._buffer.clear()
+        self._buffer.extend(**{TIMESTAMP: state.index.values},
+                            **{name: state[name].values
+                               for name in self._reducers})
+        self._tail_bucket = None
+        self._is_compact = True
 
 
 class GenericAggregator(metaclass=abc.ABCMeta):
-    """GenericAggregator object"""
-    def __init__(self, *arg, **kwargs):
+    """GenericAggregator object
+
+    Keeps a count, sum, min, max and last value of each metric per
+    timestamp, and per bucket of each rollup resolution, e.g. '5m'. This
+    state can be merged with that of other aggregators in any order,
+    so aggregation can be split by time range or archive."""
+    def __init__(self, rollups=None, *arg, **kwargs):
         super(GenericAggregator, self).__init__()
 
-        self._aggregate = {'Timestamp': []}
+        self._aggregate = BucketState()
+        self._rollups = OrderedDict(
+            (label, BucketState(parse_resolution(label)))
+            for label in rollups or [])
         self._name = 'generic_agg'
 
     @abc.abstractmethod
     def agg(self, timestamp, df_to_aggregate):
         return NotImplemented
 
+    @property
+    def rollups(self):
+        return list(self._rollups)
+
+    def state(self, rollup=None):
+        """Return partial aggregate state DataFrame indexed by timestamp,
+        or by bucket start for a rollup.
+
+        Holds Count and LastTimestamp columns, and a _sum, _min, _max and
+        _last column for each metric. Can be pickled or written out and
+        passed to merge."""
+        return self._bucket_state(rollup).state()
+
+    def merge(self, other, rollup=None):
+        """Merge in another aggregator, or a state it returned.
+
+        Aggregators are merged at every resolution both of them keep."""
+        if isinstance(other, GenericAggregator):
+            self._aggregate.merge(other.state())
+            for label in self._rollups:
+                if label in other._rollups:
+                    self._rollups[label].merge(other.state(label))
+        else:
+            self._bucket_state(rollup).merge(other)
+
+    def to_frame(self, rollup=None):
+        """Return aggregate DataFrame indexed by timestamp.
+
+        Each metric is its mean over the snapshots seen at a timestamp,
+        rounded down. Columns are views of the aggregator's arrays when
+        no timestamp was seen twice.
+
+        For a rollup, returns the _mean, _min, _max and _last value of
+        each metric, indexed by bucket start."""
+        if rollup is None:
+            return self._aggregate.means()
+
+        return self._bucket_state(rollup).rollup()
+
     def to_csv(self):
-        agg_df = (pd.DataFrame.from_dict(self._aggregate)
-                              .set_index('Timestamp')
-                              .sort_index())
+        """Write the aggregate, and each rollup, to its own CSV file"""
+        for rollup in [None] + self.rollups:
+            agg_df = self.to_frame(rollup)
+            if not len(agg_df):
+                continue
 
-        min_timestamp = agg_df.index[0]
-        filename = '{}-{:%Y%m%d_%H%M%S}.csv'.format(self._name, min_timestamp)
+            name = self._name if rollup is None else '{}_{}'.format(
+                self._name, rollup)
+            filename = '{}-{:%Y%m%d_%H%M%S}.csv'.format(name, agg_df.index[0])
 
-        print('Writing to {}'.format(filename))
-        agg_df.to_csv(filename)
+            print('Writing to {}'.format(filename))
+            agg_df.to_csv(filename)
+
+    def _add_metric(self, name):
+        for bucket_state in [self._aggregate] + list(self._rollups.values()):
+            bucket_state.add_metric(name)
+
+    def _append(self, timestamp, **metrics):
+        self._aggregate.add(timestamp, metrics)
+
+        for bucket_state in self._rollups.values():
+            bucket_state.add(timestamp, metrics)
+
+    def _bucket_state(self, rollup):
+        if rollup is None:
+            return self._aggregate
+
+        try:
+            return self._rollups[rollup]
+        except KeyError:
+            raise KeyError('No {} rollup. Rollups: {}'.format(
+                rollup, ', '.join(self._rollups) or 'none'))
 
 
 class NodeAggregator(GenericAggregator):
     """NodeAggregator object
 
     NodeHost,StateCompact,CPUsState,Memory,AllocMem,FreeMem"""
-    def __init__(self, nodes=None):
-        super(NodeAggregator, self).__init__()
+    def __init__(self, nodes=None, rollups=None):
+        super(NodeAggregator, self).__init__(rollups)
         if nodes:
             print("Using pattern {} to filter node hosts".format(nodes))
         else:
             print("Not filtering on node hosts")
 
-        self._aggregate['AllocCPUs'] = []
-        self._aggregate['IdleCPUs'] = []
-        self._aggregate['OtherCPUs'] = []
-        self._aggregate['TotalCPUs'] = []
+        self._add_metric('AllocCPUs')
+        self._add_metric('IdleCPUs')
+        self._add_metric('OtherCPUs')
+        self._add_metric('TotalCPUs')
 
-        self._aggregate['AllocMem'] = []
-        self._aggregate['FreeMem'] = []
-        self._aggregate['TotalMem'] = []
+        self._add_metric('AllocMem')
+        self._add_metric('FreeMem')
+        self._add_metric('TotalMem')
 
         self._name = 'node_agg'
-        self._node_pattern = '({})'.format(nodes)
+        self._node_matcher = PatternMatcher(nodes) if nodes else None
 
     def agg(self, timestamp, df_to_aggregate):
-        rnode_df = self.filter_nodes(df_to_aggregate, self._node_pattern)
+        rnode_df = self.filter_nodes(df_to_aggregate)
+
+        # Snapshots read back from columnar storage come pre-split
+        if 'CPUsState' in rnode_df:
+            cpu_aiot = split_aiot(rnode_df['CPUsState'])
+        else:
+            cpu_aiot = rnode_df[CPU_COLUMNS].values
+
+        self._append(timestamp,
+                     AllocCPUs=cpu_aiot[:, ALLOC].sum(),
+                     IdleCPUs=cpu_aiot[:, IDLE].sum(),
+                     OtherCPUs=cpu_aiot[:, OTHER].sum(),
+                     TotalCPUs=cpu_aiot[:, TOTAL].sum(),
+                     AllocMem=rnode_df['AllocMem'].sum(),
+                     FreeMem=rnode_df['FreeMem'].sum(),
+                     TotalMem=rnode_df['Memory'].sum())
+
+    def filter_nodes(self, df):
+        if self._node_matcher is None:
+            return df
 
-        cpu_aiot = self._split_aiot(rnode_df['CPUsState'])
+        return df[self._node_matcher.match(df['NodeHost'])]
 
-        self._aggregate['Timestamp'].append(timestamp)
 
-        self._aggregate['AllocCPUs'].append(cpu_aiot[:, ALLOC].sum())
-        self._aggregate['IdleCPUs'].append(cpu_aiot[:, IDLE].sum())
-        self._aggregate['OtherCPUs'].append(cpu_aiot[:, OTHER].sum())
-        self._aggregate['TotalCPUs'].append(cpu_aiot[:, TOTAL].sum())
+def parse_resolution(label):
+    """Parse a rollup resolution such as '5m' into a timedelta"""
+    match = re.fullmatch(r'([1-9][0-9]*)([{}])'.format(''.join(ROLLUP_UNITS)),
+                         label)
+    if not match:
+        raise ValueError('Invalid rollup resolution {!r}. Use a number '
+                         'followed by one of: {}'.format(
+                             label, ', '.join(ROLLUP_UNITS)))
 
-        self._aggregate['AllocMem'].append(rnode_df['AllocMem'].sum())
-        self._aggregate['FreeMem'].append(rnode_df['FreeMem'].sum())
-        self._aggregate['TotalMem'].append(rnode_df['Memory'].sum())
+    return timedelta(**{ROLLUP_UNITS[match.group(2)]: int(match.group(1))})
 
-    def filter_nodes(self, df, regex):
-        matches_regex = (~df['NodeHost'].str
-                                        .extract(regex, expand=False)
-                                        .isnull())
-        return df[matches_regex].copy()
 
-    def _split_aiot(self, aiot):
-        return aiot.str.split('/', n=4, expand=True).astype(int).values
+def _stat(metric, stat):
+    return '{}_{}'.format(metric, stat)
@@ -1,49 +1,187 @@
 import slurpy
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 import datetime
 import difflib
+from functools import partial
+from glob import glob
+import io
 import os.path
 import tarfile
 
 import pandas as pd
 
 CSV_FORMAT = 'rnodes-%Y%m%d_%H%M%S'
+NODE_PATTERN = r'r[1-4]n[0-9]{2}'
+PARQUET_SUFFIX = '.{}'.format(slurpy.columnar.PARQUET_EXT)
 
 
 def main():
     parser = make_parser()
     args = parser.parse_args()
 
-    path = args.node_path
-    aggregator = slurpy.aggregate.NodeAggregator(r'r[1-4]n[0-9]{2}')
-    aggregate_csv_archive(path, aggregator)
+    paths = expand_paths(args.node_paths)
+
+    if args.history_dir:
+        store = ingest_history(paths, args.history_dir)
+        print('Node histories written to {}'.format(store.path))
+        return 0
+
+    aggregator = aggregate_archives(paths, args.jobs, args.rollups)
+
+    if not len(aggregator.to_frame()):
+        print('Nothing was aggregated. Exiting...')
+        return -1
+
+    aggregator.to_csv()
 
     return 0
 
 
+def expand_paths(patterns):
+    """Expand glob patterns, keeping patterns that match nothing"""
+    paths = []
+    for pattern in patterns:
+        paths += sorted(glob(pattern)) or [pattern]
+
+    return paths
+
+
+def aggregate_archives(paths, jobs=1, rollups=None):
+    """Aggregate archives across jobs processes.
+
+    Each archive is aggregated by its own NodeAggregator, and their
+    states are merged into one, at each rollup resolution too.
+
+    Returns merged NodeAggregator."""
+    aggregator = slurpy.aggregate.NodeAggregator(NODE_PATTERN, rollups)
+    aggregate_archive = partial(_aggregate_archive, rollups=rollups)
+
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            states = list(pool.map(aggregate_archive, paths))
+    else:
+        states = map(aggregate_archive, paths)
+
+    for archive_states in states:
+        if archive_states is None:
+            continue
+
+        for rollup, state in archive_states.items():
+            aggregator.merge(state, rollup)
+
+    return aggregator
+
+
+def ingest_history(paths, store_dir=slurpy.history.HISTORY_DIR):
+    """Add the node snapshots in archives to a node history store, one
+    archive after another.
+
+    Returns HistoryStore."""
+    store = slurpy.history.HistoryStore(store_dir)
+
+    for path in paths:
+        _read_archive(path, store)
+
+    store.close()
+    return store
+
+
+def _aggregate_archive(path, rollups=None):
+    aggregator = slurpy.aggregate.NodeAggregator(NODE_PATTERN, rollups)
+
+    result = _read_archive(path, aggregator)
+
+    if result is None:
+        return {rollup: aggregator.state(rollup)
+                for rollup in [None] + aggregator.rollups}
+
+
+def _read_archive(path, aggregator):
+    """Pass each node snapshot in an archive of any kind to aggregator"""
+    if path.endswith(PARQUET_SUFFIX):
+        return aggregate_parquet(path, aggregator)
+    elif slurpy.segment.is_segment(path):
+        return aggregate_segment(path, aggregator)
+    elif slurpy.archive.is_seekable(path):
+        return aggregate_seekable_archive(path, aggregator)
+    else:
+        return aggregate_csv_archive(path, aggregator)
+
+
 def aggregate_csv_archive(path, aggregator):
     print('Aggregating {}'.format(path))
     try:
         with tarfile.open(path, mode='r:bz2') as tar_file:
             for compressed_file in tar_file:
+                if not compressed_file.isfile():
+                    continue
+
                 file_name = extract_filename(compressed_file.name)
+
+                if compressed_file.name.endswith(PARQUET_SUFFIX):
+                    # Parquet reads from the end of a file, so read it in whole
+                    with tar_file.extractfile(compressed_file) as pq_file:
+                        aggregate_parquet(io.BytesIO(pq_file.read()),
+                                          aggregator)
+                    continue
+
                 with tar_file.extractfile(compressed_file) as csv_file:
                     try:
                         node_df = pd.read_csv(csv_file)
-                    except pd.io.common.EmptyDataError as e:
+                    except pd.errors.EmptyDataError as e:
                         print('File {}.csv is empty.'.format(file_name),
                               'Skipping...')
-                        pass
+                        continue
 
                     timestamp = datetime.datetime.strptime(file_name,
                                                            CSV_FORMAT)
 
                     aggregator.agg(timestamp, node_df)
 
-        aggregator.to_csv()
     except FileNotFoundError as e:
-        print('File {} not found. Exiting...'.format(path))
+        print('File {} not found. Skipping...'.format(path))
+        return -1
+
+
+def aggregate_parquet(source, aggregator):
+    """Aggregate the node snapshots in a Parquet file, as written by
+    slurpyd with out_format = parquet"""
+    if isinstance(source, str):
+        print('Aggregating {}'.format(source))
+
+    try:
+        for timestamp, node_df in slurpy.columnar.iter_snapshots(source):
+            aggregator.agg(timestamp, node_df)
+    except FileNotFoundError as e:
+        print('File {} not found. Skipping...'.format(source))
+        return -1
+
+
+def aggregate_segment(path, aggregator):
+    """Aggregate the node snapshots in an open or sealed segment, as
+    written by slurpyd with out_format = segment"""
+    print('Aggregating {}'.format(path))
+
+    try:
+        for timestamp, node_df in slurpy.segment.iter_snapshots(path):
+            aggregator.agg(timestamp, node_df)
+    except FileNotFoundError as e:
+        print('File {} not found. Skipping...'.format(path))
+        return -1
+
+
+def aggregate_seekable_archive(path, aggregator):
+    """Aggregate the node snapshots in an indexed, seekable archive, as
+    written by slurpyd with seekable = yes"""
+    print('Aggregating {}'.format(path))
+
+    try:
+        for timestamp, node_df in slurpy.archive.iter_snapshots(path):
+            aggregator.agg(timestamp, node_df)
+    except FileNotFoundError as e:
+        print('File {} not found. Skipping...'.format(path))
         return -1
 
 
@@ -54,9 +192,32 @@ def extract_filename(file_path):
 def make_parser():
     parser = argparse.ArgumentParser(description='%(prog)s, a slurpy tool.')
 
-    parser.add_argument('node_path',
+    parser.add_argument('node_paths',
+                        type=str,
+                        nargs='+',
+                        metavar='node_path',
+                        help='paths or glob patterns of files to aggregate')
+
+    parser.add_argument('-j', '--jobs',
+                        type=int,
+                        default=1,
+                        help='number of archives to aggregate at once '
+                             '(default: %(default)s)')
+
+    parser.add_argument('-r', '--rollups',
+                        type=_rollup_list,
+                        default=[],
+                        metavar='RESOLUTIONS',
+                        help='comma separated rollup resolutions to also '
+                             'write, e.g. 1m,5m,1h,1d')
+
+    parser.add_argument('--history',
                         type=str,
-                        help='path to file to aggregate')
+                        default=None,
+                        dest='history_dir',
+                        metavar='DIR',
+                        help='add the snapshots to the node history store '
+                             'in DIR instead of aggregating them')
 
     version_str = '%(prog)s v{}'.format(slurpy.__version__)
     parser.add_argument('--version',
@@ -66,5 +227,17 @@ def make_parser():
     return parser
 
 
+def _rollup_list(rollups):
+    rollups = [rollup.strip() for rollup in rollups.split(',') if rollup]
+
+    for rollup in rollups:
+        try:
+            slurpy.aggregate.parse_resolution(rollup)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+
+    return rollups
+
+
 if __name__ == '__main__':
     exit(main())
@@ -0,0 +1,347 @@
+"""Time indexed archives of node snapshot files
+
+Each archive has a sidecar index, <archive>.idx, listing the name,
+snapshot time, data offset and size of every member, and each directory
+of archives has a catalog of when every archive starts and ends. Readers
+use both to fetch only the snapshots in a time range.
+
+Archives are either tarballs compressed as a whole, e.g. .tar.bz2, or
+seekable: uncompressed .tar tarballs of individually compressed members.
+Members of a seekable archive are read straight from their offset.
+Members of other archives are found by decompressing the tarball up to
+them, but no further."""
+from .columnar import iter_snapshots as iter_parquet
+from .segment import CODECS
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import os.path
+import tarfile
+
+import pandas as pd
+
+INDEX_EXT = 'idx'
+SEEKABLE_EXT = 'tar'
+CATALOG_FILE = 'catalog.csv'
+
+# Index columns
+MEMBER = 'Member'
+TIMESTAMP = 'Timestamp'
+OFFSET = 'Offset'
+SIZE = 'Size'
+
+# Catalog columns
+ARCHIVE = 'Archive'
+START = 'Start'
+END = 'End'
+MEMBERS = 'Members'
+
+SNAPSHOT_TIME = 'SnapshotTime'
+
+BLOCK_SIZE = 4 * 2**20
+
+
+def write_archive(archive_path, paths, timestamps, ext, seekable=False,
+                  filter=None, jobs=1):
+    """Tar up snapshot files taken at timestamps, and write an index.
+
+    The tarball is compressed with ext (gz, bz2 or xz) as a whole, or if
+    seekable, each member is compressed on its own instead. filter is
+    applied to each member's TarInfo, as in TarFile.add.
+
+    With more than one job, compression is spread over that many
+    threads: a whole tarball is compressed as independent blocks, and
+    members of a seekable tarball one per thread.
+
+    Returns index DataFrame."""
+    members = sorted(zip(paths, timestamps), key=lambda pair: pair[1])
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        if seekable:
+            with tarfile.open(archive_path, mode='w') as tar_file:
+                entries = _add_compressed(tar_file, members, ext, filter,
+                                          pool)
+        elif jobs > 1:
+            with open(archive_path, mode='wb') as archive_file, \
+                    BlockCompressor(archive_file, ext, pool,
+                                    max_pending=2 * jobs,
+                                    block_size=BLOCK_SIZE) as block_file, \
+                    tarfile.open(fileobj=block_file, mode='w') as tar_file:
+                entries = _add_members(tar_file, members, filter)
+        else:
+            with tarfile.open(archive_path,
+                              mode='w:{}'.format(ext)) as tar_file:
+                entries = _add_members(tar_file, members, filter)
+
+    index = pd.DataFrame(entries, columns=[MEMBER, TIMESTAMP, OFFSET, SIZE])
+    index.to_csv(_index_path(archive_path), index=False)
+
+    return index
+
+
+class BlockCompressor(object):
+    """BlockCompressor object
+
+    Write-only binary file that compresses what is written to it in
+    independent blocks of block_size bytes on pool, writing them to
+    fileobj in order. At most max_pending blocks are compressed at once.
+
+    The output is a series of complete gzip, bzip2 or xz streams, which
+    the gzip, bz2 and lzma modules, and so tarfile, read back as one."""
+    def __init__(self, fileobj, ext, pool, max_pending=2,
+                 block_size=BLOCK_SIZE):
+        super(BlockCompressor, self).__init__()
+
+        self._fileobj = fileobj
+        self._compress = CODECS[ext].compress
+        self._pool = pool
+        self._max_pending = max_pending
+        self._block_size = block_size
+
+        self._buffer = bytearray()
+        self._pending = deque()
+        self._size = 0
+
+    def write(self, data):
+        self._buffer += data
+        self._size += len(data)
+
+        while len(self._buffer) >= self._block_size:
+            self._submit(self._buffer[:self._block_size])
+            del self._buffer[:self._block_size]
+
+        return len(data)
+
+    def tell(self):
+        """Return number of uncompressed bytes written"""
+        return self._size
+
+    def close(self):
+        if self._buffer:
+            self._submit(self._buffer)
+            self._buffer = bytearray()
+
+        while self._pending:
+            self._fileobj.write(self._pending.popleft().result())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _submit(self, block):
+        self._pending.append(self._pool.submit(self._compress, bytes(block)))
+
+        while len(self._pending) > self._max_pending:
+            self._fileobj.write(self._pending.popleft().result())
+
+
+def update_catalog(archive_path, index):
+    """Add an archive, described by its index, to its directory's
+    catalog"""
+    if not len(index):
+        return
+
+    catalog_path = os.path.join(os.path.dirname(archive_path),
+                                CATALOG_FILE)
+    entry = pd.DataFrame({ARCHIVE: [os.path.basename(archive_path)],
+                          START: [index[TIMESTAMP].min()],
+                          END: [index[TIMESTAMP].max()],
+                          MEMBERS: [len(index)]})
+
+    entry.to_csv(catalog_path, mode='a', index=False,
+                 header=not os.path.exists(catalog_path))
+
+
+def read_index(archive_path):
+    """Return index DataFrame of an archive"""
+    return pd.read_csv(_index_path(archive_path), parse_dates=[TIMESTAMP])
+
+
+def read_catalog(directory):
+    """Return catalog DataFrame of the archives in a directory.
+
+    Archives catalogued more than once keep their latest entry."""
+    catalog = pd.read_csv(os.path.join(directory, CATALOG_FILE),
+                          parse_dates=[START, END])
+
+    return (catalog.drop_duplicates(subset=ARCHIVE, keep='last')
+                   .sort_values(START, kind='mergesort')
+                   .reset_index(drop=True))
+
+
+def find_archives(directory, start_time=None, end_time=None):
+    """Return paths of the catalogued archives in a directory holding
+    snapshots from start_time up to end_time, in time order"""
+    catalog = read_catalog(directory)
+    covering = _covering(catalog[START], start_time, end_time)
+
+    return [os.path.join(directory, archive)
+            for archive in catalog[ARCHIVE][covering]]
+
+
+def iter_snapshots(source, start_time=None, end_time=None):
+    """Iterate over the node snapshots in an indexed archive, a list of
+    them, or a catalogued directory of them, in time order.
+
+    Only snapshots taken from start_time up to end_time are read, if
+    given.
+
+    Yields (timestamp, DataFrame) pairs."""
+    if isinstance(source, str):
+        archive_paths = (find_archives(source, start_time, end_time)
+                         if os.path.isdir(source) else [source])
+    else:
+        archive_paths = list(source)
+
+    for archive_path in archive_paths:
+        index = read_index(archive_path)
+        index = index[_covering(index[TIMESTAMP], start_time, end_time)]
+
+        for member, timestamp, raw in _read_members(archive_path, index):
+            for snapshot_time, snapshot in _parse_member(
+                    member, timestamp, raw, start_time, end_time):
+                yield snapshot_time, snapshot
+
+
+def read_snapshots(source, start_time=None, end_time=None):
+    """Read node snapshots into one DataFrame with a SnapshotTime column.
+
+    Takes the same arguments as iter_snapshots."""
+    snapshots = [snapshot.assign(**{SNAPSHOT_TIME: timestamp})
+                 for timestamp, snapshot
+                 in iter_snapshots(source, start_time, end_time)]
+
+    if not snapshots:
+        return pd.DataFrame(columns=[SNAPSHOT_TIME])
+
+    return pd.concat(snapshots, ignore_index=True)
+
+
+def is_seekable(archive_path):
+    return archive_path.endswith('.{}'.format(SEEKABLE_EXT))
+
+
+def _add_members(tar_file, members, filter):
+    entries = []
+    for path, timestamp in members:
+        tarinfo = tar_file.gettarinfo(path)
+        tarinfo = filter(tarinfo) if filter else tarinfo
+
+        with open(path, mode='rb') as member_file:
+            tar_file.addfile(tarinfo, member_file)
+
+        entries.append(_entry(tar_file, tarinfo, timestamp))
+
+    return entries
+
+
+def _add_compressed(tar_file, members, ext, filter, pool):
+    entries = []
+    compressed = pool.map(_compress_file, [path for path, _ in members],
+                          [ext] * len(members))
+
+    for (path, timestamp), data in zip(members, compressed):
+        tarinfo = tar_file.gettarinfo(path)
+        tarinfo.name = '{}.{}'.format(tarinfo.name, ext)
+        tarinfo.size = len(data)
+        tarinfo = filter(tarinfo) if filter else tarinfo
+
+        tar_file.addfile(tarinfo, io.BytesIO(data))
+        entries.append(_entry(tar_file, tarinfo, timestamp))
+
+    return entries
+
+
+def _compress_file(path, ext):
+    with open(path, mode='rb') as member_file:
+        return CODECS[ext].compress(member_file.read())
+
+
+def _entry(tar_file, tarinfo, timestamp):
+    """Index entry of the member just added to tar_file"""
+    # Data ends the member, padded to a whole tar block
+    data_offset = tar_file.offset - _padded(tarinfo.size)
+    return (tarinfo.name, timestamp, data_offset, tarinfo.size)
+
+
+def _read_members(archive_path, index):
+    """Yield (member, timestamp, raw bytes) of each indexed member"""
+    if not len(index):
+        return
+
+    if is_seekable(archive_path):
+        with open(archive_path, mode='rb') as archive_file:
+            for member, timestamp, offset, size in index.itertuples(
+                    index=False):
+                archive_file.seek(offset)
+                yield member, timestamp, archive_file.read(size)
+        return
+
+    wanted = dict(zip(index[MEMBER], index[TIMESTAMP]))
+    with tarfile.open(archive_path) as tar_file:
+        for tarinfo in tar_file:
+            if tarinfo.name not in wanted:
+                continue
+
+            with tar_file.extractfile(tarinfo) as member_file:
+                yield tarinfo.name, wanted.pop(tarinfo.name), \
+                    member_file.read()
+
+            # Stop decompressing once every wanted member is read
+            if not wanted:
+                break
+
+
+def _parse_member(member, timestamp, raw, start_time, end_time):
+    """Yield (timestamp, DataFrame) of each snapshot in a member"""
+    name, ext = os.path.splitext(member)
+    if ext.lstrip('.') in CODECS:
+        raw = CODECS[ext.lstrip('.')].decompress(raw)
+        name, ext = os.path.splitext(name)
+
+    if ext == '.parquet':
+        for snapshot in iter_parquet(io.BytesIO(raw), start_time=start_time,
+                                     end_time=end_time):
+            yield snapshot
+        return
+
+    if (start_time is not None and timestamp < start_time) or \
+            (end_time is not None and timestamp >= end_time):
+        return
+
+    reader = {'.csv': pd.read_csv,
+              '.pkl': pd.read_pickle,
+              '.json': pd.read_json}.get(ext, pd.read_csv)
+
+    try:
+        yield timestamp, reader(io.BytesIO(raw))
+    except pd.errors.EmptyDataError:
+        return
+
+
+def _covering(times, start_time=None, end_time=None):
+    """Select entries that may hold snapshots from start_time up to
+    end_time, given entry i holds snapshots from times[i] up to
+    times[i + 1], and the last entry holds all later snapshots"""
+    times = pd.Series(times).reset_index(drop=True)
+    next_times = times.shift(-1)
+
+    covering = pd.Series(True, index=times.index)
+    if end_time is not None:
+        covering &= times < end_time
+    if start_time is not None:
+        covering &= next_times.isnull() | (next_times > start_time)
+
+    return covering.values
+
+
+def _padded(size):
+    return -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+
+def _index_path(archive_path):
+    return '{}.{}'.format(archive_path, INDEX_EXT)
@@ -0,0 +1,486 @@
+"""Caches for SLURM query results"""
+from .slurm import query_nodes, query_jobs, query_jobs_async, \
+                   _find_column, _listify, _job_request, _job_key_columns, \
+                   JOB_ID_RAW, DATE_FORMAT
+
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from hashlib import sha1
+import os
+import os.path
+import threading
+from time import monotonic
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = '~/.cache/slurpy/jobs'
+BUCKET_FORMAT = '%Y%m%d_%H%M%S'
+BUCKET_EXT = 'pkl'
+
+RESOLUTION = timedelta(hours=1)
+SETTLE_TIME = timedelta(minutes=5)
+ALIGN_EPOCH = datetime(1970, 1, 1)
+
+TTL = 5.0
+MAX_ENTRIES = 128
+
+# How far each incremental sacct window reaches back before the last one
+# ended, for accounting that reaches slurmdbd late
+OVERLAP = timedelta(minutes=1)
+FIRST_PERIOD = timedelta(minutes=5)
+
+# Job IDs refreshed per sacct -j call
+JOB_IDS_PER_QUERY = 1000
+
+# query_jobs arguments that change how, not what, sacct is queried
+POOL_KWARGS = ('slices', 'max_workers')
+
+STATE = 'State'
+SUBMIT = 'Submit'
+ELIGIBLE = 'Eligible'
+START = 'Start'
+END = 'End'
+
+# Jobs in these states will never change again
+TERMINAL_STATES = ['BOOT_FAIL',
+                   'CANCELLED',
+                   'COMPLETED',
+                   'DEADLINE',
+                   'FAILED',
+                   'NODE_FAIL',
+                   'OUT_OF_MEMORY',
+                   'PREEMPTED',
+                   'TIMEOUT']
+
+# Job properties that change while a job runs, without the job changing
+TICKING_PROPERTIES = {'avecpu',
+                      'avediskread',
+                      'avediskwrite',
+                      'avepages',
+                      'averss',
+                      'avevmsize',
+                      'consumedenergy',
+                      'consumedenergyraw',
+                      'cputime',
+                      'cputimeraw',
+                      'elapsed',
+                      'elapsedraw',
+                      'maxdiskread',
+                      'maxdiskwrite',
+                      'maxpages',
+                      'maxrss',
+                      'maxvmsize',
+                      'mincpu',
+                      'systemcpu',
+                      'totalcpu',
+                      'usercpu'}
+
+
+class QueryCache(object):
+    """QueryCache object
+
+    In-process memo of query_nodes and query_jobs results. Results are
+    kept for ttl seconds, at most max_entries at a time, evicting the
+    least recently used first. Concurrent callers asking for the same
+    query while it runs all share the one subprocess call."""
+    def __init__(self, ttl=TTL, max_entries=MAX_ENTRIES, clock=monotonic):
+        super(QueryCache, self).__init__()
+
+        self.hits = 0
+        self.misses = 0
+
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._clock = clock
+
+        self._entries = OrderedDict()
+        self._running = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def query_nodes(self, node_features, **kwargs):
+        """Cached slurpy.query_nodes"""
+        return self._query(query_nodes, node_features, kwargs)
+
+    def query_jobs(self, job_properties, **kwargs):
+        """Cached slurpy.query_jobs"""
+        return self._query(query_jobs, job_properties, kwargs)
+
+    def invalidate(self):
+        """Drop every cached result"""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _query(self, query, features, kwargs):
+        key = (query.__name__, _listify(features)[0],
+               repr(sorted(kwargs.items())))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1].copy()
+
+            future = self._running.get(key)
+            is_runner = future is None
+            if is_runner:
+                future = self._running[key] = Future()
+                generation = self._generation
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if is_runner:
+            self._run(future, key, generation, query, features, kwargs)
+
+        # Callers get a copy, as they often modify frames in place
+        return future.result().copy()
+
+    def _run(self, future, key, generation, query, features, kwargs):
+        try:
+            result = query(features, **kwargs)
+        except BaseException as e:
+            with self._lock:
+                del self._running[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._running[key]
+
+            # Skip storing results that straddled an invalidate()
+            if generation == self._generation:
+                self._entries[key] = (self._clock() + self._ttl, result)
+                self._entries.move_to_end(key)
+
+                while len(self._entries) > self._max_entries:
+                    self._entries.popitem(last=False)
+
+        future.set_result(result)
+
+
+class JobCache(object):
+    """JobCache object
+
+    On-disk cache of sacct output, stored as one pickled DataFrame per
+    bucket of resolution length. Only buckets that ended at least
+    settle_time ago are cached. Jobs that were still active when their
+    bucket was cached are refreshed by job ID on every query."""
+    def __init__(self, cache_dir=CACHE_DIR, resolution=RESOLUTION,
+                 settle_time=SETTLE_TIME, now_eval=datetime.now):
+        super(JobCache, self).__init__()
+
+        self._cache_dir = os.path.expandvars(os.path.expanduser(cache_dir))
+        self._resolution = resolution
+        self._settle_time = settle_time
+        self._now_eval = now_eval
+
+    def query_jobs(self, job_properties, partition=None, state=None,
+                   end_time=None, period=None, **kwargs):
+        """Drop-in replacement for slurpy.query_jobs.
+
+        Queries filtering on state, or without a full time window, are
+        passed straight through to sacct.
+
+        Returns DataFrame of job properties, ordered by start time."""
+        if state or not (end_time and period):
+            return query_jobs(job_properties, partition=partition,
+                              state=state, end_time=end_time,
+                              period=period, **kwargs)
+
+        _, job_header = _job_request(job_properties, partition=partition,
+                                     **kwargs)
+        cache_header = list(job_header)
+        for col in [JOB_ID_RAW, STATE, SUBMIT, START, END]:
+            if not _find_column(cache_header, col):
+                cache_header.append(col)
+
+        start_time = end_time - period
+        sealed_time = min(end_time, self._floor(self._now_eval() -
+                                                self._settle_time))
+
+        frames = []
+        if sealed_time < end_time:
+            tail_start = max(start_time, sealed_time)
+            frames.append(query_jobs(cache_header, partition=partition,
+                                     end_time=end_time,
+                                     period=end_time - tail_start,
+                                     **kwargs))
+
+        if start_time < sealed_time:
+            frames += self._get_buckets(cache_header, partition,
+                                        self._floor(start_time),
+                                        sealed_time, **kwargs)
+
+        jobs = pd.concat(frames, ignore_index=True)
+        jobs = jobs.drop_duplicates(subset=_job_key_columns(cache_header))
+        jobs = _jobs_between(jobs, cache_header, start_time, end_time)
+        jobs = jobs.sort_values(_find_column(cache_header, START),
+                                kind='mergesort')
+
+        return jobs[job_header].reset_index(drop=True)
+
+    def _get_buckets(self, header, partition, start_time, end_time,
+                     **kwargs):
+        key_dir = self._key_dir(header, partition, **kwargs)
+        os.makedirs(key_dir, exist_ok=True)
+
+        bucket_times = []
+        bucket_time = start_time
+        while bucket_time < end_time:
+            bucket_times.append(bucket_time)
+            bucket_time += self._resolution
+
+        buckets = {}
+        missing = []
+        for bucket_time in bucket_times:
+            bucket_path = self._bucket_path(key_dir, bucket_time)
+            if os.path.exists(bucket_path):
+                buckets[bucket_time] = pd.read_pickle(bucket_path)
+            else:
+                missing.append(bucket_time)
+
+        for run in _contiguous(missing, self._resolution):
+            run_end = run[-1] + self._resolution
+            jobs = query_jobs(header, partition=partition,
+                              end_time=run_end,
+                              period=run_end - run[0],
+                              **kwargs)
+
+            for bucket_time in run:
+                buckets[bucket_time] = _jobs_between(
+                    jobs, header, bucket_time,
+                    bucket_time + self._resolution)
+                self._store(key_dir, bucket_time, buckets[bucket_time])
+
+        self._refresh_active(buckets, key_dir, header, partition, **kwargs)
+
+        return [buckets[bucket_time] for bucket_time in bucket_times]
+
+    def _refresh_active(self, buckets, key_dir, header, partition,
+                        **kwargs):
+        """Re-query jobs that were not finished when they were cached"""
+        key_cols = _job_key_columns(header)
+        state_col = _find_column(header, STATE)
+
+        stale_keys = {}
+        job_ids = set()
+        for bucket_time, jobs in buckets.items():
+            active = jobs[~_is_terminal(jobs[state_col])]
+            if len(active):
+                stale_keys[bucket_time] = set(_base_keys(active, key_cols))
+                job_ids.update(_base_ids(active[key_cols[0]]))
+
+        if not stale_keys:
+            return
+
+        kwargs = {key: value for key, value in kwargs.items()
+                  if key not in POOL_KWARGS}
+        job_ids = sorted(job_ids)
+
+        # Each sacct argument must stay well under MAX_ARG_STRLEN
+        fresh_jobs = pd.concat(
+            [query_jobs(header, partition=partition,
+                        job_ids=job_ids[i:i + JOB_IDS_PER_QUERY], **kwargs)
+             for i in range(0, len(job_ids), JOB_IDS_PER_QUERY)],
+            ignore_index=True)
+        fresh_keys = _base_keys(fresh_jobs, key_cols)
+
+        # Jobs that have since started can leave buckets they were
+        # pending in
+        for bucket_time, keys in stale_keys.items():
+            jobs = buckets[bucket_time]
+            buckets[bucket_time] = pd.concat(
+                [jobs[~_base_keys(jobs, key_cols).isin(keys)],
+                 _jobs_between(fresh_jobs[fresh_keys.isin(keys)], header,
+                               bucket_time,
+                               bucket_time + self._resolution)],
+                ignore_index=True)
+            self._store(key_dir, bucket_time, buckets[bucket_time])
+
+    def _floor(self, time):
+        return time - (time - ALIGN_EPOCH) % self._resolution
+
+    def _key_dir(self, header, partition, **kwargs):
+        if partition:
+            partition, _ = _listify(partition)
+
+        key = repr((sorted(header), partition,
+                    sorted((key, value) for key, value in kwargs.items()
+                           if key not in POOL_KWARGS and
+                           value is not None)))
+        return os.path.join(self._cache_dir,
+                            sha1(key.encode()).hexdigest())
+
+    def _bucket_path(self, key_dir, bucket_time):
+        return os.path.join(key_dir, '{}.{}'.format(
+            bucket_time.strftime(BUCKET_FORMAT), BUCKET_EXT))
+
+    def _store(self, key_dir, bucket_time, jobs):
+        bucket_path = self._bucket_path(key_dir, bucket_time)
+        tmp_path = '{}.tmp{}'.format(bucket_path, os.getpid())
+
+        jobs.to_pickle(tmp_path)
+        os.replace(tmp_path, bucket_path)
+
+
+class JobTracker(object):
+    """JobTracker object
+
+    Polls sacct for the jobs that changed since the last poll. Each poll
+    only asks for jobs active from the high-water mark, the end of the
+    last committed poll less overlap, up to now, and returns those that
+    are new or whose properties changed. Properties that tick while a
+    job runs, like ElapsedRaw, are not counted as changes.
+
+    A poll is only remembered once commit() is called, e.g. after its
+    jobs are written, so a failed write is retried by the next poll. The
+    high-water mark is kept in state_path, if given, across restarts;
+    the first poll after a restart returns every job it sees."""
+    def __init__(self, job_properties, state_path=None,
+                 first_period=FIRST_PERIOD, overlap=OVERLAP,
+                 now_eval=datetime.now, **kwargs):
+        super(JobTracker, self).__init__()
+
+        _, self._header = _job_request(job_properties, **kwargs)
+        self._id_col = _find_column(self._header, JOB_ID_RAW)
+        self._query_header = (self._header if self._id_col
+                              else self._header + [JOB_ID_RAW])
+        self._key_cols = _job_key_columns(self._query_header)
+        self._compare_cols = [col for col in self._header
+                              if col.lower() not in TICKING_PROPERTIES]
+
+        self._state_path = state_path
+        self._first_period = first_period
+        self._overlap = overlap
+        self._now_eval = now_eval
+        self._kwargs = kwargs
+
+        self._mark = self._load_mark()
+        self._seen = {}
+        self._pending = None
+
+    @property
+    def high_water_mark(self):
+        """End time of the last committed poll, or None"""
+        return self._mark
+
+    def poll(self):
+        """Query jobs active since the high-water mark.
+
+        Returns DataFrame of the jobs that changed since the last
+        committed poll."""
+        end_time, period = self._window()
+        jobs = query_jobs(self._query_header, end_time=end_time,
+                          period=period, **self._kwargs)
+
+        return self._changed(jobs, end_time)
+
+    async def poll_async(self, executor=None):
+        """poll, querying sacct with query_jobs_async"""
+        end_time, period = self._window()
+        jobs = await query_jobs_async(self._query_header, executor,
+                                      end_time=end_time, period=period,
+                                      **self._kwargs)
+
+        return self._changed(jobs, end_time)
+
+    def commit(self):
+        """Remember the last poll, and persist its end time"""
+        if self._pending is None:
+            return
+
+        self._mark, self._seen = self._pending
+        self._pending = None
+
+        if self._state_path:
+            tmp_path = '{}.tmp{}'.format(self._state_path, os.getpid())
+            with open(tmp_path, mode='w') as state_file:
+                state_file.write(self._mark.strftime(DATE_FORMAT) + '\n')
+            os.replace(tmp_path, self._state_path)
+
+    def _window(self):
+        """Return end time and period of the next poll"""
+        end_time = self._now_eval().replace(microsecond=0)
+        start_time = (end_time - self._first_period if self._mark is None
+                      else min(self._mark - self._overlap, end_time))
+
+        return end_time, end_time - start_time
+
+    def _changed(self, jobs, end_time):
+        jobs = jobs.drop_duplicates(subset=self._key_cols, keep='last')
+
+        hashes = pd.util.hash_pandas_object(jobs[self._compare_cols],
+                                            index=False)
+        job_keys = jobs[self._key_cols].itertuples(index=False, name=None)
+        seen = dict(zip(job_keys, hashes))
+        changed = np.array([self._seen.get(job_id) != job_hash
+                            for job_id, job_hash in seen.items()],
+                           dtype=bool)
+
+        self._pending = (end_time, seen)
+
+        return jobs.loc[changed, self._header].reset_index(drop=True)
+
+    def _load_mark(self):
+        try:
+            with open(self._state_path) as state_file:
+                return datetime.strptime(state_file.read().strip(),
+                                         DATE_FORMAT)
+        except (TypeError, FileNotFoundError, ValueError):
+            return None
+
+
+def _jobs_between(jobs, header, start_time, end_time):
+    """Select jobs that were eligible or running between two times, as
+    sacct -S -E does: jobs starting at end_time are, jobs ending at
+    start_time are not. Pending jobs have no start yet, so count from
+    when they became eligible, or were submitted"""
+    start = jobs[_find_column(header, START)]
+    end = jobs[_find_column(header, END)]
+
+    for col in [ELIGIBLE, SUBMIT]:
+        if _find_column(header, col):
+            start = start.fillna(jobs[_find_column(header, col)])
+
+    return jobs[(start.isnull() | (start <= end_time)) &
+                (end.isnull() | (end > start_time))]
+
+
+def _is_terminal(states):
+    # States can carry a suffix, e.g. 'CANCELLED by 1234'
+    return states.str.split(' ').str[0].isin(TERMINAL_STATES)
+
+
+def _base_ids(job_ids):
+    # Strip step suffixes, e.g. '1234.batch' -> '1234'
+    return job_ids.str.split('.').str[0]
+
+
+def _base_keys(jobs, key_cols):
+    # Base IDs, qualified by cluster if key_cols has one
+    keys = _base_ids(jobs[key_cols[0]])
+    for col in key_cols[1:]:
+        keys = jobs[col].astype(str) + '/' + keys
+
+    return keys
+
+
+def _contiguous(times, step):
+    """Split a sorted list of times into runs spaced by step"""
+    run = []
+    for time in times:
+        if run and time - run[-1] != step:
+            yield run
+            run = []
+        run.append(time)
+
+    if run:
+        yield run
@@ -1,12 +1,14 @@
 import slurpy
 
+from argparse import ArgumentParser
 import datetime
-import sys
 
 NOW = datetime.datetime.now()
 
 
-def query_jobs(**td_kwargs):
+def query_jobs(partition=None, clusters=None, **td_kwargs):
+    """Summarise jobs of the last td_kwargs, an hour by default, by
+    state, over every partition of the local cluster by default"""
     properties = ['JobID',
                   'State',
                   'ReqCPUS',
@@ -21,37 +23,31 @@ def query_jobs(**td_kwargs):
                   'MaxRSS',
                   'ReqMem']
 
-    # TODO: fix this horrible mess
     if not td_kwargs:
-        if len(sys.argv) > 1:
-            amount = int(sys.argv[1])
-        else:
-            amount = 1
+        td_kwargs = {'hours': 1}
 
-        if len(sys.argv) > 2:
-            unit = str(sys.argv[2])
-        else:
-            unit = 'hours'
-
-        td_kwargs = {unit: amount}
-    else:
-        unit, amount = list(td_kwargs.items())[0]
+    unit, amount = list(td_kwargs.items())[0]
 
     jobs = slurpy.get_job_df(properties,
-                             partition='cpu',
+                             partition=partition,
                              end_time=NOW,
-                             period=datetime.timedelta(**td_kwargs))
+                             period=datetime.timedelta(**td_kwargs),
+                             clusters=clusters,
+                             cache=slurpy.JobCache())
     jobs['Jobs'] = 1
 
     print('In last {} {}:'.format(amount, unit))
     print('Most recent start time: {}'.format(jobs['Start'].max()))
     print('Most recent submit time: {}'.format(jobs['Submit'].max()))
-    print(jobs.groupby('State').sum())
+    print(jobs.groupby(_group_columns(jobs, 'State'))
+              .sum(numeric_only=True))
 
     return 0
 
 
-def query_nodes():
+def query_nodes(partition=None, clusters=None):
+    """Summarise nodes by state, over every partition of the local
+    cluster by default"""
     features = ['NodeHost',
                 'StateCompact',
                 'CPUsState',
@@ -59,9 +55,48 @@ def query_nodes():
                 'AllocMem',
                 'FreeMem']
 
-    nodes = slurpy.get_node_df(features, partition='cpu')
+    nodes = slurpy.get_node_df(features, partition=partition,
+                               clusters=clusters)
     nodes['Nodes'] = 1
     del nodes['Memory']
-    print(nodes.groupby('StateCompact').sum())
+    print(nodes.groupby(_group_columns(nodes, 'StateCompact'))
+               .sum(numeric_only=True))
 
     return 0
+
+
+def query_jobs_main(argv=None):
+    """Usage: query-jobs [amount] [unit] [partitions] [clusters]"""
+    parser = ArgumentParser(description="Summarise recent jobs by state")
+    parser.add_argument('amount', nargs='?', type=int, default=1)
+    parser.add_argument('unit', nargs='?', default='hours')
+    _add_location_args(parser)
+
+    args = parser.parse_args(argv)
+
+    return query_jobs(partition=args.partitions, clusters=args.clusters,
+                      **{args.unit: args.amount})
+
+
+def query_nodes_main(argv=None):
+    """Usage: query-nodes [partitions] [clusters]"""
+    parser = ArgumentParser(description="Summarise nodes by state")
+    _add_location_args(parser)
+
+    args = parser.parse_args(argv)
+
+    return query_nodes(partition=args.partitions, clusters=args.clusters)
+
+
+def _add_location_args(parser):
+    parser.add_argument('partitions', nargs='?',
+                        help="comma separated partitions, or every "
+                             "partition")
+    parser.add_argument('clusters', nargs='?',
+                        help="comma separated clusters, or the local one")
+
+
+def _group_columns(df, state_col):
+    """Group by cluster and partition too, where several were queried"""
+    return [col for col in ['Cluster', 'Partition', 'PartitionName']
+            if col in df] + [state_col]
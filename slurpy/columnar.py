@@ -0,0 +1,223 @@
+"""Columnar storage of node snapshots
+
+Snapshots are appended to rolling Parquet files, tagged with a
+SnapshotTime column. String features like NodeHost and StateCompact are
+dictionary encoded, CPUsState is split into int32 CPU columns, and
+integer features are stored as int32.
+
+Needs pyarrow, e.g. pip install slurpy[parquet]."""
+from .slurm import split_aiot, _convert_column, \
+                   NODE_FEATURE_TYPES, CPU_COLUMNS, INT, FLOAT, DATETIME
+
+import os
+import threading
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+PARQUET_EXT = 'parquet'
+COMPRESSION = 'zstd'
+
+SNAPSHOT_TIME = 'SnapshotTime'
+CPUS_STATE = 'CPUsState'
+
+ROW_GROUP_ROWS = 50000
+
+# Suffix given to existing files that cannot be appended to
+ORPHAN_SUFFIX = 'orphan'
+
+
+class SnapshotAppender(object):
+    """SnapshotAppender object
+
+    Appends node snapshots to a rolling Parquet file, moving on to a new
+    file whenever a snapshot is given a new path. Snapshots are buffered
+    and written out as one row group per row_group_rows rows.
+
+    A Parquet file can only be read once it is closed, which happens when
+    snapshots roll over to a new path, or on close(). Appending to an
+    existing, closed file copies its row groups into the new file first.
+    Existing files that cannot be read, or hold different columns, are
+    moved aside with an .orphan suffix."""
+    def __init__(self, row_group_rows=ROW_GROUP_ROWS,
+                 compression=COMPRESSION):
+        super(SnapshotAppender, self).__init__()
+        _require_pyarrow()
+
+        self._row_group_rows = row_group_rows
+        self._compression = compression
+
+        self._path = None
+        self._writer = None
+        self._pending = []
+        self._pending_rows = 0
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        """Path of the file currently being appended to"""
+        return self._path
+
+    def append(self, path, node_df, timestamp):
+        """Append a node snapshot taken at timestamp to path"""
+        snapshot = node_df.copy()
+        snapshot.insert(0, SNAPSHOT_TIME, pd.Timestamp(timestamp))
+
+        with self._lock:
+            if path != self._path:
+                self._close()
+                self._path = path
+
+            self._pending.append(snapshot)
+            self._pending_rows += len(snapshot)
+
+            if self._pending_rows >= self._row_group_rows:
+                self._flush()
+
+    def flush(self):
+        """Write buffered snapshots out as a row group"""
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """Write out buffered snapshots and close the current file"""
+        with self._lock:
+            self._close()
+
+    def _flush(self):
+        if not self._pending:
+            return
+
+        table = to_table(pd.concat(self._pending, ignore_index=True))
+
+        if self._writer is None:
+            self._writer = self._open(self._path, table.schema)
+
+        self._writer.write_table(table)
+
+        self._pending = []
+        self._pending_rows = 0
+
+    def _close(self):
+        self._flush()
+
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+        self._path = None
+
+    def _open(self, path, schema):
+        if not os.path.exists(path):
+            return pq.ParquetWriter(path, schema,
+                                    compression=self._compression)
+
+        previous_path = '{}.{}'.format(path, ORPHAN_SUFFIX)
+        os.replace(path, previous_path)
+
+        writer = pq.ParquetWriter(path, schema,
+                                  compression=self._compression)
+        try:
+            with pq.ParquetFile(previous_path) as previous:
+                if not previous.schema_arrow.equals(schema):
+                    raise ValueError('{} holds different columns'
+                                     .format(path))
+
+                for i in range(previous.num_row_groups):
+                    writer.write_table(previous.read_row_group(i))
+        except (pa.ArrowException, ValueError):
+            # Start afresh, leaving the old file where it can be salvaged
+            writer.close()
+            return pq.ParquetWriter(path, schema,
+                                    compression=self._compression)
+
+        os.remove(previous_path)
+        return writer
+
+
+def to_table(node_df):
+    """Encode node snapshots as a compact pyarrow Table.
+
+    CPUsState is replaced by int32 CPUAlloc, CPUIdle, CPUOther and
+    CPUTotal columns. Other columns are typed by their node feature,
+    where strings are dictionary encoded and integers are int32.
+
+    Raises pyarrow.ArrowInvalid if an integer does not fit in int32."""
+    _require_pyarrow()
+
+    columns = {}
+    for name, column in node_df.items():
+        if name == CPUS_STATE:
+            cpu_aiot = split_aiot(column)
+            for i, cpu_col in enumerate(CPU_COLUMNS):
+                columns[cpu_col] = pa.array(cpu_aiot[:, i])
+        else:
+            columns[name] = _encode_column(name, column)
+
+    return pa.table(columns)
+
+
+def read_snapshots(source, columns=None, start_time=None, end_time=None):
+    """Read node snapshots from a Parquet file, or file-like object.
+
+    Only snapshots taken from start_time up to end_time are read, if
+    given. Row groups outside that range are skipped.
+
+    Returns DataFrame with a SnapshotTime column and categorical string
+    columns."""
+    _require_pyarrow()
+
+    if columns is not None and SNAPSHOT_TIME not in columns:
+        columns = [SNAPSHOT_TIME] + list(columns)
+
+    filters = []
+    if start_time is not None:
+        filters.append((SNAPSHOT_TIME, '>=', pd.Timestamp(start_time)))
+    if end_time is not None:
+        filters.append((SNAPSHOT_TIME, '<', pd.Timestamp(end_time)))
+
+    table = pq.read_table(source, columns=columns, filters=filters or None)
+
+    return table.to_pandas()
+
+
+def iter_snapshots(source, **kwargs):
+    """Iterate over the node snapshots in a Parquet file, in time order.
+
+    Takes the same arguments as read_snapshots.
+
+    Yields (timestamp, DataFrame) pairs."""
+    snapshots = read_snapshots(source, **kwargs)
+
+    for timestamp, snapshot in snapshots.groupby(SNAPSHOT_TIME, sort=True):
+        yield (timestamp,
+               snapshot.drop(columns=SNAPSHOT_TIME).reset_index(drop=True))
+
+
+def _encode_column(name, column):
+    kind = DATETIME if name == SNAPSHOT_TIME else \
+        NODE_FEATURE_TYPES.get(name.lower())
+
+    if kind == INT:
+        return pa.array(_convert_column(column, INT), type=pa.int32())
+
+    if kind == FLOAT:
+        return pa.array(_convert_column(column, FLOAT), type=pa.float64())
+
+    if kind == DATETIME:
+        return pa.array(_convert_column(column, DATETIME),
+                        type=pa.timestamp('ns'))
+
+    return pa.array(column, type=pa.string(),
+                    from_pandas=True).dictionary_encode()
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError('Columnar snapshot storage needs pyarrow. '
+                          'Install it with pip install slurpy[parquet]')
@@ -0,0 +1,190 @@
+"""Delta encoding of node snapshots
+
+Consecutive node snapshots mostly repeat each other: NodeHost and Memory
+never change, and StateCompact and CPUsState seldom do. A DeltaEncoder
+turns a series of snapshots into keyframes, full snapshots, and deltas,
+which only hold the rows and columns that changed since the snapshot
+before, plus a leading _Row column of the changed row numbers.
+
+sinfo sorts nodes by state, so one node changing state moves others.
+Rows are matched by node key (NodeHost, NodeList or NodeAddr) where
+there is one, and rows that moved are listed too, with a _From column
+of the row number they moved from.
+
+Deltas are only taken between snapshots with the same columns, dtypes
+and nodes; anything else starts a new keyframe. A DeltaDecoder rebuilds
+snapshots from the records in order, starting at a keyframe."""
+from .slurm import NODE_NAME_FEATURES
+
+import io
+
+import numpy as np
+import pandas as pd
+
+ROW = '_Row'
+FROM = '_From'
+
+# One keyframe per hour of 5 second snapshots
+KEYFRAME_INTERVAL = 720
+
+
+class DeltaEncoder(object):
+    """DeltaEncoder object
+
+    Encodes each snapshot against the one before, writing a keyframe at
+    least every keyframe_interval snapshots. The snapshot passed to
+    encode only becomes the one before once commit() is called, e.g.
+    after its record is safely stored."""
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL):
+        super(DeltaEncoder, self).__init__()
+
+        self._keyframe_interval = keyframe_interval
+
+        self._previous = None
+        self._since_keyframe = 0
+        self._pending = None
+
+    def encode(self, node_df):
+        """Return the keyframe or delta DataFrame to store for node_df"""
+        previous = self._previous
+
+        if previous is None or not _comparable(previous, node_df) or \
+                self._since_keyframe + 1 >= self._keyframe_interval:
+            self._pending = (node_df, 0)
+            return node_df
+
+        current = node_df.reset_index(drop=True)
+        previous = previous.reset_index(drop=True)
+
+        sources = _match_rows(previous, current)
+        if sources is None:
+            self._pending = (node_df, 0)
+            return node_df
+
+        matched = previous.iloc[sources].reset_index(drop=True)
+        changed = ((current != matched) &
+                   ~(current.isnull() & matched.isnull())).values
+        moved = sources != np.arange(len(current))
+
+        rows = changed.any(axis=1) | moved
+        cols = changed.any(axis=0)
+
+        delta = current.loc[rows, current.columns[cols]]
+        delta.insert(0, ROW, np.flatnonzero(rows))
+        if moved.any():
+            delta.insert(1, FROM, sources[rows])
+
+        self._pending = (node_df, self._since_keyframe + 1)
+        return delta
+
+    def commit(self):
+        """Encode the next snapshot against the last one encoded"""
+        if self._pending is not None:
+            self._previous, self._since_keyframe = self._pending
+            self._pending = None
+
+    def reset(self):
+        """Make the next snapshot a keyframe"""
+        self._previous = None
+        self._since_keyframe = 0
+        self._pending = None
+
+
+class DeltaDecoder(object):
+    """DeltaDecoder object
+
+    Rebuilds snapshots from CSV encoded keyframe and delta records, which
+    must be decoded in the order they were encoded. Snapshots are parsed
+    as they would be from a CSV of the full snapshot, but only the
+    columns a delta changes are parsed again."""
+    def __init__(self):
+        super(DeltaDecoder, self).__init__()
+
+        self._keyframe = None
+        self._text = None
+        self._snapshot = None
+
+    def decode(self, record):
+        """Return the snapshot DataFrame of a record.
+
+        Raises ValueError if a delta record comes before any keyframe."""
+        if not is_delta(record):
+            # Only parsed as text if a delta follows
+            self._keyframe = record
+            self._text = None
+            self._snapshot = pd.read_csv(io.BytesIO(record))
+            return self._snapshot.copy()
+
+        if self._snapshot is None:
+            raise ValueError('Delta record without a keyframe')
+
+        # Nothing changed
+        if not record.rstrip().count(b'\n'):
+            return self._snapshot.copy()
+
+        if self._text is None:
+            self._text = _read_text(self._keyframe)
+
+        delta = _read_text(record)
+        rows = delta.pop(ROW).astype(np.int64).values
+
+        if FROM in delta:
+            sources = np.arange(len(self._text))
+            sources[rows] = delta.pop(FROM).astype(np.int64).values
+            self._text = self._text.iloc[sources].reset_index(drop=True)
+            self._snapshot = self._snapshot.iloc[sources] \
+                                 .reset_index(drop=True)
+
+        if len(rows) and len(delta.columns):
+            cols = [self._text.columns.get_loc(col) for col in delta.columns]
+            self._text.iloc[rows, cols] = delta.values
+
+            # Columns are typed on their own, as when reading a whole CSV
+            changed = pd.read_csv(io.StringIO(
+                self._text[delta.columns].to_csv(index=False)),
+                skip_blank_lines=False)
+            self._snapshot = self._snapshot.assign(
+                **{col: changed[col] for col in delta.columns})
+
+        return self._snapshot.copy()
+
+
+def is_delta(record):
+    """Return whether a CSV encoded record holds a delta"""
+    header = record.split(b'\n', 1)[0]
+    return header.split(b',', 1)[0].strip(b'"\r') == ROW.encode()
+
+
+def _comparable(previous, node_df):
+    return (len(previous) == len(node_df) and
+            list(previous.columns) == list(node_df.columns) and
+            list(previous.dtypes) == list(node_df.dtypes))
+
+
+def _match_rows(previous, current):
+    """Return the row number in previous of each row of current, matched
+    by node key, or by position if there is none. Returns None if the
+    snapshots hold different nodes."""
+    positions = np.arange(len(current))
+    key = next((col for col in current.columns
+                if col.lower() in NODE_NAME_FEATURES), None)
+
+    if key is None:
+        return positions
+
+    previous_keys = pd.Index(previous[key])
+    if previous_keys.is_unique and current[key].is_unique:
+        sources = previous_keys.get_indexer(current[key])
+        return None if (sources < 0).any() else sources
+
+    # Nodes in several partitions repeat, so can only keep their place
+    if (previous_keys.values == current[key].values).all():
+        return positions
+
+    return None
+
+
+def _read_text(record):
+    """Parse a record keeping every value as the exact text written"""
+    return pd.read_csv(io.BytesIO(record), dtype=object,
+                       keep_default_na=False)
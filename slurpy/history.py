@@ -0,0 +1,363 @@
+"""Per-node time series of node snapshots
+
+A history store keeps the CPU, memory and state history of each node, so
+the history of a few nodes can be read without scanning every snapshot.
+
+Nodes are given ids by a dictionary, nodes.csv, and node states codes by
+another, states.csv. Each node's records for a day are appended to their
+own file, <YYYYMMDD>/<node id>.bin, of fixed size (timestamp, int32 ...)
+records, so a week of one node is seven small reads.
+
+Several processes can append to one store, e.g. slurpyd and
+analyse-slurpy --history: each flush holds a lock on the store, and
+only then settles the ids of names it has not seen saved before."""
+from .slurm import split_aiot, CPU_COLUMNS
+
+from contextlib import contextmanager
+import fcntl
+import os
+import os.path
+import threading
+
+import numpy as np
+import pandas as pd
+
+HISTORY_DIR = '~/.local/share/slurpy/history'
+NODES_FILE = 'nodes.csv'
+STATES_FILE = 'states.csv'
+LOCK_FILE = '.lock'
+CHUNK_FORMAT = '%Y%m%d'
+CHUNK_EXT = 'bin'
+
+NODE_HOST = 'NodeHost'
+STATE = 'StateCompact'
+SNAPSHOT_TIME = 'SnapshotTime'
+
+MEMORY_COLUMNS = ['Memory', 'AllocMem', 'FreeMem']
+FIELDS = CPU_COLUMNS + MEMORY_COLUMNS + [STATE]
+
+RECORD_DTYPE = np.dtype([('time', '<i8')] +
+                        [(field, '<i4') for field in FIELDS])
+
+# Stored in place of missing values, which read back as <NA>
+MISSING = -1
+
+# Snapshots buffered before appending them to the store
+FLUSH_SNAPSHOTS = 60
+
+
+class HistoryStore(object):
+    """HistoryStore object
+
+    Appends node snapshots to a history store in store_dir, buffering
+    flush_snapshots of them at a time. Snapshots need a NodeHost column,
+    and any of CPUsState (or CPUAlloc, CPUIdle, CPUOther and CPUTotal),
+    Memory, AllocMem, FreeMem and StateCompact; others are ignored.
+
+    Snapshots can be appended in any order, and more than once: reads
+    keep the last record appended for each node and time."""
+    def __init__(self, store_dir=HISTORY_DIR,
+                 flush_snapshots=FLUSH_SNAPSHOTS):
+        super(HistoryStore, self).__init__()
+
+        self._store_dir = _expand_path(store_dir)
+        self._flush_snapshots = flush_snapshots
+
+        os.makedirs(self._store_dir, exist_ok=True)
+
+        self._nodes = _Dictionary(os.path.join(self._store_dir, NODES_FILE))
+        self._states = _Dictionary(os.path.join(self._store_dir,
+                                                STATES_FILE))
+
+        self._pending = []
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return self._store_dir
+
+    def append(self, timestamp, node_df):
+        """Append a node snapshot taken at timestamp"""
+        timestamp = pd.Timestamp(timestamp)
+
+        with self._lock:
+            node_ids, records = self._to_records(timestamp, node_df)
+            self._pending.append((timestamp.strftime(CHUNK_FORMAT),
+                                  node_ids, records))
+
+            if len(self._pending) >= self._flush_snapshots:
+                self._flush()
+
+    # Takes snapshots as aggregators do, for the readers in analysis
+    agg = append
+
+    def flush(self):
+        """Write buffered snapshots to the store"""
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        self.flush()
+
+    def _to_records(self, timestamp, node_df):
+        node_ids = self._nodes.codes(node_df[NODE_HOST])
+        records = np.zeros(len(node_df), dtype=RECORD_DTYPE)
+        records['time'] = timestamp.value
+
+        if 'CPUsState' in node_df:
+            cpu_aiot = split_aiot(node_df['CPUsState'])
+            for i, cpu_col in enumerate(CPU_COLUMNS):
+                records[cpu_col] = cpu_aiot[:, i]
+        else:
+            for cpu_col in CPU_COLUMNS:
+                records[cpu_col] = _int32(node_df.get(cpu_col),
+                                          len(node_df))
+
+        for mem_col in MEMORY_COLUMNS:
+            records[mem_col] = _int32(node_df.get(mem_col), len(node_df))
+
+        records[STATE] = (self._states.codes(node_df[STATE])
+                          if STATE in node_df else MISSING)
+
+        # Nodes in several partitions are listed once for each
+        _, first = np.unique(node_ids, return_index=True)
+        first.sort()
+
+        return node_ids[first], records[first]
+
+    def _flush(self):
+        if not self._pending:
+            return
+
+        with _store_lock(self._store_dir):
+            # Dictionaries first, so every stored id can be looked up
+            node_map = self._nodes.sync()
+            state_map = self._states.sync()
+
+            by_day = {}
+            for day, node_ids, records in self._pending:
+                records[STATE] = _remap(records[STATE], state_map)
+                by_day.setdefault(day, []).append((node_map[node_ids],
+                                                   records))
+            self._pending = []
+
+            self._append_days(by_day)
+
+    def _append_days(self, by_day):
+        for day, snapshots in by_day.items():
+            node_ids = np.concatenate([ids for ids, _ in snapshots])
+            records = np.concatenate([recs for _, recs in snapshots])
+
+            # Rows of each node, still in the order they were appended
+            order = np.argsort(node_ids, kind='stable')
+            ids, starts = np.unique(node_ids[order], return_index=True)
+
+            os.makedirs(os.path.join(self._store_dir, day), exist_ok=True)
+            for node_id, rows in zip(ids, np.split(order, starts[1:])):
+                _append_chunk(_chunk_path(self._store_dir, day, node_id),
+                              records[rows])
+
+
+def node_history(nodes, start_time=None, end_time=None, fields=None,
+                 store_dir=HISTORY_DIR):
+    """Read the history of nodes from start_time up to end_time.
+
+    nodes is a host name or list of them, and fields any of CPUAlloc,
+    CPUIdle, CPUOther, CPUTotal, Memory, AllocMem, FreeMem and
+    StateCompact, all of them by default. Without a start_time, only
+    the last week before end_time (or now) is read.
+
+    Returns DataFrame with a SnapshotTime index, a NodeHost column, and
+    an Int32 column for each field but StateCompact, in time order.
+
+    Raises ValueError if a field is unknown."""
+    store_dir = _expand_path(store_dir)
+    nodes = [nodes] if isinstance(nodes, str) else list(nodes)
+    fields = FIELDS if fields is None else list(fields)
+
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raise ValueError('{} not in history fields {}'.format(unknown,
+                                                              FIELDS))
+
+    end_time = pd.Timestamp.now() if end_time is None else \
+        pd.Timestamp(end_time)
+    start_time = end_time - pd.Timedelta(days=7) if start_time is None else \
+        pd.Timestamp(start_time)
+
+    node_ids = _Dictionary(os.path.join(store_dir, NODES_FILE))
+    days = pd.date_range(start_time.normalize(), end_time,
+                         freq='D').strftime(CHUNK_FORMAT)
+
+    histories = []
+    for node in nodes:
+        node_id = node_ids.get(node)
+        if node_id is None:
+            continue
+
+        records = _read_records(store_dir, days, node_id,
+                                start_time.value, end_time.value)
+        histories.append(_to_frame(node, records, fields))
+
+    history = pd.concat(histories) if histories else \
+        _to_frame(None, np.zeros(0, dtype=RECORD_DTYPE), fields)
+    return _with_states(history, store_dir) if STATE in fields else history
+
+
+@contextmanager
+def _store_lock(store_dir):
+    with open(os.path.join(store_dir, LOCK_FILE), mode='a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _append_chunk(chunk_path, records):
+    with open(chunk_path, mode='ab') as chunk_file:
+        # Drop a record cut short by a crash
+        size = chunk_file.tell()
+        chunk_file.truncate(size - size % RECORD_DTYPE.itemsize)
+        chunk_file.seek(0, os.SEEK_END)
+        chunk_file.write(records.tobytes())
+
+
+def _read_records(store_dir, days, node_id, start_ns, end_ns):
+    chunks = []
+    for day in days:
+        chunk_path = _chunk_path(store_dir, day, node_id)
+        if not os.path.exists(chunk_path):
+            continue
+
+        with open(chunk_path, mode='rb') as chunk_file:
+            raw = chunk_file.read()
+
+        num_records = len(raw) // RECORD_DTYPE.itemsize
+        chunks.append(np.frombuffer(raw[:num_records *
+                                        RECORD_DTYPE.itemsize],
+                                    dtype=RECORD_DTYPE))
+
+    if not chunks:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+
+    records = np.concatenate(chunks)
+    records = records[(records['time'] >= start_ns) &
+                      (records['time'] < end_ns)]
+
+    # Keep the last record appended for each time, in time order
+    order = np.argsort(records['time'], kind='stable')[::-1]
+    _, last = np.unique(records['time'][order], return_index=True)
+
+    return records[order[last]]
+
+
+def _to_frame(node, records, fields):
+    index = pd.DatetimeIndex(records['time'].astype('datetime64[ns]'),
+                             name=SNAPSHOT_TIME)
+
+    columns = {NODE_HOST: pd.Series(node, index=index, dtype=object)}
+    for field in fields:
+        values = records[field].astype(np.int32)
+        columns[field] = pd.arrays.IntegerArray(values, values == MISSING)
+
+    return pd.DataFrame(columns, index=index)
+
+
+def _with_states(history, store_dir):
+    states = _Dictionary(os.path.join(store_dir, STATES_FILE)).names()
+    codes = history[STATE]
+
+    history[STATE] = pd.Categorical.from_codes(
+        codes.fillna(MISSING).astype(np.int64), categories=states)
+
+    return history
+
+
+def _remap(codes, code_map):
+    codes = codes.copy()
+    known = codes != MISSING
+    codes[known] = code_map[codes[known]]
+
+    return codes
+
+
+def _int32(column, length):
+    if column is None:
+        return np.full(length, MISSING, dtype=np.int32)
+
+    return pd.to_numeric(column, errors='coerce') \
+             .fillna(MISSING).values.astype(np.int32)
+
+
+def _chunk_path(store_dir, day, node_id):
+    return os.path.join(store_dir, day,
+                        '{}.{}'.format(node_id, CHUNK_EXT))
+
+
+def _expand_path(path):
+    return os.path.expandvars(os.path.expanduser(path))
+
+
+class _Dictionary(object):
+    """Names numbered in the order they were first seen, kept one per
+    line in a file.
+
+    Codes of names not yet saved are only provisional, as another
+    process may save other names first; sync() settles them."""
+    def __init__(self, path):
+        super(_Dictionary, self).__init__()
+
+        self._path = path
+        self._codes = self._load()
+        self._saved = len(self._codes)
+
+    def get(self, name):
+        return self._codes.get(name)
+
+    def names(self):
+        return list(self._codes)
+
+    def codes(self, names):
+        """Return int32 codes of names, numbering new names"""
+        codes = self._codes
+        names = [name if isinstance(name, str) else ''
+                 for name in names.tolist()]
+
+        return np.fromiter((codes.setdefault(name, len(codes))
+                            for name in names),
+                           dtype=np.int32, count=len(names))
+
+    def sync(self):
+        """Number names new to the file after those saved by any
+        process, and save them. Returns an int32 array mapping codes
+        handed out so far to their saved codes. Call with the store
+        locked."""
+        names = self.names()
+        if self._saved == len(names):
+            return np.arange(len(names), dtype=np.int32)
+
+        codes = self._load()
+        saved = len(codes)
+        for name in names:
+            codes.setdefault(name, len(codes))
+
+        with open(self._path, mode='a') as dict_file:
+            dict_file.writelines('{}\n'.format(name) for name
+                                 in list(codes)[saved:])
+
+        code_map = np.fromiter((codes[name] for name in names),
+                               dtype=np.int32, count=len(names))
+
+        self._codes = codes
+        self._saved = len(codes)
+        return code_map
+
+    def _load(self):
+        try:
+            with open(self._path) as dict_file:
+                names = dict_file.read().splitlines()
+        except FileNotFoundError:
+            return {}
+
+        return {name: code for code, name in enumerate(names)}
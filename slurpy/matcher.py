@@ -0,0 +1,53 @@
+"""Regular expression matching on DataFrame columns"""
+import re
+
+import numpy as np
+import pandas as pd
+
+MAX_RESULTS = 100000
+
+
+class PatternMatcher(object):
+    """PatternMatcher object
+
+    Matches column values against any of a set of regular expressions,
+    compiled once. Match results are remembered per distinct value, so
+    values that repeat across calls, like node host names, cost a
+    dictionary lookup instead of a regex scan.
+
+    Patterns match anywhere in a value, unless anchored is set, in
+    which case they must match the whole value."""
+    def __init__(self, patterns, anchored=False):
+        super(PatternMatcher, self).__init__()
+
+        if isinstance(patterns, str):
+            patterns = [patterns]
+
+        regex = re.compile('|'.join('(?:{})'.format(patt)
+                                    for patt in patterns))
+
+        self._match = regex.fullmatch if anchored else regex.search
+        self._results = {}
+
+    def match(self, values):
+        """Match an array-like of values.
+
+        Missing values never match.
+
+        Returns boolean array, True where a value matches."""
+        codes, uniques = pd.factorize(values)
+
+        if len(self._results) + len(uniques) > MAX_RESULTS:
+            self._results.clear()
+
+        results = self._results
+        is_match = np.zeros(len(uniques) + 1, dtype=bool)
+
+        for i, value in enumerate(uniques):
+            try:
+                is_match[i] = results[value]
+            except KeyError:
+                is_match[i] = results[value] = bool(self._match(str(value)))
+
+        # Missing values have code -1, which picks the trailing False
+        return is_match[codes]
@@ -0,0 +1,333 @@
+"""Segment log storage of node snapshots
+
+A segment is a data file of snapshot records, each a CSV encoded
+DataFrame, plus an index file of (timestamp, offset, length) entries,
+one per record. Snapshots are appended to an open, uncompressed segment,
+which is later sealed: its records are compressed one by one into a new
+segment, so any record can be read without decompressing the rest.
+
+Records can also be delta encoded (see slurpy.delta), in which case each
+segment starts with a keyframe, and readers rebuild snapshots from the
+keyframe before them.
+
+Data files are named <name>.seg when open and <name>.seg.<ext> when
+sealed, where ext is gz, bz2 or xz. Index files add a further .idx."""
+from .delta import DeltaDecoder, DeltaEncoder, is_delta
+
+import bz2
+import gzip
+import lzma
+import os
+import os.path
+import threading
+
+import numpy as np
+import pandas as pd
+
+SEGMENT_EXT = 'seg'
+INDEX_EXT = 'idx'
+
+INDEX_DTYPE = np.dtype([('timestamp', '<i8'),
+                        ('offset', '<u8'),
+                        ('length', '<u8')])
+
+CODECS = {'gz':  gzip,
+          'bz2': bz2,
+          'xz':  lzma}
+
+SNAPSHOT_TIME = 'SnapshotTime'
+
+
+class SegmentWriter(object):
+    """SegmentWriter object
+
+    Appends node snapshots to open segments, moving on to a new segment
+    whenever a snapshot is given a new path. Each record is written out
+    before append returns, and its index entry after it, so a segment
+    holds every snapshot that was indexed even if the writer dies.
+
+    Appending to an existing open segment first drops any record that
+    was not fully written.
+
+    If keyframe_interval is given, snapshots are delta encoded, with a
+    keyframe at least every keyframe_interval snapshots, and whenever
+    a new segment is opened."""
+    def __init__(self, keyframe_interval=None):
+        super(SegmentWriter, self).__init__()
+
+        self._encoder = (DeltaEncoder(keyframe_interval)
+                         if keyframe_interval else None)
+
+        self._path = None
+        self._data_file = None
+        self._index_file = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        """Path of the segment currently being appended to"""
+        return self._path
+
+    def append(self, path, node_df, timestamp):
+        """Append a node snapshot taken at timestamp to the segment at
+        path"""
+        timestamp = pd.Timestamp(timestamp).value
+
+        with self._lock:
+            if path != self._path:
+                self._close()
+                self._open(path)
+
+            if self._encoder is not None:
+                node_df = self._encoder.encode(node_df)
+            record = node_df.to_csv(index=False).encode()
+
+            offset = self._data_file.tell()
+            self._data_file.write(record)
+            self._data_file.flush()
+
+            entry = np.array([(timestamp, offset, len(record))],
+                             dtype=INDEX_DTYPE)
+            self._index_file.write(entry.tobytes())
+            self._index_file.flush()
+
+            if self._encoder is not None:
+                self._encoder.commit()
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _open(self, path):
+        index_path = _index_path(path)
+        index = read_index(path) if os.path.exists(index_path) else \
+            np.zeros(0, dtype=INDEX_DTYPE)
+        data_end = int(index['offset'][-1] + index['length'][-1]) \
+            if len(index) else 0
+
+        # Drop a record, or index entry, cut short by a crash
+        self._data_file = _open_truncated(path, data_end)
+        self._index_file = _open_truncated(index_path, index.nbytes)
+
+        self._path = path
+
+    def _close(self):
+        if self._encoder is not None:
+            self._encoder.reset()
+
+        for segment_file in [self._data_file, self._index_file]:
+            if segment_file is not None:
+                segment_file.close()
+
+        self._data_file = None
+        self._index_file = None
+        self._path = None
+
+
+def seal_segments(segment_paths, sealed_path):
+    """Compress the records of segments into one sealed segment.
+
+    The codec is given by the extension of sealed_path, e.g. .seg.bz2.
+    Records are stored in time order. The index is written last, so a
+    sealed segment is complete once its index exists. The original
+    segments are then removed.
+
+    Returns number of records sealed."""
+    codec = _codec(sealed_path)
+    if codec is None or not is_segment(sealed_path):
+        raise ValueError('{} does not end in .{}.<{}>'.format(
+            sealed_path, SEGMENT_EXT, '|'.join(CODECS)))
+
+    records = []
+    for segment_path in segment_paths:
+        index = read_index(segment_path)
+        records += [(entry['timestamp'], segment_path, entry)
+                    for entry in index]
+
+    records.sort(key=lambda record: record[0])
+
+    index = np.zeros(len(records), dtype=INDEX_DTYPE)
+    with open(sealed_path, mode='wb') as sealed_file:
+        for i, record in enumerate(_read_records(records)):
+            compressed = codec.compress(record)
+
+            index[i] = (records[i][0], sealed_file.tell(), len(compressed))
+            sealed_file.write(compressed)
+
+    index_path = _index_path(sealed_path)
+    tmp_path = '{}.tmp{}'.format(index_path, os.getpid())
+    index.tofile(tmp_path)
+    os.replace(tmp_path, index_path)
+
+    for segment_path in segment_paths:
+        os.remove(segment_path)
+        os.remove(_index_path(segment_path))
+
+    return len(records)
+
+
+def read_index(segment_path):
+    """Return the index of a segment as an array of (timestamp, offset,
+    length) entries. A trailing partial entry is ignored."""
+    with open(_index_path(segment_path), mode='rb') as index_file:
+        raw_index = index_file.read()
+
+    num_entries = len(raw_index) // INDEX_DTYPE.itemsize
+    return np.frombuffer(raw_index[:num_entries * INDEX_DTYPE.itemsize],
+                         dtype=INDEX_DTYPE)
+
+
+def find_segments(directory):
+    """Return sorted paths of the open and sealed segments in a
+    directory"""
+    index_suffix = '.{}'.format(INDEX_EXT)
+
+    return sorted(os.path.join(directory, entry.name[:-len(index_suffix)])
+                  for entry in os.scandir(directory)
+                  if entry.name.endswith(index_suffix) and
+                  is_segment(entry.name[:-len(index_suffix)]))
+
+
+def is_segment(path):
+    """Return whether path names an open or sealed segment data file"""
+    name = os.path.basename(path)
+    return (name.endswith('.{}'.format(SEGMENT_EXT)) or
+            any(name.endswith('.{}.{}'.format(SEGMENT_EXT, ext))
+                for ext in CODECS))
+
+
+def iter_snapshots(source, start_time=None, end_time=None):
+    """Iterate over the node snapshots in a segment, a list of them, or
+    a directory of them, in time order.
+
+    Only snapshots taken from start_time up to end_time are read, if
+    given. Other records are skipped using the segment indexes, without
+    being read or decompressed, bar those back to the keyframe of the
+    first delta encoded snapshot in range.
+
+    Yields (timestamp, DataFrame) pairs."""
+    start_ns = None if start_time is None else pd.Timestamp(start_time).value
+    end_ns = None if end_time is None else pd.Timestamp(end_time).value
+
+    records = []
+    for segment_path in _segment_paths(source):
+        index = read_index(segment_path)
+
+        in_range = np.ones(len(index), dtype=bool)
+        if start_ns is not None:
+            in_range &= index['timestamp'] >= start_ns
+        if end_ns is not None:
+            in_range &= index['timestamp'] < end_ns
+
+        positions = np.flatnonzero(in_range)
+        if not len(positions):
+            continue
+
+        keyframe = _keyframe_position(segment_path, index, positions[0])
+        records += [(entry['timestamp'], segment_path, entry)
+                    for entry in index[keyframe:positions[0]]]
+        records += [(entry['timestamp'], segment_path, entry)
+                    for entry in index[positions]]
+
+    records.sort(key=lambda record: record[0])
+
+    decoders = {}
+    for (timestamp, segment_path, _), record in zip(records,
+                                                    _read_records(records)):
+        decoder = decoders.setdefault(segment_path, DeltaDecoder())
+        snapshot = decoder.decode(record)
+
+        # Records before start_time only lead up to the first snapshot
+        if start_ns is None or timestamp >= start_ns:
+            yield pd.Timestamp(timestamp), snapshot
+
+
+def snapshot_at(source, time):
+    """Return (timestamp, DataFrame) of the last node snapshot taken at or
+    before time, in the segments given as for iter_snapshots, or None"""
+    time_ns = pd.Timestamp(time).value
+
+    taken = np.concatenate([np.zeros(0, dtype=INDEX_DTYPE['timestamp'])] +
+                           [read_index(segment_path)['timestamp']
+                            for segment_path in _segment_paths(source)])
+    taken = taken[taken <= time_ns]
+
+    if not len(taken):
+        return None
+
+    latest = int(taken.max())
+
+    return next(iter_snapshots(source, start_time=pd.Timestamp(latest),
+                               end_time=pd.Timestamp(latest + 1)))
+
+
+def read_snapshots(source, start_time=None, end_time=None):
+    """Read node snapshots into one DataFrame with a SnapshotTime column.
+
+    Takes the same arguments as iter_snapshots."""
+    snapshots = [snapshot.assign(**{SNAPSHOT_TIME: timestamp})
+                 for timestamp, snapshot
+                 in iter_snapshots(source, start_time, end_time)]
+
+    if not snapshots:
+        return pd.DataFrame(columns=[SNAPSHOT_TIME])
+
+    return pd.concat(snapshots, ignore_index=True)
+
+
+def _read_records(records):
+    """Read and decompress (timestamp, segment path, index entry)
+    records, keeping each segment open while it is read from"""
+    segment_files = {}
+    try:
+        for _, segment_path, entry in records:
+            if segment_path not in segment_files:
+                segment_files[segment_path] = open(segment_path, mode='rb')
+
+            segment_file = segment_files[segment_path]
+            segment_file.seek(int(entry['offset']))
+            record = segment_file.read(int(entry['length']))
+
+            codec = _codec(segment_path)
+            yield record if codec is None else codec.decompress(record)
+    finally:
+        for segment_file in segment_files.values():
+            segment_file.close()
+
+
+def _keyframe_position(segment_path, index, position):
+    """Position of the keyframe the record at position is rebuilt from"""
+    while position > 0:
+        entry = index[position]
+        record = next(_read_records([(entry['timestamp'], segment_path,
+                                      entry)]))
+        if not is_delta(record):
+            break
+
+        position -= 1
+
+    return position
+
+
+def _open_truncated(path, size):
+    segment_file = open(path, mode='ab')
+    segment_file.truncate(size)
+    segment_file.seek(size)
+
+    return segment_file
+
+
+def _segment_paths(source):
+    if isinstance(source, str):
+        return find_segments(source) if os.path.isdir(source) else [source]
+
+    return list(source)
+
+
+def _codec(segment_path):
+    ext = os.path.splitext(segment_path)[1].lstrip('.')
+    return CODECS.get(ext)
+
+
+def _index_path(segment_path):
+    return '{}.{}'.format(segment_path, INDEX_EXT)
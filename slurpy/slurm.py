@@ -1,8 +1,14 @@
+import asyncio
 import csv
 import io
 import re
 import subprocess
 import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+import threading
+from time import monotonic
 
 import pandas as pd
 import numpy as np
@@ -12,6 +18,45 @@ DELIM = '|'
 COMMA = ','
 DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
 
+CHUNK_ROWS = 100000
+
+JOB_ID_RAW = 'JobIDRaw'
+
+# Columns added when several partitions or clusters are queried at once
+PARTITION_NAME = 'PartitionName'
+PARTITION = 'Partition'
+CLUSTER = 'Cluster'
+
+# sinfo -M prints this before the nodes of each cluster
+CLUSTER_LINE = 'CLUSTER:'
+
+PLANNER_TTL = 1.0
+
+# sinfo only prints one row per node if one of these is asked for...
+NODE_KEY_FEATURES = {'nodeaddr', 'nodehost'}
+# ...and one row per node per partition if one of these is too
+PARTITION_FEATURES = {'partition', 'partitionname'}
+# NodeList names nodes too, but folds alike ones into hostlist rows
+NODE_NAME_FEATURES = NODE_KEY_FEATURES | {'nodelist'}
+
+# Columns of split_aiot output
+ALLOC = 0
+IDLE = 1
+OTHER = 2
+TOTAL = 3
+
+# Column names of split CPUsState, in split_aiot order
+CPU_COLUMNS = ['CPUAlloc', 'CPUIdle', 'CPUOther', 'CPUTotal']
+
+AIOT_SEP = ord('/')
+
+INT = 'int'
+FLOAT = 'float'
+DATETIME = 'datetime'
+
+# Placeholders SLURM prints in place of a missing value
+NA_VALUES = ['', 'N/A', 'n/a', 'n/s', 'None', 'Unknown', '(null)']
+
 VALID_NODE_FEATURES = {'all',
                        'allocmem',
                        'allocnodes',
@@ -58,6 +103,22 @@ VALID_NODE_FEATURES = {'all',
                        'version',
                        'weight'}
 
+NODE_FEATURE_TYPES = {'allocmem': INT,
+                      'cpus': INT,
+                      'cpusload': FLOAT,
+                      'cores': INT,
+                      'disk': INT,
+                      'freemem': INT,
+                      'memory': INT,
+                      'nodes': INT,
+                      'port': INT,
+                      'priorityjobfactor': INT,
+                      'prioritytier': INT,
+                      'sockets': INT,
+                      'threads': INT,
+                      'timestamp': DATETIME,
+                      'weight': INT}
+
 VALID_JOB_PROPERTIES = {'all',
                         'account',
                         'admincomment',
@@ -145,44 +206,386 @@ VALID_JOB_PROPERTIES = {'all',
                         'wckey',
                         'wckeyid'}
 
+VALID_QUEUE_FIELDS = {'account',
+                      'arrayjobid',
+                      'arraytaskid',
+                      'batchflag',
+                      'command',
+                      'cpuspertask',
+                      'dependency',
+                      'eligibletime',
+                      'endtime',
+                      'exit_code',
+                      'feature',
+                      'groupid',
+                      'groupname',
+                      'jobarrayid',
+                      'jobid',
+                      'mincpus',
+                      'minmemory',
+                      'name',
+                      'nice',
+                      'nodelist',
+                      'numcpus',
+                      'numnodes',
+                      'numtasks',
+                      'partition',
+                      'priority',
+                      'prioritylong',
+                      'qos',
+                      'reason',
+                      'reasonlist',
+                      'reqnodes',
+                      'reservation',
+                      'starttime',
+                      'state',
+                      'statecompact',
+                      'submittime',
+                      'timeleft',
+                      'timelimit',
+                      'timeused',
+                      'userid',
+                      'username',
+                      'workdir'}
+
+QUEUE_FIELD_TYPES = {'arrayjobid': INT,
+                     'arraytaskid': INT,
+                     'batchflag': INT,
+                     'cpuspertask': INT,
+                     'eligibletime': DATETIME,
+                     'endtime': DATETIME,
+                     'groupid': INT,
+                     'jobid': INT,
+                     'mincpus': INT,
+                     'nice': INT,
+                     'numcpus': INT,
+                     'numnodes': INT,
+                     'numtasks': INT,
+                     'priority': FLOAT,
+                     'prioritylong': INT,
+                     'starttime': DATETIME,
+                     'submittime': DATETIME,
+                     'userid': INT}
+
+# A width of 0 prints squeue -O fields whole, without padding
+QUEUE_FIELD_FMT = '{}:0'
+
+# scontrol -o keys, which are not the same as sinfo features and sacct
+# properties, typed as in _extract_typed_data
+SCONTROL_NODE_TYPES = {'allocmem': INT,
+                       'boards': INT,
+                       'boottime': DATETIME,
+                       'consumedjoules': INT,
+                       'corespersocket': INT,
+                       'cpualloc': INT,
+                       'cpuerr': INT,
+                       'cpuload': FLOAT,
+                       'cputot': INT,
+                       'currentwatts': INT,
+                       'freemem': INT,
+                       'lowestjoules': INT,
+                       'realmemory': INT,
+                       'slurmdstarttime': DATETIME,
+                       'sockets': INT,
+                       'threadspercore': INT,
+                       'tmpdisk': INT,
+                       'weight': INT}
+
+SCONTROL_JOB_TYPES = {'arrayjobid': INT,
+                      'arraytaskid': INT,
+                      'accrualtime': DATETIME,
+                      'batchflag': INT,
+                      'cpus/task': INT,
+                      'eligibletime': DATETIME,
+                      'endtime': DATETIME,
+                      'jobid': INT,
+                      'lastschedeval': DATETIME,
+                      'mincpusnode': INT,
+                      'nice': INT,
+                      'numcpus': INT,
+                      'numtasks': INT,
+                      'priority': INT,
+                      'reboot': INT,
+                      'requeue': INT,
+                      'restarts': INT,
+                      'starttime': DATETIME,
+                      'submittime': DATETIME,
+                      'suspendtime': DATETIME}
+
+# Sub-fields of TRES keys, e.g. CfgTRES.cpu
+SCONTROL_TRES_TYPES = {'billing': INT,
+                       'cpu': INT,
+                       'node': INT}
+
+# Separates a key from the sub-field of its value to select
+SUBFIELD_SEP = '.'
+
+# A key starts each scontrol -o pair, so a value runs up to the next key,
+# spaces and all, e.g. Reason=Not responding [root@2017-08-18T11:14:39]
+SCONTROL_KEY = re.compile(r' +([A-Za-z][\w/:]*)=')
+
+JOB_PROPERTY_TYPES = {'alloccpus': INT,
+                      'allocnodes': INT,
+                      'associd': INT,
+                      'consumedenergyraw': INT,
+                      'cputimeraw': INT,
+                      'elapsedraw': INT,
+                      'eligible': DATETIME,
+                      'end': DATETIME,
+                      'gid': INT,
+                      'ncpus': INT,
+                      'nnodes': INT,
+                      'ntasks': INT,
+                      'priority': INT,
+                      'qosraw': INT,
+                      'reqcpus': INT,
+                      'reqnodes': INT,
+                      'reservationid': INT,
+                      'resvcpuraw': INT,
+                      'start': DATETIME,
+                      'submit': DATETIME,
+                      'uid': INT,
+                      'wckeyid': INT}
+
 
 def query_nodes(node_features, **kwargs):
     """Use sinfo to query node features.
 
     Available node features can be found by reading sinfo man page.
 
+    partition and clusters can each be a list, or comma separated
+    string, of several, which are all queried by one sinfo call. Nodes
+    of several partitions get a PartitionName column, and are listed
+    once per partition; nodes of clusters get a Cluster column.
+
     Returns DataFrame of node features."""
-    node_format, node_header = _listify(node_features)
+    node_format, node_header = _node_request(node_features, **kwargs)
 
     raw_sinfo = _query_sinfo(node_format, **kwargs)
 
-    # Need to append empty string to node_header due to csv reading
-    node_header.append('')
+    return _extract_nodes(raw_sinfo, node_header, kwargs.get('clusters'))
+
+
+def query_jobs(job_properties, slices=1, max_workers=None, **kwargs):
+    """Use sacct to query job properties.
 
-    res = _extract_parsable_data(raw_sinfo, node_header,
-                                 delimiter=' ',
-                                 skipinitialspace=True,
-                                 strict=True)
+    Available job properties can be found by running `sacct -e`.
 
-    # It is removed here
-    del res['']
+    If slices is greater than one, the period before end_time is split
+    into that many windows which are queried concurrently by at most
+    max_workers sacct processes.
 
-    return res
+    partition and clusters can each be a list, or comma separated
+    string, of several, which are all queried by one sacct call. Jobs
+    of several partitions get a Partition column, and jobs of clusters
+    a Cluster column.
 
+    Returns DataFrame of job properties."""
+    if slices > 1:
+        return _query_jobs_sliced(job_properties, slices, max_workers,
+                                  **kwargs)
 
-def query_jobs(job_properties, **kwargs):
-    """Use sacct to query job properties.
+    chunks = list(query_jobs_iter(job_properties, **kwargs))
 
-    Available job properties can be found by running `sacct -e`.
+    if not chunks:
+        _, job_header = _job_request(job_properties, **kwargs)
+        return _extract_typed_data('', job_header, JOB_PROPERTY_TYPES)
+
+    return pd.concat(chunks, ignore_index=True)
+
+
+async def query_nodes_async(node_features, executor=None, **kwargs):
+    """Use sinfo to query node features, without blocking the event loop.
+
+    sinfo is run as an asyncio subprocess, and its output parsed on
+    executor, or the event loop's default executor.
+
+    Returns DataFrame of node features."""
+    node_format, node_header = _node_request(node_features, **kwargs)
+
+    raw_sinfo = await _run_async(_sinfo_cmd(node_format, **kwargs))
+
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, partial(_extract_nodes, raw_sinfo, node_header,
+                          kwargs.get('clusters')))
+
+
+async def query_jobs_async(job_properties, executor=None, **kwargs):
+    """Use sacct to query job properties, without blocking the event
+    loop.
+
+    sacct is run as an asyncio subprocess, and its output parsed on
+    executor, or the event loop's default executor.
 
     Returns DataFrame of job properties."""
-    job_format, job_header = _listify(job_properties)
+    job_format, job_header = _job_request(job_properties, **kwargs)
+
+    raw_sacct = await _run_async(_sacct_cmd(job_format, **kwargs))
+
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, partial(_extract_typed_data, raw_sacct, job_header,
+                          JOB_PROPERTY_TYPES, sep=DELIM))
+
+
+async def query_queue_async(queue_fields, executor=None, partition=None,
+                            states=None):
+    """Use squeue to query the fields of pending and running jobs,
+    without blocking the event loop.
+
+    squeue is run as an asyncio subprocess, and its output parsed on
+    executor, or the event loop's default executor.
+
+    Returns DataFrame of queue fields, one row per job."""
+    queue_format, queue_header = _listify(queue_fields)
+
+    raw_squeue = await _run_async(_squeue_cmd(queue_format, partition,
+                                              states))
+
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, partial(_extract_typed_data, raw_squeue, queue_header,
+                          QUEUE_FIELD_TYPES, sep=DELIM))
 
-    raw_sacct = _query_sacct(job_format, **kwargs)
 
-    return _extract_parsable_data(raw_sacct, job_header,
-                                  delimiter=DELIM,
-                                  strict=True)
+def query_jobs_iter(job_properties, chunk_rows=CHUNK_ROWS, **kwargs):
+    """Use sacct to query job properties, chunk by chunk.
+
+    sacct output is read from its pipe as it is produced, so long
+    accounting periods can be processed in bounded memory.
+
+    Yields DataFrames of at most chunk_rows job properties."""
+    job_format, job_header = _job_request(job_properties, **kwargs)
+
+    sacct_cmd = _sacct_cmd(job_format, **kwargs)
+
+    with subprocess.Popen(sacct_cmd, stdout=subprocess.PIPE,
+                          encoding=DECODE_FORMAT) as sacct:
+        for lines in _iter_chunks(sacct.stdout, chunk_rows):
+            yield _extract_typed_data(''.join(lines), job_header,
+                                      JOB_PROPERTY_TYPES,
+                                      sep=DELIM)
+
+    if sacct.returncode:
+        raise subprocess.CalledProcessError(sacct.returncode, sacct_cmd)
+
+
+def query_queue(queue_fields, partition=None, states=None):
+    """Use squeue to query the fields of pending and running jobs.
+
+    Available queue fields can be found in the --Format section of the
+    squeue man page. squeue only asks slurmctld, so is far cheaper than
+    query_jobs for what is in the queue now.
+
+    Returns DataFrame of queue fields, one row per job."""
+    queue_format, queue_header = _listify(queue_fields)
+
+    raw_squeue = _query_squeue(queue_format, partition, states)
+
+    return _extract_typed_data(raw_squeue, queue_header,
+                               QUEUE_FIELD_TYPES,
+                               sep=DELIM)
+
+
+def query_scontrol_nodes(node_keys, node_list=None):
+    """Use scontrol to query node keys.
+
+    Keys are those printed by `scontrol -o show node`, e.g. CPUAlloc or
+    Reason, in any order; 'all' selects every key printed. A key of a
+    TRES list can be split into its sub-fields, e.g. CfgTRES.mem.
+    Values SLURM prints in place of a missing value, such as N/A and
+    (null), are read as missing.
+
+    Returns DataFrame of node keys, one row per node."""
+    raw_scontrol = _query_scontrol('node', node_list)
+
+    return _extract_scontrol_data(raw_scontrol, node_keys,
+                                  SCONTROL_NODE_TYPES)
+
+
+def query_scontrol_jobs(job_keys, job_ids=None):
+    """Use scontrol to query job keys.
+
+    Keys are those printed by `scontrol -o show job`, e.g. JobState or
+    TRES.cpu, and are selected as in query_scontrol_nodes. Only jobs
+    still known to slurmctld are listed; use query_jobs for finished
+    ones.
+
+    Returns DataFrame of job keys, one row per job."""
+    raw_scontrol = _query_scontrol('job', job_ids)
+
+    return _extract_scontrol_data(raw_scontrol, job_keys,
+                                  SCONTROL_JOB_TYPES)
+
+
+class NodeQueryPlanner(object):
+    """NodeQueryPlanner object
+
+    Serves several sinfo feature sets from a single sinfo call. Feature
+    sets asked for with the same partition and node_list are unioned
+    into one query, whose result is kept for ttl seconds and projected
+    onto the columns each caller wants.
+
+    Only feature sets with a node key (NodeHost, NodeAddr) give one
+    row per node and can be shared; others, including NodeList ones,
+    whose rows fold nodes into hostlists, go straight to query_nodes."""
+    def __init__(self, ttl=PLANNER_TTL, clock=monotonic):
+        super(NodeQueryPlanner, self).__init__()
+
+        self.queries = 0
+
+        self._ttl = ttl
+        self._clock = clock
+
+        self._features = {}
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def register(self, node_features, partition=None, node_list=None):
+        """Declare node features that will be asked for later"""
+        _, node_header = _node_request(node_features, partition=partition)
+        group = _plan_group(node_header, partition, node_list)
+
+        if group is not None:
+            with self._lock:
+                self._add_features(group, node_header)
+
+    def query_nodes(self, node_features, partition=None, node_list=None):
+        """Planned slurpy.query_nodes"""
+        _, node_header = _node_request(node_features, partition=partition)
+        group = _plan_group(node_header, partition, node_list)
+
+        if group is None:
+            return query_nodes(node_features, partition=partition,
+                               node_list=node_list)
+
+        with self._lock:
+            self._add_features(group, node_header)
+            expiry, nodes = self._frames.get(group, (None, None))
+
+            if (nodes is None or expiry <= self._clock() or
+                    len(nodes.columns) < len(self._features[group])):
+                nodes = query_nodes(self._features[group],
+                                    partition=partition,
+                                    node_list=node_list)
+                self._frames[group] = (self._clock() + self._ttl, nodes)
+                self.queries += 1
+
+        columns = [_find_column(nodes.columns, col) for col in node_header]
+        projection = nodes[columns].copy()
+        projection.columns = node_header
+
+        return projection
+
+    def invalidate(self):
+        """Drop every cached sinfo result"""
+        with self._lock:
+            self._frames.clear()
+
+    def _add_features(self, group, node_header):
+        features = self._features.setdefault(group, [])
+
+        for feat in node_header:
+            if not _find_column(features, feat):
+                features.append(feat)
 
 
 def check_job_properties(properties):
@@ -195,6 +598,16 @@ def check_job_properties(properties):
             raise ValueError(err_str)
 
 
+def check_queue_fields(fields):
+    if isinstance(fields, str):
+        fields = fields.split(COMMA)
+
+    for field in fields:
+        if field.lower() not in VALID_QUEUE_FIELDS:
+            err_str = '{!r} is not a valid queue field'.format(field)
+            raise ValueError(err_str)
+
+
 def check_node_features(features):
     if isinstance(features, str):
         features = features.split(COMMA)
@@ -227,52 +640,269 @@ def _extract_scontrol_features(raw_scontrol, features):
                         columns=features)
 
 
-def _extract_parsable_data(raw_data, header, **csv_kwargs):
-    s_data = io.StringIO(raw_data)
-    reader = csv.reader(s_data, **csv_kwargs)
+def _split_scontrol(raw_scontrol):
+    """Split scontrol -o output into one dict of key values per line,
+    in a single pass over each line"""
+    records = []
+    for line in raw_scontrol.splitlines():
+        # Splits into '', key, value, key, value, ... Values may hold =
+        # too, as in CfgTRES=cpu=24,mem=96672M
+        parts = SCONTROL_KEY.split(' ' + line.strip())
 
-    return pd.DataFrame(data=np.array([row for row in reader]),
-                        columns=header)
+        if len(parts) > 1:
+            records.append(dict(zip(parts[1::2], parts[2::2])))
 
+    return records
 
-def _query_squeue(squeue_fmt, partition=None):
-    if partition:
-        squeue_cmd = ['squeue', '-p', partition, '-o', squeue_fmt]
+
+def _extract_scontrol_data(raw_scontrol, keys, schema):
+    """Select keys from scontrol -o output into typed columns.
+
+    Keys are typed by looking up their lower case names in schema, and
+    sub-fields by SCONTROL_TRES_TYPES. Other keys are kept as strings."""
+    records = _split_scontrol(raw_scontrol)
+    header = _scontrol_header(records, keys)
+
+    data = {}
+    for key in header:
+        name, _, sub = key.partition(SUBFIELD_SEP)
+
+        values = [record.get(name) for record in records]
+        if sub:
+            values = [_subfield(value, sub) for value in values]
+            kind = SCONTROL_TRES_TYPES.get(sub.lower())
+        else:
+            kind = schema.get(name.lower())
+
+        column = pd.Series(values, dtype=object)
+        column = column.where(~column.isin(NA_VALUES))
+
+        data[key] = (column.astype(str).where(column.notnull())
+                     if kind is None else _convert_column(column, kind))
+
+    return pd.DataFrame(data, columns=header)
+
+
+def _scontrol_header(records, keys):
+    if isinstance(keys, str):
+        keys = keys.split(COMMA)
+
+    if [key.lower() for key in keys] != ['all']:
+        return list(keys)
+
+    header = {}
+    for record in records:
+        header.update(dict.fromkeys(record))
+
+    return list(header)
+
+
+def _subfield(value, sub):
+    """Return sub-field sub of a value like cpu=24,mem=96672M"""
+    if not value:
+        return None
+
+    for pair in value.split(COMMA):
+        name, _, sub_value = pair.partition('=')
+        if name == sub:
+            return sub_value
+
+    return None
+
+
+def split_aiot(aiot):
+    """Split CPUsState strings of the form A/I/O/T.
+
+    Decodes the strings a byte column at a time, straight into a
+    preallocated array.
+
+    Returns (n, 4) int32 array, indexed by ALLOC, IDLE, OTHER, TOTAL."""
+    raw_aiot = np.asarray(aiot, dtype=np.bytes_)
+    num_rows = len(raw_aiot)
+    chars = raw_aiot.view(np.uint8).reshape(num_rows,
+                                            raw_aiot.dtype.itemsize)
+
+    if np.any((chars == AIOT_SEP).sum(axis=1) != TOTAL):
+        raise ValueError('CPUsState is not of the form A/I/O/T')
+
+    cpu_aiot = np.zeros((num_rows, TOTAL + 1), dtype=np.int32)
+    flat_aiot = cpu_aiot.reshape(-1)
+    field_idx = np.arange(num_rows) * (TOTAL + 1)
+
+    for char in chars.T:
+        digit = char.astype(np.int32) - ord('0')
+        is_digit = (digit >= 0) & (digit <= 9)
+
+        flat_aiot[field_idx] = np.where(is_digit,
+                                        flat_aiot[field_idx] * 10 + digit,
+                                        flat_aiot[field_idx])
+        field_idx += char == AIOT_SEP
+
+    return cpu_aiot
+
+
+def _extract_nodes(raw_sinfo, node_header, clusters=None):
+    """Parse sinfo output, adding a Cluster column if clusters were
+    queried"""
+    if not clusters:
+        return _extract_typed_data(raw_sinfo, node_header,
+                                   NODE_FEATURE_TYPES, sep=r'\s+')
+
+    frames = [_extract_typed_data(raw_nodes, node_header,
+                                  NODE_FEATURE_TYPES, sep=r'\s+')
+              .assign(**{CLUSTER: cluster})
+              for cluster, raw_nodes in _split_clusters(raw_sinfo, clusters)]
+
+    if not frames:
+        frames = [_extract_typed_data('', node_header, NODE_FEATURE_TYPES)
+                  .assign(**{CLUSTER: pd.Series(dtype=str)})]
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def _split_clusters(raw_sinfo, clusters):
+    """Return (cluster, raw nodes) of each cluster in sinfo -M output"""
+    _, clusters = _listify(clusters)
+    blocks = []
+
+    for line in raw_sinfo.splitlines(keepends=True):
+        if line.startswith(CLUSTER_LINE):
+            blocks.append((line[len(CLUSTER_LINE):].strip(), []))
+        elif line.strip():
+            # No CLUSTER line is printed for a lone cluster
+            if not blocks:
+                blocks.append((clusters[0] if len(clusters) == 1
+                               else None, []))
+            blocks[-1][1].append(line)
+
+    return [(cluster, ''.join(lines)) for cluster, lines in blocks]
+
+
+def _extract_typed_data(raw_data, header, schema, **csv_kwargs):
+    """Parse raw SLURM output straight into typed columns.
+
+    Each column is typed by looking up its lower case name in schema.
+    Columns not found in schema are kept as strings."""
+    kinds = {col: schema.get(col.lower()) for col in header}
+
+    if raw_data.strip():
+        data = pd.read_csv(io.StringIO(raw_data),
+                           header=None,
+                           names=header,
+                           dtype={col: str for col, kind in kinds.items()
+                                  if kind is None},
+                           na_values={col: NA_VALUES
+                                      for col, kind in kinds.items()
+                                      if kind is not None},
+                           keep_default_na=False,
+                           quoting=csv.QUOTE_NONE,
+                           **csv_kwargs)
     else:
-        squeue_cmd = ['squeue', '-o', squeue_fmt]
+        data = pd.DataFrame(columns=header, dtype=str)
+
+    for col, kind in kinds.items():
+        if kind is not None:
+            data[col] = _convert_column(data[col], kind)
+
+    return data
+
+
+def _convert_column(column, kind):
+    """Convert a parsed column to the dtype given by kind"""
+    if kind == DATETIME:
+        return pd.to_datetime(column, format=DATE_FORMAT, errors='coerce')
+
+    numeric = pd.to_numeric(column, errors='coerce')
+
+    if kind == INT:
+        return numeric.fillna(0).astype(np.int64)
+
+    return numeric.astype(np.float64)
+
+
+def _query_squeue(squeue_fmt, partition=None, states=None):
+    squeue_cmd = _squeue_cmd(squeue_fmt, partition, states)
 
     return subprocess.check_output(squeue_cmd) \
                      .decode(DECODE_FORMAT)
 
 
-def _query_scontrol(entity, ID=''):
-    scontrol_cmd = ['scontrol', '-o', 'show', entity, ID]
+def _squeue_cmd(squeue_fmt, partition=None, states=None):
+    # Every field but the last ends in the delimiter
+    fields = [QUEUE_FIELD_FMT.format(field)
+              for field in squeue_fmt.split(COMMA)]
+    squeue_fmt = COMMA.join([field + DELIM for field in fields[:-1]] +
+                            fields[-1:])
+
+    squeue_cmd = ['squeue', '--noheader', '-O', squeue_fmt]
+
+    if partition:
+        squeue_cmd += ['-p', partition]
+
+    if states:
+        squeue_cmd += ['-t', states]
+
+    return squeue_cmd
+
+
+def _query_scontrol(entity, ID=None):
+    scontrol_cmd = ['scontrol', '-o', 'show', entity]
+
+    if ID:
+        scontrol_cmd += [ID]
 
     return subprocess.check_output(scontrol_cmd) \
                      .decode(DECODE_FORMAT)
 
 
-def _query_sinfo(sinfo_fmt, partition=None, node_list=None):
+def _query_sinfo(sinfo_fmt, partition=None, node_list=None, clusters=None):
+    sinfo_cmd = _sinfo_cmd(sinfo_fmt, partition, node_list, clusters)
+
+    return subprocess.check_output(sinfo_cmd) \
+                     .decode(DECODE_FORMAT)
+
+
+def _sinfo_cmd(sinfo_fmt, partition=None, node_list=None, clusters=None):
     sinfo_cmd = ['sinfo', '--noconvert', '--noheader',
                  '-O', sinfo_fmt]
 
     if partition:
-        sinfo_cmd += ['-p', partition]
+        sinfo_cmd += ['-p', _listify(partition)[0]]
 
     if node_list:
         sinfo_cmd += ['-n', node_list]
 
-    return subprocess.check_output(sinfo_cmd) \
-                     .decode(DECODE_FORMAT)
+    if clusters:
+        sinfo_cmd += ['-M', _listify(clusters)[0]]
+
+    return sinfo_cmd
 
 
-def _query_sacct(sacct_fmt, partition=None, state=None,
-                 end_time=None, period=None):
+async def _run_async(cmd):
+    """Run cmd as an asyncio subprocess, returning its decoded output"""
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE)
+    stdout, _ = await proc.communicate()
+
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stdout)
+
+    return stdout.decode(DECODE_FORMAT)
+
+
+def _sacct_cmd(sacct_fmt, partition=None, state=None,
+               end_time=None, period=None, job_ids=None, clusters=None):
     sacct_cmd = ['sacct', '--units=K', '--delimiter={}'.format(DELIM),
                  '--noheader', '-aPo', sacct_fmt]
 
     if partition:
-        sacct_cmd += ['-r', partition]
+        sacct_cmd += ['-r', _listify(partition)[0]]
+
+    if clusters:
+        sacct_cmd += ['-M', _listify(clusters)[0]]
+
+    if job_ids:
+        sacct_cmd += ['-j', _listify(job_ids)[0]]
 
     if state:
         sacct_cmd += ['-s', state]
@@ -287,8 +917,112 @@ def _query_sacct(sacct_fmt, partition=None, state=None,
     elif period:
         raise ValueError('Cannot specify period without an end time!')
 
-    return subprocess.check_output(sacct_cmd) \
-                     .decode(DECODE_FORMAT)
+    return sacct_cmd
+
+
+def _query_jobs_sliced(job_properties, slices, max_workers,
+                       end_time=None, period=None, **kwargs):
+    if not (end_time and period):
+        raise ValueError('Cannot slice a query without an end time '
+                         'and period!')
+
+    _, job_header = _job_request(job_properties, **kwargs)
+    job_id_col = _find_column(job_header, JOB_ID_RAW)
+
+    # Jobs running across a slice boundary are returned by both slices
+    slice_header = job_header if job_id_col else job_header + [JOB_ID_RAW]
+    slice_period = period / slices
+    slice_ends = [end_time - period + slice_period * (i + 1)
+                  for i in range(slices)]
+
+    def query_slice(slice_end):
+        return query_jobs(slice_header, end_time=slice_end,
+                          period=slice_period, **kwargs)
+
+    with ThreadPoolExecutor(max_workers=max_workers or slices) as pool:
+        jobs = pd.concat(pool.map(query_slice, slice_ends),
+                         ignore_index=True)
+
+    jobs = jobs.drop_duplicates(subset=_job_key_columns(slice_header))
+
+    if not job_id_col:
+        del jobs[JOB_ID_RAW]
+
+    return jobs.reset_index(drop=True)
+
+
+def _plan_group(node_header, partition, node_list):
+    """Return the key of feature sets that can share a sinfo call"""
+    features = {feat.lower() for feat in node_header}
+
+    if not features & NODE_KEY_FEATURES:
+        return None
+
+    if partition:
+        partition, _ = _listify(partition)
+
+    return (partition, node_list, bool(features & PARTITION_FEATURES))
+
+
+def _node_request(node_features, partition=None, **kwargs):
+    """Return the sinfo format and header of node_features, adding
+    PartitionName if several partitions are queried"""
+    node_format, node_header = _listify(node_features)
+    node_header = list(node_header)
+
+    if (_several(partition) and
+            not {feat.lower() for feat in node_header} & PARTITION_FEATURES):
+        node_format += COMMA + PARTITION_NAME
+        node_header.append(PARTITION_NAME)
+
+    return node_format, node_header
+
+
+def _job_request(job_properties, partition=None, clusters=None, **kwargs):
+    """Return the sacct format and header of job_properties, adding
+    Partition if several partitions are queried, and Cluster if any
+    clusters are"""
+    job_format, job_header = _listify(job_properties)
+    job_header = list(job_header)
+
+    added = [col for col, wanted in [(PARTITION, _several(partition)),
+                                     (CLUSTER, bool(clusters))]
+             if wanted and not _find_column(job_header, col)]
+
+    return COMMA.join([job_format] + added), job_header + added
+
+
+def _job_key_columns(header):
+    """Return the columns of header that identify a job: JobIDRaw, and
+    Cluster if there is one, as job IDs are only unique per cluster"""
+    return [col for col in (_find_column(header, name)
+                            for name in [JOB_ID_RAW, CLUSTER])
+            if col]
+
+
+def _several(x):
+    """Return whether x lists more than one value"""
+    return bool(x) and len(_listify(x)[1]) > 1
+
+
+def _find_column(header, name):
+    """Return the column in header matching name, ignoring case"""
+    for col in header:
+        if col.lower() == name.lower():
+            return col
+
+    return None
+
+
+def _iter_chunks(lines, chunk_rows):
+    """Yield lists of at most chunk_rows lines"""
+    while True:
+        chunk = list(islice(lines, chunk_rows))
+
+        if not chunk:
+            return
+
+        yield chunk
 
 
 def _listify(x):
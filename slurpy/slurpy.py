@@ -1,80 +1,123 @@
-from .slurm import query_nodes, query_jobs
+from .slurm import query_nodes, query_jobs, query_jobs_iter, query_queue, \
+                   query_queue_async, split_aiot, CHUNK_ROWS, CPU_COLUMNS
+from .matcher import PatternMatcher
 
+import asyncio
 from datetime import datetime
+from functools import lru_cache
 
 import numpy as np
 import pandas as pd
 
-ALLOC = 0
-IDLE = 1
-OTHER = 2
-TOTAL = 3
+MAX_MATCHERS = 32
+
+# squeue fields printed as [days-][hours:]minutes:seconds
+DURATION_FIELDS = {'timeleft', 'timelimit', 'timeused'}
+DURATION = (r'^(?:(?:(?P<days>\d+)-)?(?P<hours>\d+):)?'
+            r'(?P<minutes>\d+):(?P<seconds>\d+)$')
 
 
 def filter_df(df, column, patterns, exclude=False):
     """Filter DataFrame on a column.
 
     Returns a new DataFrame with filtered entries."""
-    cond_patts = '|'.join(['{}'.format(patt) for patt in patterns])
-    regex = r'.*({}).*'.format(cond_patts)
-
-    excl_states = df[column].str.extract(regex, expand=False) \
-                                .isnull()
+    matches = _get_matcher(tuple(patterns)).match(df[column])
 
     if exclude:
-        return df[excl_states].copy()
+        return df[~matches].copy()
     else:
-        return df[~excl_states].copy()
+        return df[matches].copy()
 
 
-def get_node_df(node_features, partition=None):
-    raw_node_df = query_nodes(node_features,
-                              partition=partition)
+def get_node_df(node_features, partition=None, clusters=None, cache=None):
+    query = cache.query_nodes if cache else query_nodes
+
+    raw_node_df = query(node_features,
+                        partition=partition,
+                        clusters=clusters)
     return _clean_node_df(raw_node_df)
 
 
 def get_job_df(job_features, partition=None, state=None,
-               end_time=None, period=None):
-    raw_job_df = query_jobs(job_features,
-                            partition=partition,
-                            state=state,
-                            end_time=end_time,
-                            period=period)
-    return _clean_job_df(raw_job_df)
+               end_time=None, period=None, slices=1, clusters=None,
+               cache=None):
+    # Columns come back from query_jobs already typed
+    query = cache.query_jobs if cache else query_jobs
+
+    return query(job_features,
+                 partition=partition,
+                 state=state,
+                 end_time=end_time,
+                 period=period,
+                 slices=slices,
+                 clusters=clusters)
+
+
+def get_queue_df(queue_fields, partition=None, states=None):
+    """Query pending and running jobs with squeue.
+
+    TimeLeft, TimeLimit and TimeUsed are converted to Timedeltas, with
+    UNLIMITED and other non-durations as NaT."""
+    raw_queue_df = query_queue(queue_fields,
+                               partition=partition,
+                               states=states)
+    return _clean_queue_df(raw_queue_df)
+
+
+async def get_queue_df_async(queue_fields, partition=None, states=None,
+                             executor=None):
+    """Query pending and running jobs with squeue, without blocking the
+    event loop, as get_queue_df does."""
+    raw_queue_df = await query_queue_async(queue_fields, executor,
+                                           partition=partition,
+                                           states=states)
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, _clean_queue_df, raw_queue_df)
+
+
+def iter_job_df(job_features, chunk_rows=CHUNK_ROWS, partition=None,
+                state=None, end_time=None, period=None, clusters=None):
+    """Iterate over job DataFrames of at most chunk_rows rows."""
+    return query_jobs_iter(job_features,
+                           chunk_rows=chunk_rows,
+                           partition=partition,
+                           state=state,
+                           end_time=end_time,
+                           period=period,
+                           clusters=clusters)
 
 
 def _clean_node_df(node_df):
-    cpu_aiot = _split_aiot(node_df['CPUsState'])
+    cpu_aiot = split_aiot(node_df['CPUsState'])
     del node_df['CPUsState']
 
-    node_df['CPUAlloc'] = cpu_aiot[:, ALLOC]
-    node_df['CPUIdle'] = cpu_aiot[:, IDLE]
-    node_df['CPUOther'] = cpu_aiot[:, OTHER]
-    node_df['CPUTotal'] = cpu_aiot[:, TOTAL]
-
-    node_df['Memory'] = node_df['Memory'].astype(int)
-    node_df['AllocMem'] = node_df['AllocMem'].astype(int)
-    node_df['FreeMem'] = np.where(node_df['FreeMem'] == 'N/A',
-                                  0,
-                                  node_df['FreeMem']).astype(int)
+    for i, cpu_col in enumerate(CPU_COLUMNS):
+        node_df[cpu_col] = cpu_aiot[:, i]
 
     return node_df
 
 
-def _clean_job_df(job_df):
-    job_df['ReqCPUS'] = job_df['ReqCPUS'].astype(int)
-    job_df['AllocCPUS'] = job_df['AllocCPUS'].astype(int)
-    job_df['AllocNodes'] = job_df['AllocNodes'].astype(int)
-    job_df['Submit'] = pd.to_datetime(job_df['Submit'])
-    # job_df['Start'] = pd.to_datetime(job_df['Start'])
-    job_df['ElapsedRaw'] = job_df['ElapsedRaw'].astype(int)
-    job_df['CPUTimeRAW'] = job_df['CPUTimeRAW'].astype(int)
+def _clean_queue_df(queue_df):
+    for col in queue_df.columns:
+        if col.lower() in DURATION_FIELDS:
+            queue_df[col] = _to_timedelta(queue_df[col])
+
+    return queue_df
+
+
+def _to_timedelta(durations):
+    parts = durations.astype(object).str.extract(DURATION) \
+                     .astype(np.float64).fillna({'days': 0, 'hours': 0})
 
-    return job_df
+    return pd.to_timedelta(parts['days'], unit='D') + \
+        pd.to_timedelta(parts['hours'], unit='h') + \
+        pd.to_timedelta(parts['minutes'], unit='m') + \
+        pd.to_timedelta(parts['seconds'], unit='s')
 
 
-def _split_aiot(aiot):
-    return aiot.str.split('/', n=4, expand=True).astype(int).values
+@lru_cache(maxsize=MAX_MATCHERS)
+def _get_matcher(patterns):
+    return PatternMatcher(patterns)
 
 
 if __name__ == '__main__':
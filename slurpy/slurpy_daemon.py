@@ -5,15 +5,21 @@ from logging.handlers import RotatingFileHandler
 from apscheduler.schedulers.blocking import BlockingScheduler
 
 from argparse import ArgumentParser
+import asyncio
 from configparser import ConfigParser, ExtendedInterpolation
 
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from functools import wraps
-from os import remove, walk
+from functools import partial, wraps
+from os import remove, replace, scandir
 from os.path import join as path_join, expanduser, expandvars, \
-                            basename, splitext
+                            basename, dirname, exists, normpath, splitext
+import queue
+import re
 import signal
-from tarfile import open as tar_open
+import sys
+import threading
 from time import perf_counter as tick
 
 CONFIG_ROOT = '~/.config/slurpyd.ini'
@@ -22,6 +28,7 @@ MAIN_LOG = 'slurpyd'
 NODE_LOG = 'slurpyd.NodeTrack'
 MRGE_LOG = 'slurpyd.MergeNode'
 JOBS_LOG = 'slurpyd.JobOrders'
+QUEU_LOG = 'slurpyd.QueueTrack'
 
 VERBOSE_LEVEL = {1: logging.INFO,
                  2: logging.DEBUG}
@@ -43,16 +50,44 @@ COMPRESS_EXT = {'gzip':  'gz',
                 'bzip2': 'bz2',
                 'lzma':  'xz'}
 
+# strftime fields, most significant first. File names made from a
+# pattern using a leading run of these sort in time order
+ORDERED_FIELDS = ['%Y', '%m', '%d', '%H', '%M', '%S']
+# What flooring to each of ORDERED_FIELDS resets
+FLOOR_UNITS = [('month', 1), ('day', 1), ('hour', 0), ('minute', 0),
+               ('second', 0)]
+
+MANIFEST_FILE = '.manifest'
+
+# High-water mark of the job accounting written so far
+JOBS_MARK_FILE = '.sacct_mark'
+
+# Most snapshots held for the writer thread, and per batch it writes
+QUEUE_SIZE = 16
+BATCH_SIZE = 8
+
+# Seconds to wait for queued snapshots to be written on exit
+STOP_TIMEOUT_S = 30
+
+SEGMENT_FORMATS = ['segment', 'delta']
+
+ARCHIVE_FORMAT = {'tar':      '{}.tar.{}',
+                  'seekable': '{}.tar',
+                  'segment':  '{}.seg.{}'}
+
 STREAM_FMT = '{name:<18}: {levelname:<8} {message}'
 
 S_TO_MS = 1000
 
 INVALID_FEATURE = 20
 INVALID_PROPERTY = 21
+INVALID_FIELD = 22
 INVALID_FORMAT = 30
 
 WRITING_FILES = []
 COMPRESSING_FILES = []
+OPEN_APPENDERS = []
+OPEN_PIPELINES = []
 
 
 def main():
@@ -67,7 +102,10 @@ def main():
     log_config = config['Log']
     node_config = config['NodeTrack']
     merge_config = config['MergeNode']
-    job_config = config['JobOrders']
+    job_config = (config['JobOrders'] if config.has_section('JobOrders')
+                  else None)
+    queue_config = (config['QueueTrack'] if config.has_section('QueueTrack')
+                    else None)
 
     setup_loggers(args, log_config)
 
@@ -75,6 +113,7 @@ def main():
     nlog = get_slurpyd_logger(NODE_LOG)
     mlog = get_slurpyd_logger(MRGE_LOG)
     jlog = get_slurpyd_logger(JOBS_LOG)
+    qlog = get_slurpyd_logger(QUEU_LOG)
 
     slog.info("Starting slurpyd ...")
     slog.info("Writing logs to {}",
@@ -87,20 +126,59 @@ def main():
         nlog.exception("Invalid node feature in {}:", args.config_file)
         return INVALID_FEATURE
 
-    try:
-        slurpy.check_job_properties(job_config['properties'])
-    except ValueError as e:
-        jlog.exception("Invalid job property in {}:", args.config_file)
-        return INVALID_PROPERTY
+    if job_config is not None:
+        try:
+            slurpy.check_job_properties(job_config['properties'])
+        except ValueError as e:
+            jlog.exception("Invalid job property in {}:", args.config_file)
+            return INVALID_PROPERTY
+
+    if queue_config is not None:
+        try:
+            slurpy.check_queue_fields(queue_config['fields'])
+        except ValueError as e:
+            qlog.exception("Invalid queue field in {}:", args.config_file)
+            return INVALID_FIELD
 
     # Process writer/compressor information from config file
     try:
-        node_writer = df_writer(node_config['out_format'])
-    except KeyError as e:
+        node_writer = df_writer(node_config['out_format'],
+                                node_config.getint(
+                                    'keyframe_interval',
+                                    fallback=slurpy.delta.KEYFRAME_INTERVAL))
+    except (KeyError, ImportError) as e:
         nlog.exception("Invalid node format in {}:", args.config_file)
         return INVALID_FORMAT
 
-    merge_compressor = df_compressor('tar')
+    if job_config is not None:
+        # Parquet files are typed by node feature, so cannot hold jobs
+        if job_config['out_format'] == slurpy.columnar.PARQUET_EXT:
+            jlog.error("Invalid job format in {}: {} is for nodes only",
+                       args.config_file, job_config['out_format'])
+            return INVALID_FORMAT
+
+        job_writer = df_writer(job_config['out_format'])
+    else:
+        job_writer = None
+
+    if queue_config is not None:
+        if queue_config['out_format'] == slurpy.columnar.PARQUET_EXT:
+            qlog.error("Invalid queue format in {}: {} is for nodes only",
+                       args.config_file, queue_config['out_format'])
+            return INVALID_FORMAT
+
+        queue_writer = df_writer(queue_config['out_format'])
+    else:
+        queue_writer = None
+
+    # Segments are sealed in place of being tarred
+    merge_jobs = merge_config.getint('jobs', fallback=1)
+    if node_config['out_format'] in SEGMENT_FORMATS:
+        merge_compressor = df_compressor('segment')
+    elif merge_config.getboolean('seekable', fallback=False):
+        merge_compressor = df_compressor('seekable', merge_jobs)
+    else:
+        merge_compressor = df_compressor('tar', merge_jobs)
 
     # Print frequency information for jobs
     nlog.info("Will run every {} {}",
@@ -109,6 +187,14 @@ def main():
     mlog.info("Will run every {} {}",
               merge_config['frequency'], merge_config['units'])
 
+    if job_config is not None:
+        jlog.info("Will run every {} {}",
+                  job_config['frequency'], job_config['units'])
+
+    if queue_config is not None:
+        qlog.info("Will run every {} {}",
+                  queue_config['frequency'], queue_config['units'])
+
     # Change writers to none if a dry run is specified
     if args.dry_run:
         slog.info("--dry-run flag set, no files will be written")
@@ -116,67 +202,322 @@ def main():
         node_writer = df_writer('none')
         merge_compressor = df_compressor('none')
 
+        if job_writer is not None:
+            job_writer = df_writer('none')
+
+        if queue_writer is not None:
+            queue_writer = df_writer('none')
+
     else:
         nlog.info("Will write nodes to directory {} in {} format",
                   node_config['out_dir'],
                   node_config['out_format'])
 
         mlog.info("Will compress node files to directory {} using {} "
-                  "compression",
+                  "compression across {} job(s)",
                   merge_config['out_dir'],
-                  merge_config['out_compression'])
+                  merge_config['out_compression'],
+                  merge_jobs)
+
+        if job_config is not None:
+            jlog.info("Will write changed jobs to directory {} in {} "
+                      "format",
+                      job_config['out_dir'],
+                      job_config['out_format'])
+
+        if queue_config is not None:
+            qlog.info("Will write the queue to directory {} in {} format",
+                      queue_config['out_dir'],
+                      queue_config['out_format'])
+
+    # Node histories are appended to as snapshots are written, if
+    # history_dir is set
+    if 'history_dir' in node_config and not args.dry_run:
+        features = [feature.strip().lower()
+                    for feature in node_config['features'].split(',')]
+        if slurpy.history.NODE_HOST.lower() not in features:
+            nlog.error("Invalid node features in {}: history_dir needs {}",
+                       args.config_file, slurpy.history.NODE_HOST)
+            return INVALID_FEATURE
+
+        node_writer = _history_writer(
+            node_writer,
+            slurpy.history.HistoryStore(node_config['history_dir_sh']))
+
+        nlog.info("Will keep node histories in directory {}",
+                  node_config['history_dir'])
+
+    # node_track lists the files it writes, so merge_node need not
+    manifest = (Manifest(path_join(node_config['out_dir_sh'],
+                                   MANIFEST_FILE))
+                if node_config.getboolean('manifest', fallback=False) and
+                not args.dry_run else None)
+
+    # Snapshots are written from a queue, so slow disks do not hold up
+    # queries, if queue_size is set
+    queue_size = node_config.getint('queue_size', fallback=0)
+    if queue_size > 0:
+        pipeline = WritePipeline(nlog, node_writer, manifest,
+                                 max_queued=queue_size,
+                                 batch_size=node_config.getint(
+                                     'batch_size', fallback=BATCH_SIZE))
+        pipeline.start()
+
+        nlog.info("Will queue up to {} snapshot(s) for writing",
+                  queue_size)
+    else:
+        pipeline = None
+
+    # sacct is only asked for jobs active since the last poll written
+    if job_config is not None:
+        job_tracker = slurpy.JobTracker(
+            job_config['properties'],
+            state_path=(None if args.dry_run else
+                        path_join(job_config['out_dir_sh'],
+                                  JOBS_MARK_FILE)),
+            first_period=get_timedelta(job_config))
+    else:
+        job_tracker = None
+
+    if args.use_asyncio:
+        slog.info("Running jobs on an asyncio event loop")
+
+        asyncio.run(run_async(node_config, node_writer, merge_config,
+                              merge_compressor, job_config, job_writer,
+                              job_tracker, manifest, pipeline,
+                              queue_config, queue_writer))
+        return
+
+    # Collectors asking sinfo for nodes share one call per tick
+    node_planner = slurpy.NodeQueryPlanner()
+    node_planner.register(node_config['features'])
 
     # Assign jobs to scheduler
     scheduler = BlockingScheduler(timezone='Australia/Adelaide')
 
-    scheduler.add_job(node_track, args=[node_config, node_writer],
+    scheduler.add_job(node_track, args=[node_config, node_writer,
+                                        node_planner, manifest, pipeline],
                       max_instances=2,
                       trigger='cron',
                       **get_cron_freq(node_config))
 
     scheduler.add_job(merge_node, args=[node_config, merge_config,
                                         merge_compressor],
+                      kwargs={'manifest': manifest},
                       max_instances=2,
                       trigger='cron',
                       **get_cron_freq(merge_config))
 
+    # Overlapping polls would write the same changes twice
+    if job_config is not None:
+        scheduler.add_job(job_track, args=[job_config, job_writer,
+                                           job_tracker],
+                          max_instances=1,
+                          trigger='cron',
+                          **get_cron_freq(job_config))
+
+    if queue_config is not None:
+        scheduler.add_job(queue_track, args=[queue_config, queue_writer],
+                          max_instances=2,
+                          trigger='cron',
+                          **get_cron_freq(queue_config))
+
     # Start daemon process
     scheduler.start()
 
 
-def node_track(node_config, node_writer):
+def node_track(node_config, node_writer, node_planner=None, manifest=None,
+               pipeline=None):
     nlog = get_slurpyd_logger(NODE_LOG)
 
     nlog.info("Querying SLURM nodes")
-    node_filename = datetime.now().strftime(node_config['out_file'])
+    node_time = datetime.now()
+
+    query_nodes = (node_planner.query_nodes if node_planner
+                   else slurpy.query_nodes)
 
     node_time_s = tick()
-    rnode_df = slurpy.query_nodes(node_config['features'])
+    rnode_df = query_nodes(node_config['features'])
     node_time_s = tick() - node_time_s
 
     nlog.debug("Querying took {:.3f} ms", node_time_s*S_TO_MS)
 
+    save_nodes(node_config, node_writer, rnode_df, node_time, manifest,
+               pipeline)
+
+
+async def node_track_async(node_config, node_writer, executor=None,
+                           manifest=None, pipeline=None):
+    nlog = get_slurpyd_logger(NODE_LOG)
+
+    nlog.info("Querying SLURM nodes")
+    node_time = datetime.now()
+
+    node_time_s = tick()
+    rnode_df = await slurpy.query_nodes_async(node_config['features'],
+                                              executor)
+    node_time_s = tick() - node_time_s
+
+    nlog.debug("Querying took {:.3f} ms", node_time_s*S_TO_MS)
+
+    await asyncio.get_running_loop().run_in_executor(
+        executor, save_nodes, node_config, node_writer, rnode_df,
+        node_time, manifest, pipeline)
+
+
+def save_nodes(node_config, node_writer, rnode_df, node_time,
+               manifest=None, pipeline=None):
+    nlog = get_slurpyd_logger(NODE_LOG)
+
+    node_filename = node_time.strftime(node_config['out_file'])
     rnodes_path = path_join(node_config['out_dir_sh'], node_filename)
 
+    if pipeline is not None:
+        pipeline.put(rnode_df, rnodes_path, node_time)
+        return
+
     try:
-        node_writer(nlog, rnode_df, rnodes_path)
+        file_path = node_writer(nlog, rnode_df, rnodes_path, node_time)
     except FileNotFoundError:
         nlog.exception("Saving to {} failed:", node_config['out_dir'])
+        return
+
+    if manifest is not None and file_path:
+        manifest.add(basename(file_path))
+
+
+def job_track(job_config, job_writer, job_tracker):
+    jlog = get_slurpyd_logger(JOBS_LOG)
+
+    jlog.info("Querying SLURM jobs")
+    job_time = datetime.now()
+
+    job_time_s = tick()
+    job_df = job_tracker.poll()
+    job_time_s = tick() - job_time_s
+
+    jlog.debug("Querying took {:.3f} ms, {} job(s) changed",
+               job_time_s*S_TO_MS, len(job_df))
+
+    save_jobs(job_config, job_writer, job_tracker, job_df, job_time)
+
+
+async def job_track_async(job_config, job_writer, job_tracker,
+                          executor=None):
+    jlog = get_slurpyd_logger(JOBS_LOG)
+
+    jlog.info("Querying SLURM jobs")
+    job_time = datetime.now()
+
+    job_time_s = tick()
+    job_df = await job_tracker.poll_async(executor)
+    job_time_s = tick() - job_time_s
+
+    jlog.debug("Querying took {:.3f} ms, {} job(s) changed",
+               job_time_s*S_TO_MS, len(job_df))
+
+    await asyncio.get_running_loop().run_in_executor(
+        executor, save_jobs, job_config, job_writer, job_tracker, job_df,
+        job_time)
+
+
+def save_jobs(job_config, job_writer, job_tracker, job_df, job_time):
+    jlog = get_slurpyd_logger(JOBS_LOG)
+
+    job_filename = job_time.strftime(job_config['out_file'])
+    jobs_path = path_join(job_config['out_dir_sh'], job_filename)
+
+    try:
+        if len(job_df):
+            job_writer(jlog, job_df, jobs_path, job_time)
+
+        job_tracker.commit()
+    except FileNotFoundError:
+        jlog.exception("Saving to {} failed:", job_config['out_dir'])
+
+
+def queue_track(queue_config, queue_writer):
+    qlog = get_slurpyd_logger(QUEU_LOG)
+
+    qlog.info("Querying SLURM queue")
+    queue_time = datetime.now()
+
+    queue_time_s = tick()
+    queue_df = slurpy.get_queue_df(queue_config['fields'],
+                                   partition=queue_config.get('partition'))
+    queue_time_s = tick() - queue_time_s
+
+    return save_queue(queue_config, queue_writer, queue_df, queue_time,
+                      queue_time_s)
+
+
+async def queue_track_async(queue_config, queue_writer, executor=None):
+    qlog = get_slurpyd_logger(QUEU_LOG)
+
+    qlog.info("Querying SLURM queue")
+    queue_time = datetime.now()
+
+    queue_time_s = tick()
+    queue_df = await slurpy.get_queue_df_async(
+        queue_config['fields'], partition=queue_config.get('partition'),
+        executor=executor)
+    queue_time_s = tick() - queue_time_s
+
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, save_queue, queue_config, queue_writer, queue_df,
+        queue_time, queue_time_s)
+
+
+def save_queue(queue_config, queue_writer, queue_df, queue_time,
+               queue_time_s):
+    qlog = get_slurpyd_logger(QUEU_LOG)
+
+    qlog.debug("Querying took {:.3f} ms, {} job(s) queued{}",
+               queue_time_s*S_TO_MS, len(queue_df),
+               _queue_summary(queue_df))
+
+    queue_filename = queue_time.strftime(queue_config['out_file'])
+    queue_path = path_join(queue_config['out_dir_sh'], queue_filename)
+
+    try:
+        return queue_writer(qlog, queue_df, queue_path, queue_time)
+    except FileNotFoundError:
+        qlog.exception("Saving to {} failed:", queue_config['out_dir'])
+
+
+def _queue_summary(queue_df):
+    """Counts of jobs in each state, if the queue has a state column"""
+    state_col = next((col for col in queue_df.columns
+                      if col.lower() in ('state', 'statecompact')), None)
+
+    if state_col is None or not len(queue_df):
+        return ''
+
+    counts = queue_df[state_col].value_counts()
+    return ' ({})'.format(', '.join('{} {}'.format(count, state)
+                                    for state, count in counts.items()))
 
 
 def merge_node(node_config, merge_config, merge_compressor,
-               end_time_eval=datetime.now):
+               end_time_eval=datetime.now, manifest=None):
     mlog = get_slurpyd_logger(MRGE_LOG)
 
-    end_time = end_time_eval().replace(microsecond=0)
+    # Rolling files are named by their first time, so the window is
+    # aligned to them, or the file rolled into just before a merge would
+    # fall between windows
+    end_time = _floor_time(end_time_eval().replace(microsecond=0),
+                           node_config['out_file'])
     start_time = end_time - get_timedelta(merge_config)
 
     mlog.info("Gathering node files written from {:%Y-%m-%d %H:%M:%S} "
               "to {:%Y-%m-%d %H:%M:%S}",
               start_time, end_time)
 
+    _close_rolled(end_time, node_config)
+
     gather_time_s = tick()
-    tar_files = get_files_between(start_time, end_time, node_config)
+    tar_files = list(get_files_between(start_time, end_time, node_config,
+                                       manifest))
     gather_time_s = tick() - gather_time_s
 
     mlog.debug("Gathering took {:.3f} ms", gather_time_s*S_TO_MS)
@@ -185,7 +526,56 @@ def merge_node(node_config, merge_config, merge_compressor,
     tar_path = path_join(merge_config['out_dir_sh'], tar_filename)
     tar_compression = merge_config['out_compression']
 
-    merge_compressor(mlog, tar_files, tar_path, tar_compression)
+    merge_compressor(mlog, tar_files, tar_path, tar_compression,
+                     node_config['out_file'])
+
+    if manifest is not None:
+        manifest.prune()
+
+
+async def merge_node_async(node_config, merge_config, merge_compressor,
+                           executor=None, manifest=None):
+    # Gathering and compressing files is all disk and CPU bound
+    await asyncio.get_running_loop().run_in_executor(
+        executor, partial(merge_node, node_config, merge_config,
+                          merge_compressor, manifest=manifest))
+
+
+async def run_async(node_config, node_writer, merge_config,
+                    merge_compressor, job_config, job_writer, job_tracker,
+                    manifest=None, pipeline=None, queue_config=None,
+                    queue_writer=None):
+    """Run node_track, merge_node and, given a job_config and
+    queue_config, job_track and queue_track on one event loop, with
+    parsing, writing and compression on a thread pool"""
+    slog = get_slurpyd_logger(MAIN_LOG)
+
+    with ThreadPoolExecutor(thread_name_prefix='slurpyd') as executor:
+        scheduler = TickScheduler(slog)
+
+        scheduler.add_job(node_track_async, get_timedelta(node_config),
+                          args=[node_config, node_writer, executor,
+                                manifest, pipeline],
+                          max_instances=2)
+
+        scheduler.add_job(merge_node_async, get_timedelta(merge_config),
+                          args=[node_config, merge_config,
+                                merge_compressor, executor, manifest],
+                          max_instances=2)
+
+        if job_config is not None:
+            scheduler.add_job(job_track_async, get_timedelta(job_config),
+                              args=[job_config, job_writer, job_tracker,
+                                    executor],
+                              max_instances=1)
+
+        if queue_config is not None:
+            scheduler.add_job(queue_track_async,
+                              get_timedelta(queue_config),
+                              args=[queue_config, queue_writer, executor],
+                              max_instances=2)
+
+        await scheduler.run()
 
 
 def setup_loggers(args, log_config):
@@ -233,12 +623,22 @@ def read_config(config_file):
     log_config = config['Log']
     node_config = config['NodeTrack']
     merge_config = config['MergeNode']
-    job_config = config['JobOrders']
 
     log_config['output_sh'] = _expand_path(log_config['output'])
     node_config['out_dir_sh'] = _expand_path(node_config['out_dir'])
     merge_config['out_dir_sh'] = _expand_path(merge_config['out_dir'])
-    node_config['out_dir_sh'] = _expand_path(node_config['out_dir'])
+
+    if 'history_dir' in node_config:
+        node_config['history_dir_sh'] = _expand_path(
+            node_config['history_dir'])
+
+    if config.has_section('JobOrders'):
+        job_config = config['JobOrders']
+        job_config['out_dir_sh'] = _expand_path(job_config['out_dir'])
+
+    if config.has_section('QueueTrack'):
+        queue_config = config['QueueTrack']
+        queue_config['out_dir_sh'] = _expand_path(queue_config['out_dir'])
 
     return config
 
@@ -275,6 +675,11 @@ def get_timedelta(opt_config):
 def graceful_exit(signum, frame):
     slog = get_slurpyd_logger(MAIN_LOG)
 
+    # Let queued snapshots be written before cleaning up after writers
+    for pipeline in list(OPEN_PIPELINES):
+        slog.info("Writing {} queued snapshot(s)", pipeline.depth)
+        pipeline.stop(timeout=STOP_TIMEOUT_S)
+
     for file in WRITING_FILES:
         slog.error("slurpy failed to write {}, deleting...", file)
         remove(file)
@@ -283,6 +688,11 @@ def graceful_exit(signum, frame):
         slog.error("slurpy failed to compress {}, deleting...", file)
         remove(file)
 
+    for appender in OPEN_APPENDERS:
+        if appender.path:
+            slog.info("Closing {}", appender.path)
+        appender.close()
+
     slog.critical("slurpyd received signal {}, exiting...", signum)
 
     exit(signum)
@@ -308,6 +718,12 @@ def make_parser():
                         dest='dry_run',
                         help='run slurpyd without writing files')
 
+    parser.add_argument('--asyncio',
+                        action='store_true',
+                        dest='use_asyncio',
+                        help='run jobs on an asyncio event loop, '
+                             'instead of scheduler threads')
+
     parser.add_argument('-v', '--verbose',
                         action='count',
                         default=0,
@@ -322,17 +738,78 @@ def make_parser():
     return parser
 
 
-def get_files_between(start_time, end_time, opt_config):
-    for root, _, files in walk(opt_config['out_dir_sh']):
-        for file in sorted(files):
-            try:
-                file_time = datetime.strptime(_strip_ext(file),
-                                              opt_config['out_file'])
-            except ValueError:
-                continue
+def get_files_between(start_time, end_time, opt_config, manifest=None):
+    """Find files in out_dir named by out_file for times from start_time
+    up to end_time, in name order.
+
+    Only out_dir itself is searched, or only the files listed in
+    manifest, if given. When out_file names sort in time order, only
+    names within the bounds of the window are parsed."""
+    time_format = opt_config['out_file']
+
+    if manifest is not None:
+        files = manifest.names()
+    else:
+        with scandir(opt_config['out_dir_sh']) as entries:
+            files = [entry.name for entry in entries if entry.is_file()]
+
+    files.sort()
+
+    if _is_ordered(time_format):
+        # Bounds are padded, as a coarse pattern floors times
+        lower = bisect_left(files, start_time.strftime(time_format))
+        upper = bisect_left(files, end_time.strftime(time_format) +
+                            chr(sys.maxunicode))
+        files = files[lower:upper]
+
+    for file in files:
+        try:
+            file_time = datetime.strptime(_strip_ext(file), time_format)
+        except ValueError:
+            continue
+
+        file_path = path_join(opt_config['out_dir_sh'], file)
+
+        # Manifests can list files that have since been removed
+        if start_time <= file_time < end_time and \
+                (manifest is None or exists(file_path)):
+            yield file_path
+
 
-            if start_time <= file_time < end_time:
-                yield path_join(root, file)
+def _close_rolled(end_time, opt_config):
+    """Close rolling files node_track has moved past, whose names are no
+    longer those of end_time, so they are on disk, and readable, before
+    files are gathered"""
+    out_dir = normpath(opt_config['out_dir_sh'])
+    current = end_time.strftime(opt_config['out_file'])
+
+    for appender in OPEN_APPENDERS:
+        path = appender.path
+
+        if (path is not None and normpath(dirname(path)) == out_dir and
+                _strip_ext(basename(path)) != current):
+            appender.close()
+
+
+def _floor_time(time, time_format):
+    """Floor time to the finest time field of time_format, the time of
+    the file named by time"""
+    fields = re.findall(r'%.', time_format)
+    present = [i for i, field in enumerate(ORDERED_FIELDS)
+               if field in fields]
+
+    if not present:
+        return time
+
+    return time.replace(**dict(FLOOR_UNITS[max(present):]))
+
+
+def _is_ordered(time_format):
+    """Whether names made from time_format sort in time order"""
+    fields = [field for field in re.findall(r'%.', time_format)
+              if field != '%%']
+
+    return bool(fields) and fields == ORDERED_FIELDS[:len(fields)]
 
 
 def _strip_ext(path):
@@ -351,7 +828,7 @@ def _to_bytes(byte_str):
 
 def decorate_writer(_plain_writer):
     @wraps(_plain_writer)
-    def _decorated_writer(log, dataframe, output_path):
+    def _decorated_writer(log, dataframe, output_path, timestamp=None):
         WRITING_FILES.append(output_path)
         write_time_s = tick()
         _plain_writer(None, dataframe, output_path)
@@ -363,8 +840,18 @@ def decorate_writer(_plain_writer):
     return _decorated_writer
 
 
-def df_writer(method):
-    def write_method(log, dataframe, path):
+def df_writer(method, keyframe_interval=slurpy.delta.KEYFRAME_INTERVAL):
+    if method == slurpy.columnar.PARQUET_EXT:
+        return _parquet_writer(slurpy.columnar.SnapshotAppender())
+
+    if method == 'segment':
+        return _segment_writer(slurpy.segment.SegmentWriter())
+
+    if method == 'delta':
+        return _segment_writer(slurpy.segment.SegmentWriter(
+            keyframe_interval=keyframe_interval))
+
+    def write_method(log, dataframe, path, timestamp=None):
         file_path = '{}.{}'.format(path, method)
         _log_write(log, file_path)
         _writer = {'csv':  _csv_writer,
@@ -373,6 +860,75 @@ def df_writer(method):
                    'none': _none_writer}.get(method)
 
         _writer(log, dataframe, file_path)
+        return file_path
+
+    return write_method
+
+
+def _parquet_writer(appender):
+    """Append snapshots to rolling Parquet files, one per distinct path.
+
+    How often files roll over is set by the granularity of out_file,
+    e.g. rnodes-%Y%m%d_%H rolls over hourly."""
+    OPEN_APPENDERS.append(appender)
+
+    def write_method(log, dataframe, path, timestamp=None):
+        file_path = '{}.{}'.format(path, slurpy.columnar.PARQUET_EXT)
+        if file_path != appender.path:
+            _log_write(log, file_path)
+
+        append_time_s = tick()
+        appender.append(file_path, dataframe, timestamp or datetime.now())
+        append_time_s = tick() - append_time_s
+
+        log.debug("Appending took {:.3f} ms", append_time_s*S_TO_MS)
+        return file_path
+
+    return write_method
+
+
+def _history_writer(node_writer, store):
+    """Write snapshots with node_writer, then append them to a history
+    store, which buffers them and writes them out every so often"""
+    OPEN_APPENDERS.append(store)
+
+    def write_method(log, dataframe, path, timestamp=None):
+        file_path = node_writer(log, dataframe, path, timestamp)
+
+        # The snapshot is already written, whatever becomes of its history
+        append_time_s = tick()
+        try:
+            store.append(timestamp or datetime.now(), dataframe)
+        except Exception:
+            log.exception("Adding to history in {} failed:", store.path)
+            return file_path
+        append_time_s = tick() - append_time_s
+
+        log.debug("Adding to history took {:.3f} ms",
+                  append_time_s*S_TO_MS)
+        return file_path
+
+    return write_method
+
+
+def _segment_writer(writer):
+    """Append snapshots to open segments, one per distinct path.
+
+    How often segments roll over is set by the granularity of out_file,
+    e.g. rnodes-%Y%m%d_%H rolls over hourly."""
+    OPEN_APPENDERS.append(writer)
+
+    def write_method(log, dataframe, path, timestamp=None):
+        file_path = '{}.{}'.format(path, slurpy.segment.SEGMENT_EXT)
+        if file_path != writer.path:
+            _log_write(log, file_path)
+
+        append_time_s = tick()
+        writer.append(file_path, dataframe, timestamp or datetime.now())
+        append_time_s = tick() - append_time_s
+
+        log.debug("Appending took {:.3f} ms", append_time_s*S_TO_MS)
+        return file_path
 
     return write_method
 
@@ -399,11 +955,12 @@ def _none_writer(log, dataframe, output_path):
 
 def decorate_compressor(_plain_compressor):
     @wraps(_plain_compressor)
-    def _decorated_compressor(log, files, output_path, ext, filter):
+    def _decorated_compressor(log, files, output_path, ext, filter,
+                              time_format=None, jobs=1):
         COMPRESSING_FILES.append(output_path)
         compress_time_s = tick()
         num_files = _plain_compressor(None, files, output_path, ext,
-                                      filter)
+                                      filter, time_format, jobs)
         compress_time_s = tick() - compress_time_s
         COMPRESSING_FILES.pop()
 
@@ -413,10 +970,11 @@ def decorate_compressor(_plain_compressor):
     return _decorated_compressor
 
 
-def df_compressor(method):
-    def compress_method(log, files, path, compression):
+def df_compressor(method, jobs=1):
+    def compress_method(log, files, path, compression, time_format=None):
         ext = COMPRESS_EXT.get(compression)
-        file_path = '{}.tar.{}'.format(path, ext)
+        archive_format = ARCHIVE_FORMAT.get(method, ARCHIVE_FORMAT['tar'])
+        file_path = archive_format.format(path, ext)
         tar_name = basename(path)
 
         def _tarball_file(tarinfo):
@@ -424,27 +982,77 @@ def df_compressor(method):
             return tarinfo
 
         _log_write(log, file_path)
-        _compressor = {'tar':  _tar_compressor,
-                       'none': _none_compressor}.get(method)
+        _compressor = {'tar':      _tar_compressor,
+                       'seekable': _seekable_compressor,
+                       'segment':  _segment_compressor,
+                       'none':     _none_compressor}.get(method)
 
-        _compressor(log, files, file_path, ext, _tarball_file)
+        _compressor(log, files, file_path, ext, _tarball_file, time_format,
+                    jobs)
 
     return compress_method
 
 
 @decorate_compressor
-def _tar_compressor(log, files, output_path, ext, filter):
-    num_files = 0
-    with tar_open(output_path, mode='w:{}'.format(ext)) as tar_file:
-        for file in files:
-            tar_file.add(file, filter=filter)
-            remove(file)
-            num_files += 1
+def _tar_compressor(log, files, output_path, ext, filter, time_format=None,
+                    jobs=1):
+    return _write_archive(files, output_path, ext, filter, time_format,
+                          jobs, seekable=False)
+
+
+@decorate_compressor
+def _seekable_compressor(log, files, output_path, ext, filter,
+                         time_format=None, jobs=1):
+    return _write_archive(files, output_path, ext, filter, time_format,
+                          jobs, seekable=True)
+
 
-    return num_files
+def _write_archive(files, output_path, ext, filter, time_format, jobs,
+                   seekable):
+    """Tar up files with a time index, add them to the catalog of the
+    output directory, then remove them"""
+    files = _closed_files(files)
+    file_times = [_file_time(file, time_format) for file in files]
 
+    index = slurpy.archive.write_archive(output_path, files, file_times,
+                                         ext, seekable=seekable,
+                                         filter=filter, jobs=jobs)
+    slurpy.archive.update_catalog(output_path, index)
 
-def _none_compressor(log, files, output_path, ext, filter):
+    for file in files:
+        remove(file)
+
+    return len(files)
+
+
+def _closed_files(files):
+    # Never archive, then remove, a file node_track is still appending to
+    open_paths = {appender.path for appender in OPEN_APPENDERS}
+
+    return [file for file in files if file not in open_paths]
+
+
+def _file_time(file, time_format):
+    try:
+        return datetime.strptime(_strip_ext(basename(file)), time_format)
+    except (TypeError, ValueError):
+        return None
+
+
+@decorate_compressor
+def _segment_compressor(log, files, output_path, ext, filter,
+                        time_format=None, jobs=1):
+    segment_paths = [file for file in _closed_files(files)
+                     if slurpy.segment.is_segment(file)]
+
+    if segment_paths:
+        slurpy.segment.seal_segments(segment_paths, output_path)
+
+    return len(segment_paths)
+
+
+def _none_compressor(log, files, output_path, ext, filter,
+                     time_format=None, jobs=1):
     return 0
 
 
@@ -452,6 +1060,250 @@ def _log_write(log, path):
     log.info("Writing file to {}", basename(path))
 
 
+class Manifest(object):
+    """Manifest object
+
+    File of the names of files node_track has written, one per line,
+    in the order they were first written to."""
+    def __init__(self, path):
+        super(Manifest, self).__init__()
+
+        self._path = path
+        self._last_name = None
+        self._lock = threading.Lock()
+
+    def add(self, name):
+        with self._lock:
+            # Rolling files are written to many times in a row
+            if name == self._last_name:
+                return
+
+            with open(self._path, mode='a') as manifest_file:
+                manifest_file.write(name + '\n')
+
+            self._last_name = name
+
+    def names(self):
+        with self._lock:
+            return self._read()
+
+    def prune(self):
+        """Drop names of files that no longer exist, e.g. once merged"""
+        directory = dirname(self._path)
+
+        with self._lock:
+            kept = [name for name in self._read()
+                    if exists(path_join(directory, name))]
+
+            tmp_path = '{}.tmp'.format(self._path)
+            with open(tmp_path, mode='w') as manifest_file:
+                manifest_file.writelines(name + '\n' for name in kept)
+            replace(tmp_path, self._path)
+
+    def _read(self):
+        try:
+            with open(self._path) as manifest_file:
+                names = manifest_file.read().splitlines()
+        except FileNotFoundError:
+            return []
+
+        return list(dict.fromkeys(name for name in names if name))
+
+
+class WritePipeline(object):
+    """WritePipeline object
+
+    Bounded queue of node snapshots drained by a writer thread, so
+    node_track only queries SLURM and queues what it gets. The writer
+    takes up to batch_size queued snapshots at a time and writes them in
+    order with node_writer, adding the files written to manifest, if
+    given.
+
+    Snapshots queued while max_queued are waiting are dropped, not
+    blocked on, and counted. The queue depth, lag behind the oldest
+    snapshot written, and drop count are logged with each batch."""
+    _STOP = object()
+
+    def __init__(self, log, node_writer, manifest=None,
+                 max_queued=QUEUE_SIZE, batch_size=BATCH_SIZE):
+        super(WritePipeline, self).__init__()
+
+        self._log = log
+        self._node_writer = node_writer
+        self._manifest = manifest
+        self._batch_size = batch_size
+
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._thread = threading.Thread(target=self._run,
+                                        name='slurpyd-writer', daemon=True)
+        self._lock = threading.Lock()
+
+        self.queued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.peak_depth = 0
+
+    @property
+    def depth(self):
+        """Number of snapshots waiting to be written"""
+        return self._queue.qsize()
+
+    def start(self):
+        OPEN_PIPELINES.append(self)
+        self._thread.start()
+
+    def put(self, dataframe, path, timestamp):
+        """Queue a snapshot taken at timestamp to be written to path.
+
+        Returns whether it was queued, rather than dropped."""
+        try:
+            self._queue.put_nowait((dataframe, path, timestamp))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                dropped = self.dropped
+
+            self._log.warning("Write queue full, dropped snapshot from "
+                              "{:%Y-%m-%d %H:%M:%S} ({} dropped so far)",
+                              timestamp, dropped)
+            return False
+
+        with self._lock:
+            self.queued += 1
+            self.peak_depth = max(self.peak_depth, self._queue.qsize())
+
+        return True
+
+    def stop(self, timeout=None):
+        """Write the snapshots still queued, then stop the writer.
+
+        Returns whether the writer stopped within timeout seconds."""
+        if self._thread.is_alive():
+            # One deadline covers both queueing the stop and the join
+            deadline = None if timeout is None else tick() + timeout
+            try:
+                self._queue.put(self._STOP, timeout=timeout)
+            except queue.Full:
+                pass
+
+            if deadline is not None:
+                timeout = max(0, deadline - tick())
+            self._thread.join(timeout)
+
+        if self in OPEN_PIPELINES:
+            OPEN_PIPELINES.remove(self)
+
+        self._log.info("Queued {} snapshot(s): wrote {}, dropped {}, "
+                       "failed {}",
+                       self.queued, self.written, self.dropped, self.failed)
+
+        return not self._thread.is_alive()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while batch[-1] is not self._STOP and \
+                    len(batch) < self._batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = batch[-1] is self._STOP
+            if stopping:
+                batch.pop()
+
+            if batch:
+                self._write(batch)
+
+            if stopping:
+                return
+
+    def _write(self, batch):
+        lag_s = (datetime.now() - batch[0][2]).total_seconds()
+
+        write_time_s = tick()
+        for dataframe, path, timestamp in batch:
+            try:
+                file_path = self._node_writer(self._log, dataframe, path,
+                                              timestamp)
+            except Exception:
+                self.failed += 1
+                self._log.exception("Saving to {} failed:", dirname(path))
+                continue
+
+            self.written += 1
+            if self._manifest is not None and file_path:
+                self._manifest.add(basename(file_path))
+        write_time_s = tick() - write_time_s
+
+        self._log.debug("Wrote {} snapshot(s) in {:.3f} ms, {:.3f} s "
+                        "behind; {} queued (peak {}), {} dropped",
+                        len(batch), write_time_s*S_TO_MS, lag_s,
+                        self.depth, self.peak_depth, self.dropped)
+
+
+class TickScheduler(object):
+    """TickScheduler object
+
+    Runs coroutine functions on one event loop, each every period, at
+    ticks aligned to whole multiples of period since midnight, as the
+    cron triggers of the blocking scheduler are. Each wait is timed from
+    the wall clock, so ticks do not drift, and an idle job costs one
+    sleeping task.
+
+    Ticks missed while the loop is held up are skipped, as are ticks
+    while max_instances runs of a job are still going, with a warning.
+    Jobs that raise are logged and run again next tick."""
+    def __init__(self, log):
+        super(TickScheduler, self).__init__()
+
+        self._log = log
+        self._jobs = []
+
+    def add_job(self, func, period, args=(), kwargs=None, max_instances=1):
+        if period <= timedelta(0):
+            raise ValueError('{} must run every positive period, not {}'
+                             .format(func.__name__, period))
+
+        self._jobs.append((func, period, args, kwargs or {}, max_instances))
+
+    async def run(self):
+        await asyncio.gather(*(self._run_job(*job) for job in self._jobs))
+
+    async def _run_job(self, func, period, args, kwargs, max_instances):
+        running = set()
+
+        tick_time = _next_tick(datetime.now(), period)
+        while True:
+            await asyncio.sleep(max(
+                (tick_time - datetime.now()).total_seconds(), 0))
+
+            if len(running) < max_instances:
+                task = asyncio.ensure_future(func(*args, **kwargs))
+                task.add_done_callback(partial(self._done, func, running))
+                running.add(task)
+            else:
+                self._log.warning("Skipping {}, {} run(s) still going",
+                                  func.__name__, len(running))
+
+            tick_time = _next_tick(max(datetime.now(), tick_time), period)
+
+    def _done(self, func, running, task):
+        running.discard(task)
+
+        if not task.cancelled() and task.exception() is not None:
+            self._log.error("{} failed:", func.__name__,
+                            exc_info=task.exception())
+
+
+def _next_tick(time, period):
+    """First multiple of period since midnight after time"""
+    midnight = time.replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight + ((time - midnight) // period + 1) * period
+
+
 class FormatAdapter(logging.LoggerAdapter):
     def __init__(self, logger, extra=None):
         super(FormatAdapter, self).__init__(logger, extra or {})
@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+FAKE_BIN = os.path.join(os.path.dirname(__file__), 'bin')
+FAKE_NOW = '2017-08-23T12:00:00'
+
+
+@pytest.fixture
+def fake_slurm(monkeypatch):
+    """Put the SLURM stand-ins in tests/bin first on the PATH"""
+    monkeypatch.setenv('PATH', os.pathsep.join([FAKE_BIN,
+                                                os.environ['PATH']]))
+    monkeypatch.setenv('FAKE_SACCT_NOW', FAKE_NOW)
+
+
+@pytest.fixture
+def slurm_calls(fake_slurm, monkeypatch, tmp_path):
+    """Return a function listing the SLURM stand-in calls made so far"""
+    calls_path = tmp_path / 'slurm_calls'
+    monkeypatch.setenv('FAKE_SLURM_CALLS', str(calls_path))
+
+    def calls():
+        return (calls_path.read_text().splitlines()
+                if calls_path.exists() else [])
+
+    return calls
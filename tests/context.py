@@ -4,5 +4,15 @@ sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), '..')))
 
 # Modules needed for tests
 import slurpy.cl as cl
+import slurpy.slurpy as slurpy
+import slurpy.aggregate as aggregate
+import slurpy.analysis as analysis
+import slurpy.archive as archive
+import slurpy.cache as cache
+import slurpy.columnar as columnar
+import slurpy.delta as delta
+import slurpy.history as history
+import slurpy.matcher as matcher
+import slurpy.segment as segment
 import slurpy.slurm as slurm
 import slurpy.slurpy_daemon as slurpy_daemon
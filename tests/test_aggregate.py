@@ -0,0 +1,197 @@
+from context import aggregate, slurm
+
+import datetime
+from glob import glob
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+import pytest
+
+NODE_DIR = os.path.join(os.path.dirname(__file__), 'rnodes-20170823_000000')
+
+NODE_FMT = 'rnodes-%Y%m%d_%H%M%S'
+
+
+@pytest.fixture(scope='module')
+def snapshots():
+    return [(_csv_timestamp(csv_path), pd.read_csv(csv_path))
+            for csv_path in sorted(glob(os.path.join(NODE_DIR, '*.csv')))]
+
+
+@pytest.fixture(scope='module')
+def cpus_state(snapshots):
+    return pd.concat([snapshot['CPUsState'] for _, snapshot in snapshots],
+                     ignore_index=True)
+
+
+def test_split_aiot(cpus_state):
+    cpu_aiot = slurm.split_aiot(cpus_state)
+
+    assert cpu_aiot.shape == (len(cpus_state), 4)
+    assert cpu_aiot.dtype == np.int32
+    assert np.all(cpu_aiot == _legacy_split_aiot(cpus_state))
+    assert np.all(cpu_aiot[:, slurm.TOTAL] ==
+                  cpu_aiot[:, :slurm.TOTAL].sum(axis=1))
+
+
+@pytest.mark.parametrize('aiot', [['1/2/3'], ['1/2/3/4/5'], ['1/2/3/4', '']])
+def test_split_aiot_invalid(aiot):
+    with pytest.raises(ValueError):
+        slurm.split_aiot(aiot)
+
+
+def test_split_aiot_empty():
+    assert slurm.split_aiot([]).shape == (0, 4)
+
+
+def test_filter_nodes(snapshots):
+    node_agg = aggregate.NodeAggregator(r'r[1-4]n[0-9]{2}')
+    all_agg = aggregate.NodeAggregator()
+
+    for _, snapshot in snapshots:
+        rnodes = node_agg.filter_nodes(snapshot)
+
+        assert rnodes['NodeHost'].str.match(r'r[1-4]n').all()
+        assert len(all_agg.filter_nodes(snapshot)) == len(snapshot)
+
+
+def test_column_buffer():
+    buffer = aggregate.ColumnBuffer(capacity=2)
+    buffer.add_column('Timestamp', aggregate.TIMESTAMP_DTYPE)
+    buffer.add_column('Count', aggregate.METRIC_DTYPE)
+
+    for i in range(5):
+        buffer.append(Timestamp=datetime.datetime(2017, 8, 23, 0, 0, i),
+                      Count=i)
+
+    frame = buffer.to_frame(index='Timestamp')
+
+    assert len(buffer) == 5
+    assert list(frame['Count']) == list(range(5))
+    assert frame.index.dtype == aggregate.TIMESTAMP_DTYPE
+    assert np.shares_memory(frame['Count'].values, buffer.column('Count'))
+
+
+@pytest.mark.parametrize('reverse', [False, True])
+def test_node_aggregator(snapshots, reverse):
+    node_agg = aggregate.NodeAggregator(r'r[1-4]n[0-9]{2}')
+
+    for timestamp, snapshot in (snapshots[::-1] if reverse else snapshots):
+        node_agg.agg(timestamp, snapshot)
+
+    agg_df = node_agg.to_frame()
+
+    assert len(agg_df) == len(snapshots)
+    assert agg_df.index.is_monotonic_increasing
+    assert (agg_df.dtypes == aggregate.METRIC_DTYPE).all()
+    assert (agg_df['TotalCPUs'] == agg_df['AllocCPUs'] +
+            agg_df['IdleCPUs'] + agg_df['OtherCPUs']).all()
+
+
+def test_node_aggregator_state(snapshots):
+    node_agg = _aggregate(snapshots)
+
+    state = node_agg.state()
+
+    assert (state['Count'] == 1).all()
+    assert (state['AllocCPUs_sum'] == state['AllocCPUs_min']).all()
+    assert (state['AllocCPUs_sum'] == state['AllocCPUs_max']).all()
+    assert pickle.loads(pickle.dumps(state)).equals(state)
+
+
+def test_node_aggregator_merge(snapshots):
+    serial_df = _aggregate(snapshots).to_frame()
+
+    # Shards overlap on one snapshot, which is then averaged with itself
+    shards = [snapshots[:6], snapshots[5:11], snapshots[11:]]
+
+    left = _aggregate(shards[0])
+    middle = _aggregate(shards[1])
+    left.merge(middle)
+    left.merge(_aggregate(shards[2]))
+
+    right = _aggregate(shards[1])
+    right.merge(_aggregate(shards[2]).state())
+    right_first = _aggregate(shards[0])
+    right_first.merge(right)
+
+    reverse = _aggregate(shards[2])
+    for shard in shards[1::-1]:
+        reverse.merge(_aggregate(shard))
+
+    for node_agg in [left, right_first, reverse]:
+        assert node_agg.to_frame().equals(serial_df)
+
+    assert node_agg.state()['Count'].sum() == len(snapshots) + 1
+
+
+@pytest.mark.parametrize('reverse', [False, True])
+def test_node_aggregator_rollups(snapshots, reverse):
+    raw_df = _aggregate(snapshots).to_frame()
+    node_agg = _aggregate(snapshots[::-1] if reverse else snapshots,
+                          rollups=['1m', '5m'])
+
+    for rollup, freq in [('1m', '1min'), ('5m', '5min')]:
+        rollup_df = node_agg.to_frame(rollup)
+        expected = raw_df.resample(freq).agg(['mean', 'min', 'max', 'last'])
+        expected.columns = ['_'.join(col) for col in expected.columns]
+
+        assert len(rollup_df) < len(raw_df)
+        assert_frame_equal(rollup_df, expected, check_dtype=False,
+                           check_names=False, check_freq=False)
+
+
+def test_node_aggregator_rollups_incremental(snapshots):
+    node_agg = _aggregate(snapshots, rollups=['1m'])
+
+    # In-order snapshots update the newest bucket in place
+    assert len(node_agg._rollups['1m']._buffer) == 3
+    assert node_agg.state('1m')['Count'].sum() == len(snapshots)
+
+
+def test_node_aggregator_rollups_merge(snapshots):
+    serial_df = _aggregate(snapshots, rollups=['1m']).to_frame('1m')
+
+    left = _aggregate(snapshots[6:], rollups=['1m'])
+    left.merge(_aggregate(snapshots[:6], rollups=['1m']))
+
+    right = _aggregate(snapshots[6:], rollups=['1m'])
+    right.merge(_aggregate(snapshots[:6], rollups=['1m']).state('1m'), '1m')
+
+    assert left.to_frame('1m').equals(serial_df)
+    assert right.to_frame('1m').equals(serial_df)
+
+
+@pytest.mark.parametrize('label,resolution',
+                         [('30s', datetime.timedelta(seconds=30)),
+                          ('5m', datetime.timedelta(minutes=5)),
+                          ('1d', datetime.timedelta(days=1))])
+def test_parse_resolution(label, resolution):
+    assert aggregate.parse_resolution(label) == resolution
+
+
+@pytest.mark.parametrize('label', ['', '5', 'm', '0m', '1w', '1.5h'])
+def test_parse_resolution_invalid(label):
+    with pytest.raises(ValueError):
+        aggregate.parse_resolution(label)
+
+
+def _aggregate(snapshots, rollups=None):
+    node_agg = aggregate.NodeAggregator(r'r[1-4]n[0-9]{2}', rollups)
+
+    for timestamp, snapshot in snapshots:
+        node_agg.agg(timestamp, snapshot)
+
+    return node_agg
+
+
+def _csv_timestamp(csv_path):
+    file_name = os.path.splitext(os.path.basename(csv_path))[0]
+    return datetime.datetime.strptime(file_name, NODE_FMT)
+
+
+def _legacy_split_aiot(aiot):
+    return aiot.str.split('/', n=4, expand=True).astype(int).values
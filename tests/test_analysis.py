@@ -0,0 +1,162 @@
+from context import analysis, archive, columnar, history, segment
+
+from glob import glob
+import datetime
+import os
+import tarfile
+
+import pandas as pd
+import pytest
+
+NODE_DIR = os.path.join(os.path.dirname(__file__), 'rnodes-20170823_000000')
+
+NODE_FMT = 'rnodes-%Y%m%d_%H%M%S'
+
+SPLIT = 6
+
+
+@pytest.fixture
+def archives(tmp_path):
+    csv_paths = sorted(glob(os.path.join(NODE_DIR, '*.csv')))
+
+    return [_make_archive(tmp_path, 'all', csv_paths),
+            _make_archive(tmp_path, 'part0', csv_paths[:SPLIT]),
+            _make_archive(tmp_path, 'part1', csv_paths[SPLIT:])]
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_aggregate_archives(archives, jobs):
+    all_path, part0_path, part1_path = archives
+
+    serial_df = analysis.aggregate_archives([all_path]).to_frame()
+    merged_df = analysis.aggregate_archives([part1_path, part0_path],
+                                            jobs=jobs).to_frame()
+
+    assert len(serial_df) == 16
+    assert merged_df.equals(serial_df)
+
+
+def test_aggregate_archives_rollups(archives):
+    all_path, part0_path, part1_path = archives
+
+    serial = analysis.aggregate_archives([all_path], rollups=['1m', '5m'])
+    merged = analysis.aggregate_archives([part1_path, part0_path], jobs=2,
+                                         rollups=['1m', '5m'])
+
+    assert merged.rollups == ['1m', '5m']
+    assert len(merged.to_frame('1m')) == 3
+    for rollup in [None, '1m', '5m']:
+        assert merged.to_frame(rollup).equals(serial.to_frame(rollup))
+
+
+def test_aggregate_parquet(archives, tmp_path):
+    pytest.importorskip('pyarrow')
+
+    csv_paths = sorted(glob(os.path.join(NODE_DIR, '*.csv')))
+    parquet_paths = [_make_parquet(tmp_path, 'part0', csv_paths[:SPLIT]),
+                     _make_parquet(tmp_path, 'part1', csv_paths[SPLIT:])]
+    tar_path = str(tmp_path / 'parquet.tar.bz2')
+    with tarfile.open(tar_path, mode='w:bz2') as tar_file:
+        for parquet_path in parquet_paths:
+            tar_file.add(parquet_path,
+                         arcname=os.path.basename(parquet_path))
+
+    serial_df = analysis.aggregate_archives(archives[:1]).to_frame()
+
+    for paths in [parquet_paths, [tar_path]]:
+        agg_df = analysis.aggregate_archives(paths).to_frame()
+        assert agg_df.equals(serial_df)
+
+
+def test_aggregate_segments(archives, tmp_path):
+    csv_paths = sorted(glob(os.path.join(NODE_DIR, '*.csv')))
+    segment_paths = [str(tmp_path / 'part{}.seg'.format(i)) for i in range(2)]
+    writer = segment.SegmentWriter()
+
+    for i, csv_path in enumerate(csv_paths):
+        file_name = os.path.splitext(os.path.basename(csv_path))[0]
+        writer.append(segment_paths[i >= SPLIT], pd.read_csv(csv_path),
+                      datetime.datetime.strptime(file_name, NODE_FMT))
+
+    writer.close()
+
+    sealed_path = str(tmp_path / 'part0.seg.xz')
+    segment.seal_segments(segment_paths[:1], sealed_path)
+
+    serial_df = analysis.aggregate_archives(archives[:1]).to_frame()
+    agg_df = analysis.aggregate_archives([segment_paths[1],
+                                          sealed_path]).to_frame()
+
+    assert agg_df.equals(serial_df)
+
+
+def test_aggregate_seekable_archive(archives, tmp_path):
+    csv_paths = sorted(glob(os.path.join(NODE_DIR, '*.csv')))
+    timestamps = [datetime.datetime.strptime(
+        os.path.splitext(os.path.basename(csv_path))[0], NODE_FMT)
+        for csv_path in csv_paths]
+
+    seekable_path = str(tmp_path / 'seekable.tar')
+    archive.write_archive(seekable_path, csv_paths, timestamps, 'xz',
+                          seekable=True)
+
+    serial_df = analysis.aggregate_archives(archives[:1]).to_frame()
+    agg_df = analysis.aggregate_archives([seekable_path]).to_frame()
+
+    assert agg_df.equals(serial_df)
+
+
+def test_aggregate_archives_missing(archives, tmp_path):
+    missing_path = str(tmp_path / 'missing.tar.bz2')
+
+    agg_df = analysis.aggregate_archives([archives[0],
+                                          missing_path]).to_frame()
+
+    assert len(agg_df) == 16
+
+
+def test_ingest_history(archives, tmp_path):
+    all_path, part0_path, part1_path = archives
+    store_dir = str(tmp_path / 'history')
+
+    analysis.ingest_history([part1_path, part0_path], store_dir)
+    node_df = history.node_history('r2n14', datetime.datetime(2017, 8, 22),
+                                   datetime.datetime(2017, 8, 24),
+                                   store_dir=store_dir)
+
+    assert len(node_df) == 16
+    assert node_df.index.is_monotonic_increasing
+
+
+def test_expand_paths(archives, tmp_path):
+    pattern = str(tmp_path / 'part*.tar.bz2')
+    missing = str(tmp_path / 'missing*.tar.bz2')
+
+    paths = analysis.expand_paths([pattern, missing])
+
+    assert paths == archives[1:] + [missing]
+
+
+def _make_archive(tmp_path, name, csv_paths):
+    archive_path = str(tmp_path / '{}.tar.bz2'.format(name))
+
+    with tarfile.open(archive_path, mode='w:bz2') as tar_file:
+        for csv_path in csv_paths:
+            tar_file.add(csv_path,
+                         arcname=os.path.join(name,
+                                              os.path.basename(csv_path)))
+
+    return archive_path
+
+
+def _make_parquet(tmp_path, name, csv_paths):
+    parquet_path = str(tmp_path / '{}.parquet'.format(name))
+    appender = columnar.SnapshotAppender()
+
+    for csv_path in csv_paths:
+        file_name = os.path.splitext(os.path.basename(csv_path))[0]
+        appender.append(parquet_path, pd.read_csv(csv_path),
+                        datetime.datetime.strptime(file_name, NODE_FMT))
+
+    appender.close()
+    return parquet_path
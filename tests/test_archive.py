@@ -0,0 +1,158 @@
+from context import archive
+
+import bz2
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+from glob import glob
+import os
+import shutil
+import tarfile
+
+import pandas as pd
+import pytest
+
+NODE_DIR = os.path.join(os.path.dirname(__file__), 'rnodes-20170823_000000')
+
+NODE_FMT = 'rnodes-%Y%m%d_%H%M%S'
+
+SPLIT = 6
+
+
+@pytest.fixture
+def node_files(tmp_path):
+    node_dir = tmp_path / 'nodes'
+    node_dir.mkdir()
+
+    csv_paths = sorted(glob(os.path.join(NODE_DIR, '*.csv')))
+    for csv_path in csv_paths:
+        shutil.copy(csv_path, str(node_dir))
+
+    return [(str(node_dir / os.path.basename(csv_path)),
+             _csv_timestamp(csv_path)) for csv_path in csv_paths]
+
+
+@pytest.fixture(params=[False, True], ids=['tar', 'seekable'])
+def archives(request, node_files, tmp_path):
+    """Two catalogued archives, split at SPLIT"""
+    seekable = request.param
+    archive_fmt = '{}.tar' if seekable else '{}.tar.bz2'
+
+    archive_paths = []
+    for name, files in [('part0', node_files[:SPLIT]),
+                        ('part1', node_files[SPLIT:])]:
+        archive_path = str(tmp_path / archive_fmt.format(name))
+        paths, timestamps = zip(*files)
+
+        index = archive.write_archive(archive_path, paths, timestamps, 'bz2',
+                                      seekable=seekable)
+        archive.update_catalog(archive_path, index)
+        archive_paths.append(archive_path)
+
+    return archive_paths
+
+
+def test_write_archive(archives, node_files):
+    index = archive.read_index(archives[0])
+
+    assert list(index['Timestamp']) == [timestamp for _, timestamp
+                                        in node_files[:SPLIT]]
+
+    # Offsets point straight at each member's data
+    with tarfile.open(archives[0]) as tar_file:
+        for member, offset, size in zip(index['Member'], index['Offset'],
+                                        index['Size']):
+            tarinfo = tar_file.getmember(member)
+
+            assert tarinfo.offset_data == offset
+            assert tarinfo.size == size
+
+
+@pytest.mark.parametrize('ext', ['gz', 'bz2', 'xz'])
+@pytest.mark.parametrize('seekable', [False, True])
+def test_write_archive_parallel(node_files, tmp_path, monkeypatch, ext,
+                                seekable):
+    # Small blocks, so the tarball is compressed as many streams
+    monkeypatch.setattr(archive, 'BLOCK_SIZE', 16384)
+    paths, timestamps = zip(*node_files)
+
+    serial_path = str(tmp_path / 'serial.tar.{}'.format(ext))
+    parallel_path = str(tmp_path / 'parallel.tar.{}'.format(ext))
+    archive.write_archive(serial_path, paths, timestamps, ext,
+                          seekable=seekable)
+    archive.write_archive(parallel_path, paths, timestamps, ext,
+                          seekable=seekable, jobs=3)
+
+    assert archive.read_index(parallel_path).equals(
+        archive.read_index(serial_path))
+
+    serial = list(archive.iter_snapshots(serial_path))
+    parallel = list(archive.iter_snapshots(parallel_path))
+
+    assert len(parallel) == len(node_files)
+    for (serial_time, serial_df), (parallel_time, parallel_df) in zip(
+            serial, parallel):
+        assert parallel_time == serial_time
+        assert parallel_df.equals(serial_df)
+
+
+def test_block_compressor(tmp_path):
+    data = bytes(range(256)) * 1000
+    path = str(tmp_path / 'blocks.bz2')
+
+    with ThreadPoolExecutor(max_workers=2) as pool, \
+            open(path, mode='wb') as out_file, \
+            archive.BlockCompressor(out_file, 'bz2', pool,
+                                    block_size=10000) as block_file:
+        for i in range(0, len(data), 3000):
+            block_file.write(data[i:i + 3000])
+
+        assert block_file.tell() == len(data)
+
+    with bz2.open(path) as in_file:
+        assert in_file.read() == data
+
+
+def test_read_catalog(archives, tmp_path):
+    catalog = archive.read_catalog(str(tmp_path))
+
+    assert list(catalog['Archive']) == [os.path.basename(path)
+                                        for path in archives]
+    assert list(catalog['Members']) == [SPLIT, 16 - SPLIT]
+    assert (catalog['Start'] <= catalog['End']).all()
+
+
+@pytest.mark.parametrize('start,end,num_archives',
+                         [(None, None, 2),
+                          ('2017-08-23 00:00:00', '2017-08-23 00:00:05', 1),
+                          ('2017-08-23 00:00:00', '2017-08-23 00:00:30', 2),
+                          ('2017-08-23 00:00:30', None, 1),
+                          (None, '2017-08-22 23:00:00', 0)])
+def test_find_archives(archives, tmp_path, start, end, num_archives):
+    archive_paths = archive.find_archives(str(tmp_path),
+                                          start and pd.Timestamp(start),
+                                          end and pd.Timestamp(end))
+
+    assert len(archive_paths) == num_archives
+
+
+def test_iter_snapshots(archives, node_files):
+    snapshots = list(archive.iter_snapshots(archives))
+
+    assert [timestamp for timestamp, _ in snapshots] == \
+        [timestamp for _, timestamp in node_files]
+    assert snapshots[0][1].equals(pd.read_csv(os.path.join(
+        NODE_DIR, os.path.basename(node_files[0][0]))))
+
+
+def test_read_snapshots_between(archives, node_files, tmp_path):
+    start_time, end_time = node_files[4][1], node_files[9][1]
+
+    nodes = archive.read_snapshots(str(tmp_path), start_time, end_time)
+
+    assert sorted(nodes['SnapshotTime'].unique()) == \
+        [timestamp for _, timestamp in node_files[4:9]]
+
+
+def _csv_timestamp(csv_path):
+    file_name = os.path.splitext(os.path.basename(csv_path))[0]
+    return datetime.datetime.strptime(file_name, NODE_FMT)
@@ -0,0 +1,253 @@
+from context import cache, slurm
+from conftest import FAKE_NOW
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+
+import pandas as pd
+
+PROPERTIES = ['JobIDRaw', 'State', 'AllocCPUS', 'Submit', 'ElapsedRaw']
+
+PERIOD = datetime.timedelta(hours=6)
+LATER = datetime.timedelta(minutes=90)
+
+
+def test_job_cache(fake_slurm, tmp_path):
+    now = _parse_time(FAKE_NOW)
+    job_cache = cache.JobCache(str(tmp_path), now_eval=lambda: now)
+
+    jobs = slurm.query_jobs(PROPERTIES, end_time=now, period=PERIOD)
+    cold_jobs = job_cache.query_jobs(PROPERTIES, end_time=now,
+                                     period=PERIOD)
+    warm_jobs = job_cache.query_jobs(PROPERTIES, end_time=now,
+                                     period=PERIOD)
+
+    assert len(list(tmp_path.glob('*/*.pkl'))) == 5
+    assert _by_id(cold_jobs).equals(_by_id(jobs))
+    assert _by_id(warm_jobs).equals(_by_id(jobs))
+
+
+def test_job_cache_refresh(fake_slurm, monkeypatch, tmp_path):
+    now = _parse_time(FAKE_NOW)
+    job_cache = cache.JobCache(str(tmp_path), now_eval=lambda: now)
+    job_cache.query_jobs(PROPERTIES, end_time=now, period=PERIOD)
+
+    # Jobs running at FAKE_NOW have finished by now
+    now += LATER
+    monkeypatch.setenv('FAKE_SACCT_NOW', now.strftime(slurm.DATE_FORMAT))
+
+    jobs = slurm.query_jobs(PROPERTIES, end_time=now, period=PERIOD)
+    cached_jobs = job_cache.query_jobs(PROPERTIES, end_time=now,
+                                       period=PERIOD)
+
+    assert _by_id(cached_jobs).equals(_by_id(jobs))
+
+
+def test_job_cache_refresh_chunks(slurm_calls, monkeypatch, tmp_path):
+    monkeypatch.setattr(cache, 'JOB_IDS_PER_QUERY', 3)
+
+    now = _parse_time(FAKE_NOW)
+    job_cache = cache.JobCache(str(tmp_path), now_eval=lambda: now)
+    job_cache.query_jobs(PROPERTIES, end_time=now, period=PERIOD)
+
+    now += LATER
+    monkeypatch.setenv('FAKE_SACCT_NOW', now.strftime(slurm.DATE_FORMAT))
+
+    jobs = slurm.query_jobs(PROPERTIES, end_time=now, period=PERIOD)
+    cached_jobs = job_cache.query_jobs(PROPERTIES, end_time=now,
+                                       period=PERIOD)
+
+    id_lists = [call.split(' -j ')[1].split()[0].split(',')
+                for call in slurm_calls() if ' -j ' in call]
+
+    assert len(id_lists) > 1
+    assert max(len(ids) for ids in id_lists) <= 3
+    assert _by_id(cached_jobs).equals(_by_id(jobs))
+
+
+def test_job_cache_pending(monkeypatch, tmp_path):
+    """A pending job is only cached in buckets from its submission on"""
+    now = _parse_time('2017-08-23T13:00:00')
+    end_time = now - datetime.timedelta(hours=1)
+    jobs = [{'JobIDRaw': '1', 'State': 'COMPLETED',
+             'Submit': '2017-08-23T06:10:00', 'Start': '2017-08-23T06:10:00',
+             'End': '2017-08-23T07:00:00'},
+            {'JobIDRaw': '2', 'State': 'PENDING',
+             'Submit': '2017-08-23T09:30:00', 'Start': 'Unknown',
+             'End': 'Unknown'}]
+
+    # Stands in for sacct, returning every job whatever the window
+    def query_jobs(header, job_ids=None, **kwargs):
+        raw = ''.join(slurm.DELIM.join(job.get(col, '1') for col in header) +
+                      '\n' for job in jobs
+                      if job_ids is None or job['JobIDRaw'] in job_ids)
+        return slurm._extract_typed_data(raw, header,
+                                         slurm.JOB_PROPERTY_TYPES,
+                                         sep=slurm.DELIM)
+
+    monkeypatch.setattr(cache, 'query_jobs', query_jobs)
+
+    job_cache = cache.JobCache(str(tmp_path), now_eval=lambda: now)
+
+    def bucket_ids():
+        return [list(pd.read_pickle(path)['JobIDRaw'])
+                for path in sorted(tmp_path.glob('*/*.pkl'))]
+
+    job_cache.query_jobs(PROPERTIES, end_time=end_time, period=PERIOD)
+
+    assert bucket_ids() == [['1'], [], [], ['2'], ['2'], ['2']]
+
+    # Once started, it leaves the buckets it was only pending in
+    jobs[1].update(State='RUNNING', Start='2017-08-23T10:15:00')
+    cached_jobs = job_cache.query_jobs(PROPERTIES, end_time=end_time,
+                                       period=PERIOD)
+
+    assert bucket_ids() == [['1'], [], [], [], ['2'], ['2']]
+    assert list(cached_jobs['JobIDRaw']) == ['1', '2']
+
+
+def test_job_cache_clusters(fake_slurm, monkeypatch, tmp_path):
+    now = _parse_time(FAKE_NOW)
+    job_cache = cache.JobCache(str(tmp_path), now_eval=lambda: now)
+    job_cache.query_jobs(PROPERTIES, partition='cpu,gpu', clusters='a,b',
+                         end_time=now, period=PERIOD)
+
+    now += LATER
+    monkeypatch.setenv('FAKE_SACCT_NOW', now.strftime(slurm.DATE_FORMAT))
+
+    jobs = slurm.query_jobs(PROPERTIES, partition='cpu,gpu', clusters='a,b',
+                            end_time=now, period=PERIOD)
+    cached_jobs = job_cache.query_jobs(PROPERTIES, partition='cpu,gpu',
+                                       clusters='a,b', end_time=now,
+                                       period=PERIOD)
+
+    assert list(cached_jobs.columns) == PROPERTIES + ['Partition', 'Cluster']
+    assert set(cached_jobs['Cluster']) == {'a', 'b'}
+    assert _by_id(cached_jobs).equals(_by_id(jobs))
+
+    job_tracker = cache.JobTracker(PROPERTIES, clusters='a,b',
+                                   now_eval=lambda: now)
+    tracked_jobs = job_tracker.poll()
+
+    assert list(tracked_jobs.columns) == PROPERTIES + ['Cluster']
+    assert (tracked_jobs['Cluster'].value_counts() ==
+            len(tracked_jobs) // 2).all()
+
+
+def test_query_cache(fake_slurm):
+    now = _parse_time(FAKE_NOW)
+    query_cache = cache.QueryCache(ttl=60, max_entries=1)
+
+    jobs = query_cache.query_jobs(PROPERTIES, end_time=now, period=PERIOD)
+    jobs['ElapsedRaw'] = 0
+    cached_jobs = query_cache.query_jobs(PROPERTIES, end_time=now,
+                                         period=PERIOD)
+
+    assert (query_cache.hits, query_cache.misses) == (1, 1)
+    assert cached_jobs['ElapsedRaw'].sum() > 0
+
+    # Evicts the first query
+    query_cache.query_jobs(PROPERTIES, end_time=now, period=LATER)
+    query_cache.query_jobs(PROPERTIES, end_time=now, period=PERIOD)
+
+    assert len(query_cache) == 1
+    assert query_cache.misses == 3
+
+    query_cache.invalidate()
+
+    assert len(query_cache) == 0
+
+
+def test_query_cache_expiry(fake_slurm):
+    now = _parse_time(FAKE_NOW)
+    clock_time = [0.0]
+    query_cache = cache.QueryCache(ttl=5, clock=lambda: clock_time[0])
+
+    query_cache.query_jobs(PROPERTIES, end_time=now, period=PERIOD)
+    clock_time[0] = 10.0
+    query_cache.query_jobs(PROPERTIES, end_time=now, period=PERIOD)
+
+    assert query_cache.misses == 2
+
+
+def test_query_cache_shared(fake_slurm, monkeypatch):
+    monkeypatch.setenv('FAKE_SACCT_LATENCY', '2')
+    now = _parse_time(FAKE_NOW)
+    query_cache = cache.QueryCache()
+
+    def query(_):
+        return query_cache.query_jobs(PROPERTIES, end_time=now,
+                                      period=PERIOD)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(query, range(4)))
+
+    assert query_cache.misses == 1
+    assert all(jobs.equals(results[0]) for jobs in results)
+
+
+def test_job_tracker(fake_slurm, monkeypatch, tmp_path):
+    now = _parse_time(FAKE_NOW)
+    clock = [now]
+    state_path = str(tmp_path / 'mark')
+    job_tracker = cache.JobTracker(PROPERTIES, state_path=state_path,
+                                   now_eval=lambda: clock[0])
+
+    first_jobs = job_tracker.poll()
+    job_tracker.commit()
+
+    jobs = slurm.query_jobs(PROPERTIES, end_time=now,
+                            period=cache.FIRST_PERIOD)
+    assert _by_id(first_jobs).equals(_by_id(jobs))
+    assert job_tracker.high_water_mark == now
+
+    # Only ElapsedRaw has changed
+    assert job_tracker.poll().empty
+
+    clock[0] = now + LATER
+    monkeypatch.setenv('FAKE_SACCT_NOW',
+                       clock[0].strftime(slurm.DATE_FORMAT))
+
+    later_jobs = job_tracker.poll()
+    seen = later_jobs['JobIDRaw'].isin(first_jobs['JobIDRaw'])
+
+    assert seen.any() and not seen.all()
+    assert (later_jobs['State'][seen] == 'COMPLETED').all()
+
+    # Uncommitted polls are repeated
+    assert _by_id(job_tracker.poll()).equals(_by_id(later_jobs))
+    job_tracker.commit()
+    assert job_tracker.poll().empty
+
+    restarted = cache.JobTracker(PROPERTIES, state_path=state_path)
+    assert restarted.high_water_mark == clock[0]
+
+
+def test_job_tracker_tuple(fake_slurm):
+    now = _parse_time(FAKE_NOW)
+    properties = tuple(prop for prop in PROPERTIES if prop != 'JobIDRaw')
+    job_tracker = cache.JobTracker(properties, now_eval=lambda: now)
+
+    jobs = job_tracker.poll()
+
+    assert len(jobs) > 0
+    assert list(jobs.columns) == list(properties)
+
+
+def test_job_tracker_async(fake_slurm):
+    now = _parse_time(FAKE_NOW)
+    job_tracker = cache.JobTracker(PROPERTIES, now_eval=lambda: now)
+
+    jobs = asyncio.run(job_tracker.poll_async())
+
+    assert _by_id(jobs).equals(_by_id(job_tracker.poll()))
+
+
+def _parse_time(time_str):
+    return datetime.datetime.strptime(time_str, slurm.DATE_FORMAT)
+
+
+def _by_id(jobs):
+    by = [col for col in ['Cluster', 'JobIDRaw'] if col in jobs]
+    return jobs.sort_values(by).reset_index(drop=True)
@@ -7,3 +7,8 @@ def test_query_nodes():
 
 def test_query_jobs():
     assert cl.query_jobs(minutes=5) == 0
+
+
+def test_query_main(fake_slurm):
+    assert cl.query_nodes_main(['cpu']) == 0
+    assert cl.query_jobs_main(['5', 'minutes', 'cpu']) == 0
@@ -0,0 +1,111 @@
+from context import columnar, slurm
+
+import datetime
+from glob import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+NODE_DIR = os.path.join(os.path.dirname(__file__), 'rnodes-20170823_000000')
+
+NODE_FMT = 'rnodes-%Y%m%d_%H%M%S'
+
+
+@pytest.fixture(scope='module')
+def snapshots():
+    return [(_csv_timestamp(csv_path), pd.read_csv(csv_path))
+            for csv_path in sorted(glob(os.path.join(NODE_DIR, '*.csv')))]
+
+
+def test_to_table(snapshots):
+    _, snapshot = snapshots[0]
+
+    table = columnar.to_table(snapshot)
+
+    assert table.num_rows == len(snapshot)
+    assert 'CPUsState' not in table.column_names
+    assert str(table.schema.field('NodeHost').type).startswith('dictionary')
+    for col in slurm.CPU_COLUMNS + ['Memory', 'AllocMem', 'FreeMem']:
+        assert str(table.schema.field(col).type) == 'int32'
+
+
+def test_snapshot_appender(snapshots, tmp_path):
+    paths = [str(tmp_path / 'part{}.parquet'.format(i)) for i in range(2)]
+    appender = columnar.SnapshotAppender(row_group_rows=100)
+
+    for i, (timestamp, snapshot) in enumerate(snapshots):
+        appender.append(paths[i // 8], snapshot, timestamp)
+
+    appender.close()
+
+    nodes = pd.concat([columnar.read_snapshots(path) for path in paths],
+                      ignore_index=True)
+
+    assert len(nodes) == sum(len(snapshot) for _, snapshot in snapshots)
+    assert nodes['NodeHost'].dtype == 'category'
+    assert nodes['CPUTotal'].dtype == np.int32
+    assert nodes['SnapshotTime'].nunique() == len(snapshots)
+
+    for (timestamp, snapshot), (read_time, read_df) in zip(
+            snapshots, [pair for path in paths
+                        for pair in columnar.iter_snapshots(path)]):
+        cpu_aiot = slurm.split_aiot(snapshot['CPUsState'])
+
+        assert read_time == timestamp
+        assert list(read_df['NodeHost']) == list(snapshot['NodeHost'])
+        assert np.all(read_df[slurm.CPU_COLUMNS].values == cpu_aiot)
+
+
+def test_snapshot_appender_resume(snapshots, tmp_path):
+    path = str(tmp_path / 'nodes.parquet')
+
+    for half in [snapshots[:8], snapshots[8:]]:
+        appender = columnar.SnapshotAppender()
+        for timestamp, snapshot in half:
+            appender.append(path, snapshot, timestamp)
+        appender.close()
+
+    timestamps = [timestamp for timestamp, _ in columnar.iter_snapshots(path)]
+
+    assert timestamps == [timestamp for timestamp, _ in snapshots]
+    assert os.listdir(str(tmp_path)) == ['nodes.parquet']
+
+
+def test_snapshot_appender_orphan(snapshots, tmp_path):
+    path = tmp_path / 'nodes.parquet'
+    path.write_text('not parquet')
+
+    timestamp, snapshot = snapshots[0]
+    appender = columnar.SnapshotAppender()
+    appender.append(str(path), snapshot, timestamp)
+    appender.close()
+
+    assert len(columnar.read_snapshots(str(path))) == len(snapshot)
+    assert (tmp_path / 'nodes.parquet.orphan').read_text() == 'not parquet'
+
+
+def test_read_snapshots_between(snapshots, tmp_path):
+    path = str(tmp_path / 'nodes.parquet')
+    appender = columnar.SnapshotAppender()
+
+    for timestamp, snapshot in snapshots:
+        appender.append(path, snapshot, timestamp)
+    appender.close()
+
+    start_time, end_time = snapshots[2][0], snapshots[5][0]
+    nodes = columnar.read_snapshots(path, columns=['NodeHost'],
+                                    start_time=start_time,
+                                    end_time=end_time)
+
+    assert list(nodes.columns) == ['SnapshotTime', 'NodeHost']
+    assert sorted(nodes['SnapshotTime'].unique()) == \
+        [timestamp for timestamp, _ in snapshots[2:5]]
+
+
+def _csv_timestamp(csv_path):
+    file_name = os.path.splitext(os.path.basename(csv_path))[0]
+    return datetime.datetime.strptime(file_name, NODE_FMT)
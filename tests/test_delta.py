@@ -0,0 +1,148 @@
+from context import delta, segment
+
+import datetime
+from glob import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+NODE_DIR = os.path.join(os.path.dirname(__file__), 'rnodes-20170823_000000')
+
+NODE_FMT = 'rnodes-%Y%m%d_%H%M%S'
+
+KEYFRAME_INTERVAL = 5
+
+
+@pytest.fixture(scope='module')
+def snapshots():
+    return [(_csv_timestamp(csv_path), pd.read_csv(csv_path))
+            for csv_path in sorted(glob(os.path.join(NODE_DIR, '*.csv')))]
+
+
+@pytest.fixture
+def delta_segments(snapshots, tmp_path):
+    """Two open, delta encoded segments of eight snapshots each"""
+    paths = [str(tmp_path / 'part{}.seg'.format(i)) for i in range(2)]
+    writer = segment.SegmentWriter(keyframe_interval=KEYFRAME_INTERVAL)
+
+    for i, (timestamp, snapshot) in enumerate(snapshots):
+        writer.append(paths[i // 8], snapshot, timestamp)
+
+    writer.close()
+    return paths
+
+
+def test_encode_decode(snapshots):
+    encoder = delta.DeltaEncoder(KEYFRAME_INTERVAL)
+    decoder = delta.DeltaDecoder()
+
+    kinds = []
+    for _, snapshot in snapshots:
+        record = encoder.encode(snapshot).to_csv(index=False).encode()
+        encoder.commit()
+
+        kinds.append(delta.is_delta(record))
+        assert decoder.decode(record).equals(snapshot)
+
+    assert kinds == [i % KEYFRAME_INTERVAL != 0
+                     for i in range(len(snapshots))]
+
+
+def test_encode_changes():
+    encoder = delta.DeltaEncoder()
+    previous = pd.DataFrame({'NodeHost': ['r1n01', 'r1n02', 'r1n03'],
+                             'StateCompact': ['idle', 'mix', 'idle'],
+                             'FreeMem': [100, 200, np.nan]})
+    current = previous.assign(FreeMem=[100, 150, np.nan])
+
+    encoder.encode(previous)
+    encoder.commit()
+    change = encoder.encode(current)
+
+    assert list(change.columns) == [delta.ROW, 'FreeMem']
+    assert list(change[delta.ROW]) == [1]
+
+    # Until committed, snapshots are encoded against the last one
+    assert encoder.encode(current).equals(change)
+
+    encoder.commit()
+    assert encoder.encode(current).shape == (0, 1)
+
+    # New rows start a keyframe
+    assert encoder.encode(current.iloc[:2]).equals(current.iloc[:2])
+
+
+def test_encode_moves():
+    encoder = delta.DeltaEncoder()
+    decoder = delta.DeltaDecoder()
+    previous = pd.DataFrame({'NodeHost': ['r1n01', 'r1n02', 'r1n03'],
+                             'StateCompact': ['down', 'idle', 'idle'],
+                             'Memory': [1, 2, 3]})
+
+    # r1n03 goes down, and sinfo lists it with the other down nodes
+    current = pd.DataFrame({'NodeHost': ['r1n01', 'r1n03', 'r1n02'],
+                            'StateCompact': ['down', 'down', 'idle'],
+                            'Memory': [1, 3, 2]})
+
+    for snapshot in [previous, current]:
+        record = encoder.encode(snapshot).to_csv(index=False).encode()
+        encoder.commit()
+        decoded = decoder.decode(record)
+
+    change = delta._read_text(record)
+
+    assert list(change.columns) == [delta.ROW, delta.FROM, 'StateCompact']
+    assert list(change[delta.FROM]) == ['2', '1']
+    assert decoded.equals(current)
+
+
+def test_decode_without_keyframe():
+    decoder = delta.DeltaDecoder()
+
+    with pytest.raises(ValueError):
+        decoder.decode('{},FreeMem\n0,100\n'.format(delta.ROW).encode())
+
+
+def test_delta_segments(snapshots, delta_segments):
+    read = list(segment.iter_snapshots(delta_segments))
+
+    assert [timestamp for timestamp, _ in read] == \
+        [timestamp for timestamp, _ in snapshots]
+    for (_, snapshot), (_, read_df) in zip(snapshots, read):
+        assert read_df.equals(snapshot)
+
+    assert sum(os.path.getsize(path) for path in delta_segments) < \
+        sum(len(snapshot.to_csv(index=False)) for _, snapshot in snapshots)
+
+
+def test_delta_segments_between(snapshots, delta_segments, tmp_path):
+    sealed_path = str(tmp_path / 'nodes.seg.bz2')
+    segment.seal_segments(delta_segments, sealed_path)
+
+    # Snapshot 6 is rebuilt from the keyframe at snapshot 5
+    start_time, end_time = snapshots[6][0], snapshots[12][0]
+    read = list(segment.iter_snapshots(sealed_path, start_time, end_time))
+
+    assert [timestamp for timestamp, _ in read] == \
+        [timestamp for timestamp, _ in snapshots[6:12]]
+    for (_, snapshot), (_, read_df) in zip(snapshots[6:12], read):
+        assert read_df.equals(snapshot)
+
+
+def test_snapshot_at(snapshots, delta_segments):
+    timestamp, snapshot = snapshots[7]
+
+    found_time, found = segment.snapshot_at(
+        delta_segments, timestamp + datetime.timedelta(seconds=1))
+
+    assert found_time == timestamp
+    assert found.equals(snapshot)
+    assert segment.snapshot_at(delta_segments, datetime.datetime(2017, 1, 1)) \
+        is None
+
+
+def _csv_timestamp(csv_path):
+    file_name = os.path.splitext(os.path.basename(csv_path))[0]
+    return datetime.datetime.strptime(file_name, NODE_FMT)
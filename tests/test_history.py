@@ -0,0 +1,141 @@
+from context import history, slurm
+
+import datetime
+from glob import glob
+import os
+
+import pandas as pd
+import pytest
+
+NODE_DIR = os.path.join(os.path.dirname(__file__), 'rnodes-20170823_000000')
+
+NODE_FMT = 'rnodes-%Y%m%d_%H%M%S'
+
+NODE = 'r2n14'
+
+START = datetime.datetime(2017, 8, 22)
+END = datetime.datetime(2017, 8, 24)
+
+
+@pytest.fixture(scope='module')
+def snapshots():
+    return [(_csv_timestamp(csv_path), pd.read_csv(csv_path))
+            for csv_path in sorted(glob(os.path.join(NODE_DIR, '*.csv')))]
+
+
+@pytest.fixture
+def store_dir(snapshots, tmp_path):
+    store = history.HistoryStore(str(tmp_path / 'history'),
+                                 flush_snapshots=5)
+
+    for timestamp, snapshot in snapshots:
+        store.append(timestamp, snapshot)
+
+    store.close()
+    return store.path
+
+
+def test_node_history(snapshots, store_dir):
+    node_df = history.node_history(NODE, START, END, store_dir=store_dir)
+
+    assert list(node_df.index) == [timestamp for timestamp, _ in snapshots]
+    assert list(node_df.columns) == [history.NODE_HOST] + history.FIELDS
+    assert (node_df[history.NODE_HOST] == NODE).all()
+    assert node_df['CPUAlloc'].dtype == 'Int32'
+
+    for (_, snapshot), (_, row) in zip(snapshots, node_df.iterrows()):
+        expected = snapshot[snapshot['NodeHost'] == NODE].iloc[0]
+        cpu_aiot = slurm.split_aiot(pd.Series([expected['CPUsState']]))[0]
+
+        assert list(row[slurm.CPU_COLUMNS]) == list(cpu_aiot)
+        assert row['Memory'] == expected['Memory']
+        assert row['StateCompact'] == expected['StateCompact']
+
+
+def test_node_history_fields(snapshots, store_dir):
+    start_time = snapshots[4][0]
+    end_time = snapshots[8][0]
+
+    node_df = history.node_history([NODE, 'r1n32'], start_time, end_time,
+                                   fields=['FreeMem', 'CPUAlloc'],
+                                   store_dir=store_dir)
+
+    assert list(node_df.columns) == [history.NODE_HOST, 'FreeMem', 'CPUAlloc']
+    assert list(node_df[history.NODE_HOST].unique()) == [NODE, 'r1n32']
+    assert len(node_df) == 8
+
+    # r1n32 reports FreeMem as N/A
+    assert node_df.loc[node_df[history.NODE_HOST] == 'r1n32',
+                       'FreeMem'].isna().all()
+
+
+def test_node_history_missing(store_dir):
+    node_df = history.node_history('r9n99', START, END, store_dir=store_dir)
+
+    assert node_df.empty
+    assert list(node_df.columns) == [history.NODE_HOST] + history.FIELDS
+
+    with pytest.raises(ValueError):
+        history.node_history(NODE, START, END, fields=['Weight'],
+                             store_dir=store_dir)
+
+
+def test_append_again(snapshots, store_dir):
+    """Snapshots appended twice, or after a crash, are read back once"""
+    timestamp, snapshot = snapshots[0]
+    changed = snapshot.assign(FreeMem=0)
+
+    store = history.HistoryStore(store_dir)
+    store.append(timestamp, changed)
+    store.close()
+
+    day = timestamp.strftime(history.CHUNK_FORMAT)
+    chunk_path = history._chunk_path(store_dir, day, 0)
+    with open(chunk_path, mode='ab') as chunk_file:
+        chunk_file.write(b'\0' * 5)
+
+    store = history.HistoryStore(store_dir)
+    store.append(snapshots[1][0], snapshots[1][1])
+    store.close()
+
+    node_df = history.node_history(NODE, START, END, store_dir=store_dir)
+
+    assert len(node_df) == len(snapshots)
+    assert node_df['FreeMem'].iloc[0] == 0
+    assert os.path.getsize(chunk_path) % history.RECORD_DTYPE.itemsize == 0
+
+
+def test_two_writers(snapshots, tmp_path):
+    """Stores appending to one directory agree on node and state ids"""
+    store_dir = str(tmp_path / 'history')
+    first = history.HistoryStore(store_dir)
+    second = history.HistoryStore(store_dir)
+
+    # Each store sees the nodes, and so numbers them, in its own order
+    for timestamp, snapshot in snapshots[:4]:
+        first.append(timestamp, snapshot)
+    for timestamp, snapshot in snapshots[4:8]:
+        second.append(timestamp, snapshot.iloc[::-1])
+
+    first.flush()
+    second.flush()
+
+    for timestamp, snapshot in snapshots[8:]:
+        first.append(timestamp, snapshot.iloc[::-1])
+
+    first.close()
+    second.close()
+
+    node_df = history.node_history(NODE, START, END, store_dir=store_dir)
+
+    assert len(node_df) == len(snapshots)
+    for (_, snapshot), (_, row) in zip(snapshots, node_df.iterrows()):
+        expected = snapshot[snapshot['NodeHost'] == NODE].iloc[0]
+
+        assert row['Memory'] == expected['Memory']
+        assert row['StateCompact'] == expected['StateCompact']
+
+
+def _csv_timestamp(csv_path):
+    file_name = os.path.splitext(os.path.basename(csv_path))[0]
+    return datetime.datetime.strptime(file_name, NODE_FMT)
@@ -0,0 +1,48 @@
+from context import matcher, slurpy
+
+import numpy as np
+import pandas as pd
+import pytest
+
+NODE_HOSTS = pd.Series(['r1n01', 'r4n99', 'r5n01', 'lm1', 'xr2n10y',
+                        None, 'r1n01'])
+
+STATES = pd.Series(['alloc', 'mix', 'down*', 'drain*', 'idle', 'mix'])
+
+
+@pytest.mark.parametrize('anchored,expected', [
+    (False, [True, True, False, False, True, False, True]),
+    (True, [True, True, False, False, False, False, True])])
+def test_pattern_matcher(anchored, expected):
+    node_matcher = matcher.PatternMatcher(r'r[1-4]n[0-9]{2}',
+                                          anchored=anchored)
+
+    assert list(node_matcher.match(NODE_HOSTS)) == expected
+    # Second pass is served from remembered results
+    assert list(node_matcher.match(NODE_HOSTS)) == expected
+
+
+def test_pattern_matcher_empty():
+    node_matcher = matcher.PatternMatcher(['lm', 'highmem'])
+
+    assert len(node_matcher.match(pd.Series([], dtype=str))) == 0
+    assert not node_matcher.match(pd.Series([None, np.nan])).any()
+
+
+@pytest.mark.parametrize('exclude', [False, True])
+def test_filter_df(exclude):
+    df = pd.DataFrame({'StateCompact': STATES})
+    patterns = ['down', 'drain']
+
+    filtered = slurpy.filter_df(df, 'StateCompact', patterns, exclude)
+    legacy_filtered = _legacy_filter_df(df, 'StateCompact', patterns,
+                                        exclude)
+
+    assert filtered.equals(legacy_filtered)
+
+
+def _legacy_filter_df(df, column, patterns, exclude=False):
+    regex = r'.*({}).*'.format('|'.join(patterns))
+    excl_states = df[column].str.extract(regex, expand=False).isnull()
+
+    return df[excl_states] if exclude else df[~excl_states]
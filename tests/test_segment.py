@@ -0,0 +1,107 @@
+from context import segment
+
+import datetime
+from glob import glob
+import os
+
+import pandas as pd
+import pytest
+
+NODE_DIR = os.path.join(os.path.dirname(__file__), 'rnodes-20170823_000000')
+
+NODE_FMT = 'rnodes-%Y%m%d_%H%M%S'
+
+
+@pytest.fixture(scope='module')
+def snapshots():
+    return [(_csv_timestamp(csv_path), pd.read_csv(csv_path))
+            for csv_path in sorted(glob(os.path.join(NODE_DIR, '*.csv')))]
+
+
+@pytest.fixture
+def segments(snapshots, tmp_path):
+    """Two open segments of eight snapshots each"""
+    paths = [str(tmp_path / 'part{}.seg'.format(i)) for i in range(2)]
+    writer = segment.SegmentWriter()
+
+    for i, (timestamp, snapshot) in enumerate(snapshots):
+        writer.append(paths[i // 8], snapshot, timestamp)
+
+    writer.close()
+    return paths
+
+
+def test_segment_writer(snapshots, segments):
+    read = list(segment.iter_snapshots(segments))
+
+    assert len(segment.read_index(segments[0])) == 8
+    assert [timestamp for timestamp, _ in read] == \
+        [timestamp for timestamp, _ in snapshots]
+    for (_, snapshot), (_, read_df) in zip(snapshots, read):
+        assert read_df.equals(snapshot)
+
+
+def test_segment_writer_recover(snapshots, segments):
+    path = segments[1]
+
+    # Cut the last record short, as if the writer died mid append
+    index = segment.read_index(path)
+    with open(path, mode='ab') as data_file:
+        data_file.truncate(int(index['offset'][-1]) + 10)
+
+    timestamp, snapshot = snapshots[0]
+    writer = segment.SegmentWriter()
+    writer.append(path, snapshot, timestamp)
+    writer.close()
+
+    index = segment.read_index(path)
+
+    assert len(index) == 9
+    assert os.path.getsize(path) == int(index['offset'][-1] +
+                                        index['length'][-1])
+
+
+@pytest.mark.parametrize('ext', ['gz', 'bz2', 'xz'])
+def test_seal_segments(snapshots, segments, tmp_path, ext):
+    sealed_path = str(tmp_path / 'nodes.seg.{}'.format(ext))
+
+    num_records = segment.seal_segments(segments[::-1], sealed_path)
+
+    assert num_records == len(snapshots)
+    assert segment.find_segments(str(tmp_path)) == [sealed_path]
+    assert os.path.getsize(sealed_path) < \
+        sum(len(snapshot.to_csv(index=False)) for _, snapshot in snapshots)
+
+    read = list(segment.iter_snapshots(sealed_path))
+
+    assert [timestamp for timestamp, _ in read] == \
+        [timestamp for timestamp, _ in snapshots]
+    assert read[-1][1].equals(snapshots[-1][1])
+
+
+def test_seal_segments_invalid(segments, tmp_path):
+    with pytest.raises(ValueError):
+        segment.seal_segments(segments, str(tmp_path / 'nodes.tar.bz2'))
+
+
+def test_read_snapshots_between(snapshots, segments, tmp_path):
+    segment.seal_segments(segments[:1], str(tmp_path / 'part0.seg.bz2'))
+
+    start_time, end_time = snapshots[6][0], snapshots[10][0]
+    nodes = segment.read_snapshots(str(tmp_path), start_time, end_time)
+
+    assert sorted(nodes['SnapshotTime'].unique()) == \
+        [timestamp for timestamp, _ in snapshots[6:10]]
+    assert len(nodes) == sum(len(snapshot)
+                             for _, snapshot in snapshots[6:10])
+
+
+def test_read_snapshots_empty(segments):
+    start_time = datetime.datetime(2018, 1, 1)
+
+    assert len(segment.read_snapshots(segments, start_time)) == 0
+
+
+def _csv_timestamp(csv_path):
+    file_name = os.path.splitext(os.path.basename(csv_path))[0]
+    return datetime.datetime.strptime(file_name, NODE_FMT)
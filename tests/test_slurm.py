@@ -1,12 +1,19 @@
-from context import slurm
+from context import slurm, slurpy
+
+import asyncio
+import datetime
+import io
 
 from numpy import all as np_all, \
+                  int64, \
                   unique as np_unique, \
                   sort as np_sort
 
 
 import pytest
 
+from conftest import FAKE_NOW
+
 NODE_FEATURES = ['NodeName',
                  'CPUAlloc',
                  'CPUTot',
@@ -112,6 +119,30 @@ ExtSensorsWatts=0 ExtSensorsTemp=n/s '
 
 RAW_SCONTROL_LEN = 10
 
+SINFO_FEATURES = ['NodeHost',
+                  'StateCompact',
+                  'CPUsState',
+                  'Memory',
+                  'AllocMem',
+                  'FreeMem']
+
+RAW_SINFO = 'r1n32               drain*              0/0/32/32           \
+1                   0                   N/A                 \n\
+r1n33               alloc               32/0/0/32           \
+128246              124928              107532              \n'
+
+SACCT_PROPERTIES = ['JobID',
+                    'State',
+                    'ReqCPUS',
+                    'NTasks',
+                    'Submit',
+                    'Start',
+                    'ElapsedRaw']
+
+RAW_SACCT = '1001|COMPLETED|4||2017-08-23T00:00:00|2017-08-23T00:00:05|60\n\
+1001.batch|COMPLETED|4|1|2017-08-23T00:00:05|2017-08-23T00:00:05|60\n\
+1002|PENDING|32||2017-08-23T00:01:00|Unknown|0\n'
+
 
 @pytest.mark.parametrize('node_feat', NODE_FEATURES)
 def test_compare_extraction(node_feat):
@@ -133,6 +164,356 @@ def test_extract_scontrol_features():
     assert len(node_info) == RAW_SCONTROL_LEN
 
 
+def test_split_scontrol():
+    records = slurm._split_scontrol(RAW_SCONTROL)
+
+    assert len(records) == RAW_SCONTROL_LEN
+    assert records[0]['CfgTRES'] == 'cpu=24,mem=96672M'
+    assert records[0]['AllocTRES'] == ''
+    assert records[0]['Partitions'] == 'copy'
+    assert records[1]['Reason'] == \
+        'Not responding [root@2017-06-29T08:00:07]'
+    assert records[6]['Reason'] == 'NHC:  [root@2017-08-07T11:01:52]'
+    assert 'Reason' not in records[0]
+
+
+@pytest.mark.parametrize('node_feat', NODE_FEATURES)
+def test_compare_scontrol_extraction(node_feat):
+    node_info = slurm._extract_scontrol_features(RAW_SCONTROL,
+                                                 [node_feat])
+    node_data = slurm._extract_scontrol_data(RAW_SCONTROL, [node_feat], {})
+
+    # The regex keeps placeholders like N/A as they are
+    assert list(node_data[node_feat].fillna('N/A')) == \
+        list(node_info[node_feat])
+
+
+def test_extract_scontrol_data():
+    keys = ['State', 'Reason', 'FreeMem', 'NodeName', 'CPULoad',
+            'BootTime', 'CfgTRES.cpu', 'CfgTRES.mem', 'AllocTRES.mem']
+    node_info = slurm._extract_scontrol_data(RAW_SCONTROL, keys,
+                                             slurm.SCONTROL_NODE_TYPES)
+
+    assert list(node_info.columns) == keys
+    assert len(node_info) == RAW_SCONTROL_LEN
+
+    assert node_info['FreeMem'].dtype == int64
+    assert list(node_info['FreeMem'][:2]) == [6374, 0]
+    assert node_info['CPULoad'].isnull()[1]
+    assert node_info['BootTime'].isnull()[1]
+    assert node_info['BootTime'][0] == datetime.datetime(2017, 5, 8,
+                                                         11, 58, 28)
+
+    assert list(node_info['CfgTRES.cpu'][:3]) == [24, 24, 32]
+    assert node_info['CfgTRES.mem'][0] == '96672M'
+    assert node_info['AllocTRES.mem'].isnull()[0]
+    assert node_info['AllocTRES.mem'][8] == '122G'
+
+    assert node_info['Reason'].isnull()[0]
+    assert node_info['Reason'][2] == \
+        'Not responding [root@2017-08-18T11:14:39]'
+
+
+def test_extract_scontrol_all():
+    node_info = slurm._extract_scontrol_data(RAW_SCONTROL, 'all',
+                                             slurm.SCONTROL_NODE_TYPES)
+
+    assert list(node_info.columns[:3]) == ['NodeName', 'Arch',
+                                           'CoresPerSocket']
+    assert 'Reason' in node_info
+    assert node_info['Arch'].isnull()[1]
+
+
+def test_query_scontrol(fake_slurm):
+    node_info = slurm.query_scontrol_nodes('NodeName,State,Reason,CPUAlloc',
+                                           node_list='r1n32,r2n14')
+
+    assert list(node_info['NodeName']) == ['r1n32', 'r2n14']
+    assert list(node_info['CPUAlloc']) == [0, 32]
+    assert node_info['Reason'][0].startswith('Not responding')
+    assert node_info['Reason'].isnull()[1]
+
+    job_info = slurm.query_scontrol_jobs(['TRES.cpu', 'JobId', 'Command',
+                                          'NumTasks', 'StartTime'])
+
+    assert list(job_info['JobId']) == [1001, 1002]
+    assert list(job_info['TRES.cpu']) == [4, 64]
+    assert list(job_info['NumTasks']) == [4, 0]
+    assert job_info['Command'][1] == '/home/bob/big run.sh'
+    assert job_info['StartTime'].isnull()[1]
+
+
+def test_query_queue(fake_slurm):
+    queue_info = slurm.query_queue(['JobID', 'Name', 'State', 'NumCPUs',
+                                    'NodeList', 'StartTime'])
+
+    assert list(queue_info['JobID']) == [1001, 1002, 1003]
+    assert list(queue_info['Name']) == ['test', 'big run', 'gpu']
+    assert list(queue_info['NumCPUs']) == [4, 64, 8]
+    assert queue_info['StartTime'].isnull().tolist() == [False, True, True]
+
+    pending = slurm.query_queue('JobID,Partition', partition='cpu',
+                                states='PD')
+
+    assert list(pending['JobID']) == [1002]
+    assert slurm.query_queue('JobID', states='CD').empty
+
+
+def test_squeue_cmd():
+    squeue_cmd = slurm._squeue_cmd('JobID,State', partition='cpu')
+
+    assert squeue_cmd == ['squeue', '--noheader', '-O', 'JobID:0|,State:0',
+                          '-p', 'cpu']
+
+
+def test_get_queue_df(fake_slurm):
+    queue_df = slurpy.get_queue_df('JobID,TimeUsed,TimeLimit')
+
+    assert list(queue_df['TimeUsed']) == [
+        datetime.timedelta(hours=1, minutes=2, seconds=3),
+        datetime.timedelta(0), datetime.timedelta(0)]
+    assert queue_df['TimeLimit'][0] == datetime.timedelta(days=1)
+    assert queue_df['TimeLimit'].isnull()[1]
+    assert queue_df['TimeLimit'][2] == datetime.timedelta(minutes=30)
+
+
+def test_query_queue_async(fake_slurm):
+    async def query():
+        return await asyncio.gather(
+            slurm.query_queue_async('JobID,Partition', partition='cpu',
+                                    states='PD'),
+            slurpy.get_queue_df_async('JobID,TimeUsed,TimeLimit'))
+
+    pending, queue_df = asyncio.run(query())
+
+    assert pending.equals(slurm.query_queue('JobID,Partition',
+                                            partition='cpu', states='PD'))
+    assert queue_df.equals(slurpy.get_queue_df('JobID,TimeUsed,TimeLimit'))
+
+
+def test_check_queue_fields():
+    slurm.check_queue_fields('JobID,State,TimeUsed')
+
+    with pytest.raises(ValueError):
+        slurm.check_queue_fields(['JobID', 'CPUsState'])
+
+
+def test_extract_typed_sinfo():
+    node_info = slurm._extract_typed_data(RAW_SINFO, SINFO_FEATURES,
+                                          slurm.NODE_FEATURE_TYPES,
+                                          sep=r'\s+')
+
+    assert list(node_info.columns) == SINFO_FEATURES
+    assert node_info['Memory'].dtype == int64
+    assert list(node_info['FreeMem']) == [0, 107532]
+    assert list(node_info['CPUsState']) == ['0/0/32/32', '32/0/0/32']
+
+
+def test_extract_typed_sacct():
+    job_info = slurm._extract_typed_data(RAW_SACCT, SACCT_PROPERTIES,
+                                         slurm.JOB_PROPERTY_TYPES,
+                                         sep=slurm.DELIM)
+
+    assert len(job_info) == 3
+    assert list(job_info['JobID']) == ['1001', '1001.batch', '1002']
+    assert list(job_info['NTasks']) == [0, 1, 0]
+    assert job_info['Submit'].dtype.kind == 'M'
+    assert job_info['Start'].isnull().sum() == 1
+
+
+def test_extract_typed_empty():
+    job_info = slurm._extract_typed_data('', SACCT_PROPERTIES,
+                                         slurm.JOB_PROPERTY_TYPES,
+                                         sep=slurm.DELIM)
+
+    assert job_info.empty
+    assert list(job_info.columns) == SACCT_PROPERTIES
+    assert job_info['ReqCPUS'].dtype == int64
+
+
+def test_iter_chunks():
+    lines = io.StringIO(RAW_SACCT)
+
+    chunks = list(slurm._iter_chunks(lines, 2))
+
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+
+
+def test_query_jobs_iter(monkeypatch):
+    monkeypatch.setattr(slurm, '_sacct_cmd',
+                        lambda *args, **kwargs: ['printf', RAW_SACCT])
+
+    chunks = list(slurm.query_jobs_iter(SACCT_PROPERTIES, chunk_rows=2))
+    job_info = slurm.query_jobs(SACCT_PROPERTIES)
+
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    assert list(job_info['ReqCPUS']) == [4, 4, 32]
+
+
+@pytest.mark.parametrize('slices', [2, 5])
+def test_query_jobs_sliced(fake_slurm, slices):
+    end_time = datetime.datetime.strptime(FAKE_NOW, slurm.DATE_FORMAT)
+    period = datetime.timedelta(hours=6)
+
+    jobs = slurm.query_jobs(SACCT_PROPERTIES, end_time=end_time,
+                            period=period)
+    sliced_jobs = slurm.query_jobs(SACCT_PROPERTIES, end_time=end_time,
+                                   period=period, slices=slices)
+
+    assert len(jobs) > 0
+    assert list(sliced_jobs.columns) == SACCT_PROPERTIES
+    assert sliced_jobs.equals(jobs)
+
+
+def test_query_jobs_sliced_no_period():
+    with pytest.raises(ValueError):
+        slurm.query_jobs(SACCT_PROPERTIES, slices=2)
+
+
+def test_query_async(fake_slurm):
+    end_time = datetime.datetime.strptime(FAKE_NOW, slurm.DATE_FORMAT)
+    period = datetime.timedelta(hours=6)
+
+    async def query():
+        return await asyncio.gather(
+            slurm.query_nodes_async('NodeHost,StateCompact,CPUsState'),
+            slurm.query_nodes_async('NodeHost', partition='highmem'),
+            slurm.query_jobs_async(SACCT_PROPERTIES, end_time=end_time,
+                                   period=period))
+
+    nodes, highmem_nodes, jobs = asyncio.run(query())
+
+    assert nodes.equals(slurm.query_nodes('NodeHost,StateCompact,CPUsState'))
+    assert highmem_nodes.equals(slurm.query_nodes('NodeHost',
+                                                  partition='highmem'))
+    assert jobs.equals(slurm.query_jobs(SACCT_PROPERTIES, end_time=end_time,
+                                        period=period))
+
+
+def test_query_async_fails(monkeypatch):
+    monkeypatch.setattr(slurm, '_sinfo_cmd',
+                        lambda *args, **kwargs: ['false'])
+
+    with pytest.raises(slurm.subprocess.CalledProcessError):
+        asyncio.run(slurm.query_nodes_async('NodeHost'))
+
+
+def test_node_query_planner(fake_slurm):
+    planner = slurm.NodeQueryPlanner(ttl=60)
+    planner.register('NodeHost,StateCompact')
+
+    hosts = planner.query_nodes('nodehost,Memory')
+    states = planner.query_nodes('NodeHost,StateCompact')
+    nodes = slurm.query_nodes('NodeHost,StateCompact,Memory')
+
+    assert planner.queries == 1
+    assert list(hosts.columns) == ['nodehost', 'Memory']
+    assert hosts['Memory'].equals(nodes['Memory'])
+    assert states.equals(nodes[['NodeHost', 'StateCompact']])
+
+
+def test_node_query_planner_groups(fake_slurm):
+    planner = slurm.NodeQueryPlanner(ttl=60)
+
+    nodes = planner.query_nodes('NodeHost,StateCompact')
+    partition_nodes = planner.query_nodes('NodeHost,PartitionName')
+    highmem_nodes = planner.query_nodes('NodeHost', partition='highmem')
+
+    assert planner.queries == 3
+    assert len(partition_nodes) > len(nodes)
+    assert len(highmem_nodes) < len(nodes)
+
+
+def test_node_query_planner_node_list(fake_slurm):
+    planner = slurm.NodeQueryPlanner(ttl=60)
+    planner.register('NodeHost,StateCompact')
+
+    planner.query_nodes('NodeHost,StateCompact')
+    node_lists = planner.query_nodes('NodeList,StateCompact')
+    nodes = slurm.query_nodes('NodeList,StateCompact')
+
+    # NodeList rows fold nodes, so are never served from a NodeHost query
+    assert planner.queries == 1
+    assert node_lists.equals(nodes)
+    assert len(nodes) < len(planner.query_nodes('NodeHost'))
+
+
+def test_query_nodes_partitions(slurm_calls):
+    nodes = slurm.query_nodes('NodeHost,StateCompact',
+                              partition=['cpu', 'test'])
+
+    assert len(slurm_calls()) == 1
+    assert list(nodes.columns) == ['NodeHost', 'StateCompact',
+                                   'PartitionName']
+    assert set(nodes['PartitionName']) == {'cpu', 'test'}
+    assert nodes.equals(slurm.query_nodes(
+        'NodeHost,StateCompact,PartitionName', partition='cpu,test'))
+
+    # r1 nodes are in both partitions
+    test_nodes = nodes[nodes['PartitionName'] == 'test']
+    assert (nodes['NodeHost'].isin(test_nodes['NodeHost']).sum() ==
+            2 * len(test_nodes))
+
+
+def test_query_nodes_clusters(slurm_calls):
+    nodes = slurm.query_nodes('NodeHost,CPUs', partition='highmem')
+    cluster_nodes = slurm.query_nodes('NodeHost,CPUs', partition='highmem',
+                                      clusters=['a', 'b'])
+
+    assert len(slurm_calls()) == 2
+    assert list(cluster_nodes.columns) == ['NodeHost', 'CPUs', 'Cluster']
+    assert cluster_nodes['CPUs'].dtype == nodes['CPUs'].dtype
+
+    for cluster in ['a', 'b']:
+        in_cluster = cluster_nodes.loc[cluster_nodes['Cluster'] == cluster,
+                                       ['NodeHost', 'CPUs']]
+        assert in_cluster.reset_index(drop=True).equals(nodes)
+
+    lone_nodes = slurm._extract_nodes('highmem01 32\n', ['NodeHost', 'CPUs'],
+                                      clusters='a')
+    assert list(lone_nodes['Cluster']) == ['a']
+
+    no_nodes = slurm._extract_nodes('', ['NodeHost'], clusters='a,b')
+    assert no_nodes.empty
+    assert list(no_nodes.columns) == ['NodeHost', 'Cluster']
+
+
+@pytest.mark.parametrize('slices', [1, 3])
+def test_query_jobs_clusters(slurm_calls, slices):
+    end_time = datetime.datetime.strptime(FAKE_NOW, slurm.DATE_FORMAT)
+    period = datetime.timedelta(hours=6)
+
+    jobs = slurm.query_jobs(SACCT_PROPERTIES, end_time=end_time,
+                            period=period, partition='cpu,gpu')
+    cluster_jobs = slurm.query_jobs(SACCT_PROPERTIES, end_time=end_time,
+                                    period=period, partition=['cpu', 'gpu'],
+                                    clusters='a,b', slices=slices)
+
+    assert len(slurm_calls()) == 1 + slices
+    assert list(cluster_jobs.columns) == SACCT_PROPERTIES + ['Partition',
+                                                             'Cluster']
+    assert set(jobs['Partition']) == {'cpu', 'gpu'}
+
+    for cluster in ['a', 'b']:
+        in_cluster = cluster_jobs[cluster_jobs['Cluster'] == cluster]
+        assert in_cluster.drop(columns='Cluster') \
+                         .reset_index(drop=True).equals(jobs)
+
+
+def test_sinfo_cmd():
+    sinfo_cmd = slurm._sinfo_cmd('NodeHost', partition=['cpu', 'test'],
+                                 clusters=['a', 'b'])
+
+    assert sinfo_cmd[-4:] == ['-p', 'cpu,test', '-M', 'a,b']
+
+
+def test_sacct_cmd():
+    sacct_cmd = slurm._sacct_cmd('JobIDRaw', partition=['cpu', 'gpu'],
+                                 clusters='a')
+
+    assert sacct_cmd[-4:] == ['-r', 'cpu,gpu', '-M', 'a']
+
+
 def test_listify():
     comma_string = 'test1,test2,test3'
     comma_lst = ['test1', 'test2', 'test3']
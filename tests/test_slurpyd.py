@@ -1,12 +1,20 @@
-from context import slurpy_daemon
+from context import archive, cache, columnar, history, segment, \
+    slurpy_daemon
+from conftest import FAKE_NOW
 from configparser import ConfigParser, ExtendedInterpolation
 
+import asyncio
 import datetime
 from glob import glob
 import logging
 import os
+import signal
+import subprocess
 import tarfile
+import threading
+import time
 
+import pandas as pd
 import pytest
 
 CRON_FREQUENCIES = ['1', '10', '-1', '0']
@@ -50,6 +58,16 @@ def test_node_track():
     os.remove(os.path.expanduser(csv_path))
 
 
+def test_read_config_optional():
+    """sacct and squeue are only polled if asked for"""
+    config = slurpy_daemon.read_config(os.path.join(
+        os.path.dirname(slurpy_daemon.__file__), 'slurpyd.ini'))
+
+    assert not config.has_section('JobOrders')
+    assert not config.has_section('QueueTrack')
+    assert config['NodeTrack']['out_dir_sh']
+
+
 def test_merge_node():
     mlog = slurpy_daemon.get_slurpyd_logger(slurpy_daemon.MRGE_LOG)
 
@@ -78,8 +96,17 @@ def test_merge_node():
               tar_path, merge_config['out_dir'])
     extract_files(tar_path, tar_ext, merge_config['out_dir_sh'])
 
+    index = archive.read_index(tar_path)
+    catalog_path = os.path.join(merge_config['out_dir_sh'],
+                                archive.CATALOG_FILE)
+
+    assert len(index) == 12
+    assert index['Timestamp'].is_monotonic_increasing
+
     mlog.info("Removing {}".format(tar_path))
     os.remove(os.path.expanduser(tar_path))
+    os.remove('{}.{}'.format(tar_path, archive.INDEX_EXT))
+    os.remove(catalog_path)
 
 
 @pytest.mark.parametrize('frequency', CRON_FREQUENCIES)
@@ -112,6 +139,607 @@ def test_get_files_between():
     assert len(files) == 12
 
 
+def test_history_writer(tmp_path):
+    nlog = slurpy_daemon.get_slurpyd_logger(slurpy_daemon.NODE_LOG)
+
+    node_dir = os.path.expanduser(os.path.join(TEST_DIR, NODE_DIR))
+    store = history.HistoryStore(str(tmp_path / 'history'))
+    node_writer = slurpy_daemon._history_writer(
+        slurpy_daemon.df_writer('csv'), store)
+    assert slurpy_daemon.OPEN_APPENDERS.pop() is store
+
+    csv_paths = sorted(glob(os.path.join(node_dir, '*.csv')))
+    for csv_path in csv_paths:
+        node_time = datetime.datetime.strptime(
+            os.path.splitext(os.path.basename(csv_path))[0], NODE_FMT)
+        node_path = str(tmp_path / node_time.strftime(NODE_FMT))
+
+        assert node_writer(nlog, pd.read_csv(csv_path), node_path,
+                           node_time) == '{}.csv'.format(node_path)
+
+    store.close()
+
+    node_df = history.node_history('r2n14', '2017-08-22', END_TIME,
+                                   store_dir=store.path)
+
+    assert len(node_df) == len(csv_paths) - 2
+    assert len(glob(str(tmp_path / '*.csv'))) == len(csv_paths)
+
+
+def test_history_writer_fails(tmp_path, caplog):
+    """A snapshot the history store cannot take is still written"""
+    nlog = slurpy_daemon.get_slurpyd_logger(slurpy_daemon.NODE_LOG)
+
+    node_dir = os.path.expanduser(os.path.join(TEST_DIR, NODE_DIR))
+    store = history.HistoryStore(str(tmp_path / 'history'))
+    node_writer = slurpy_daemon._history_writer(
+        slurpy_daemon.df_writer('csv'), store)
+    slurpy_daemon.OPEN_APPENDERS.remove(store)
+
+    csv_path = sorted(glob(os.path.join(node_dir, '*.csv')))[0]
+    node_df = pd.read_csv(csv_path)
+    node_df.loc[0, 'CPUsState'] = None
+    node_path = str(tmp_path / 'rnodes')
+
+    with caplog.at_level(logging.ERROR):
+        file_path = node_writer(nlog, node_df, node_path)
+
+    assert file_path == '{}.csv'.format(node_path)
+    assert os.path.exists(file_path)
+    assert 'Adding to history' in caplog.text
+
+
+def test_parquet_writer(tmp_path):
+    pytest.importorskip('pyarrow')
+    nlog = slurpy_daemon.get_slurpyd_logger(slurpy_daemon.NODE_LOG)
+
+    node_dir = os.path.expanduser(os.path.join(TEST_DIR, NODE_DIR))
+    node_writer = slurpy_daemon.df_writer('parquet')
+    appender = slurpy_daemon.OPEN_APPENDERS.pop()
+
+    # Files roll over every minute
+    for csv_path in sorted(glob(os.path.join(node_dir, '*.csv'))):
+        node_time = datetime.datetime.strptime(
+            os.path.splitext(os.path.basename(csv_path))[0], NODE_FMT)
+        node_path = str(tmp_path / node_time.strftime('rnodes-%Y%m%d_%H%M'))
+
+        node_writer(nlog, pd.read_csv(csv_path), node_path, node_time)
+
+    appender.close()
+
+    parquet_files = sorted(os.listdir(str(tmp_path)))
+    snapshot_times = [columnar.read_snapshots(
+        str(tmp_path / parquet_file))['SnapshotTime'].nunique()
+        for parquet_file in parquet_files]
+
+    assert parquet_files == ['rnodes-20170822_2359.parquet',
+                             'rnodes-20170823_0000.parquet',
+                             'rnodes-20170823_0001.parquet']
+    assert snapshot_times == [2, 12, 2]
+
+
+def test_parquet_merge(tmp_path):
+    pytest.importorskip('pyarrow')
+    nlog = slurpy_daemon.get_slurpyd_logger(slurpy_daemon.NODE_LOG)
+
+    config = ConfigParser(interpolation=ExtendedInterpolation())
+    config['NodeTrack'] = {'out_dir_sh': str(tmp_path),
+                           'out_file': 'rnodes-%Y%m%d_%H%M'}
+    config['MergeNode'] = {'out_dir_sh': str(tmp_path),
+                           'out_file': 'rnodes-%Y%m%d_%H%M%S',
+                           'out_compression': 'bzip2',
+                           'frequency': '1',
+                           'units': 'minute'}
+    node_config = config['NodeTrack']
+
+    # Every snapshot is written out, so open files are on disk
+    appender = columnar.SnapshotAppender(row_group_rows=1)
+    node_writer = slurpy_daemon._parquet_writer(appender)
+
+    node_dir = os.path.expanduser(os.path.join(TEST_DIR, NODE_DIR))
+    for csv_path in sorted(glob(os.path.join(node_dir, '*.csv'))):
+        node_time = datetime.datetime.strptime(
+            os.path.splitext(os.path.basename(csv_path))[0], NODE_FMT)
+        node_path = os.path.join(node_config['out_dir_sh'],
+                                 node_time.strftime(node_config['out_file']))
+
+        node_writer(nlog, pd.read_csv(csv_path), node_path, node_time)
+
+    open_path = appender.path
+    merge_compressor = slurpy_daemon.df_compressor('tar')
+
+    # The minute still being written to is left alone...
+    slurpy_daemon.merge_node(node_config, config['MergeNode'],
+                             merge_compressor,
+                             time_generator('2017-08-23 00:01:30'))
+
+    assert appender.path == open_path
+    assert os.path.exists(open_path)
+
+    node_writer(nlog, pd.read_csv(csv_path), node_path,
+                datetime.datetime(2017, 8, 23, 0, 1, 40))
+
+    # ...until the merge after its minute is over closes and archives it
+    slurpy_daemon.merge_node(node_config, config['MergeNode'],
+                             merge_compressor,
+                             time_generator('2017-08-23 00:02:00'))
+    slurpy_daemon.OPEN_APPENDERS.remove(appender)
+
+    assert appender.path is None
+    assert not os.path.exists(open_path)
+
+    tar_path = str(tmp_path / 'rnodes-20170823_000100.tar.bz2')
+    extract_dir = tmp_path / 'extract'
+    with tarfile.open(tar_path) as tar_file:
+        tar_file.extractall(str(extract_dir), filter='data')
+
+    parquet_path, = glob(str(extract_dir / '*' / '*.parquet'))
+    snapshots = columnar.read_snapshots(parquet_path)
+
+    assert snapshots['SnapshotTime'].nunique() == 3
+
+
+def test_merge_after_boundary(tmp_path):
+    """A merge just after files roll still archives the file rolled into"""
+    pytest.importorskip('pyarrow')
+    nlog = slurpy_daemon.get_slurpyd_logger(slurpy_daemon.NODE_LOG)
+
+    config = ConfigParser(interpolation=ExtendedInterpolation())
+    config['NodeTrack'] = {'out_dir_sh': str(tmp_path),
+                           'out_file': 'rnodes-%Y%m%d%H'}
+    config['MergeNode'] = {'out_dir_sh': str(tmp_path),
+                           'out_file': 'rnodes-%Y%m%d_%H%M%S',
+                           'out_compression': 'bzip2',
+                           'frequency': '1',
+                           'units': 'day'}
+    node_config = config['NodeTrack']
+
+    appender = columnar.SnapshotAppender(row_group_rows=1)
+    node_writer = slurpy_daemon._parquet_writer(appender)
+    merge_compressor = slurpy_daemon.df_compressor('tar')
+
+    node_dir = os.path.expanduser(os.path.join(TEST_DIR, NODE_DIR))
+    node_df = pd.read_csv(sorted(glob(os.path.join(node_dir, '*.csv')))[0])
+
+    def write(time_str):
+        node_time = datetime.datetime.strptime(time_str, TIMESTAMP)
+        node_path = os.path.join(node_config['out_dir_sh'],
+                                 node_time.strftime(node_config['out_file']))
+        node_writer(nlog, node_df, node_path, node_time)
+
+    for time_str in ['2020-01-01 22:00:00', '2020-01-01 23:00:00',
+                     '2020-01-02 00:00:01']:
+        write(time_str)
+
+    slurpy_daemon.merge_node(node_config, config['MergeNode'],
+                             merge_compressor,
+                             time_generator('2020-01-02 00:00:03'))
+
+    write('2020-01-02 01:00:00')
+
+    slurpy_daemon.merge_node(node_config, config['MergeNode'],
+                             merge_compressor,
+                             time_generator('2020-01-03 00:00:03'))
+    slurpy_daemon.OPEN_APPENDERS.remove(appender)
+
+    assert not glob(str(tmp_path / '*.parquet'))
+
+    archived = []
+    for day in ['20200101', '20200102']:
+        tar_path = str(tmp_path / 'rnodes-{}_000000.tar.bz2'.format(day))
+        with tarfile.open(tar_path) as tar_file:
+            archived.append(sorted(os.path.basename(name)
+                                   for name in tar_file.getnames()
+                                   if name.endswith('.parquet')))
+
+    assert archived == [['rnodes-2020010122.parquet',
+                         'rnodes-2020010123.parquet'],
+                        ['rnodes-2020010200.parquet',
+                         'rnodes-2020010201.parquet']]
+
+
+def test_segment_merge(tmp_path):
+    nlog = slurpy_daemon.get_slurpyd_logger(slurpy_daemon.NODE_LOG)
+    mlog = slurpy_daemon.get_slurpyd_logger(slurpy_daemon.MRGE_LOG)
+
+    config = ConfigParser(interpolation=ExtendedInterpolation())
+    config['NodeTrack'] = {'out_dir_sh': str(tmp_path),
+                           'out_file': 'rnodes-%Y%m%d_%H%M'}
+    config['MergeNode'] = {'out_dir_sh': str(tmp_path),
+                           'out_file': 'rnodes-%Y%m%d_%H%M%S',
+                           'out_compression': 'bzip2',
+                           'frequency': '1',
+                           'units': 'minute'}
+    node_config = config['NodeTrack']
+
+    node_dir = os.path.expanduser(os.path.join(TEST_DIR, NODE_DIR))
+    node_writer = slurpy_daemon.df_writer('segment')
+
+    for csv_path in sorted(glob(os.path.join(node_dir, '*.csv'))):
+        node_time = datetime.datetime.strptime(
+            os.path.splitext(os.path.basename(csv_path))[0], NODE_FMT)
+        node_path = os.path.join(node_config['out_dir_sh'],
+                                 node_time.strftime(node_config['out_file']))
+
+        node_writer(nlog, pd.read_csv(csv_path), node_path, node_time)
+
+    merge_compressor = slurpy_daemon.df_compressor('segment')
+    slurpy_daemon.merge_node(node_config, config['MergeNode'],
+                             merge_compressor,
+                             time_generator('2017-08-23 00:01:00'))
+
+    # The minute still being written to is left open...
+    assert sorted(os.listdir(str(tmp_path))) == [
+        'rnodes-20170822_2359.seg',
+        'rnodes-20170822_2359.seg.idx',
+        'rnodes-20170823_000000.seg.bz2',
+        'rnodes-20170823_000000.seg.bz2.idx',
+        'rnodes-20170823_0001.seg',
+        'rnodes-20170823_0001.seg.idx']
+
+    # ...until the merge after its minute is over closes it
+    writer = slurpy_daemon.OPEN_APPENDERS[-1]
+    slurpy_daemon.merge_node(node_config, config['MergeNode'],
+                             merge_compressor,
+                             time_generator('2017-08-23 00:02:00'))
+    slurpy_daemon.OPEN_APPENDERS.remove(writer)
+
+    assert writer.path is None
+
+    sealed_paths = [str(tmp_path / 'rnodes-20170823_{}.seg.bz2'.format(time))
+                    for time in ['000000', '000100']]
+
+    assert [len(segment.read_index(path)) for path in sealed_paths] == [12, 2]
+
+
+@pytest.mark.parametrize('time_format,is_ordered',
+                         [('rnodes-%Y%m%d_%H%M%S', True),
+                          ('rnodes-%Y%m%d_%H', True),
+                          ('%Y-%m-%dT%H:%M:%S', True),
+                          ('100%%-%Y%m%d', True),
+                          ('rnodes-%d%m%Y', False),
+                          ('rnodes-%Y%m%d_%H%S', False),
+                          ('rnodes-%y%m%d', False),
+                          ('rnodes', False)])
+def test_is_ordered(time_format, is_ordered):
+    assert slurpy_daemon._is_ordered(time_format) == is_ordered
+
+
+@pytest.mark.parametrize('time_format', ['rnodes-%Y%m%d_%H%M%S',
+                                         'rnodes-%Y%m%d_%H%M',
+                                         'rnodes-%d%m%Y_%H%M%S'])
+def test_get_files_between_bounds(tmp_path, time_format):
+    config = {'out_dir_sh': str(tmp_path), 'out_file': time_format}
+
+    times = [datetime.datetime(2017, 8, 23) + i * datetime.timedelta(
+        seconds=25) for i in range(-100, 400)]
+    for time in times:
+        (tmp_path / (time.strftime(time_format) + '.csv')).touch()
+    (tmp_path / 'notes.txt').touch()
+    (tmp_path / 'subdir').mkdir()
+    (tmp_path / 'subdir' / (times[0].strftime(time_format) + '.csv')).touch()
+
+    start_time = datetime.datetime(2017, 8, 23, 0, 10, 30)
+    end_time = datetime.datetime(2017, 8, 23, 1, 0, 0)
+    files = list(slurpy_daemon.get_files_between(start_time, end_time,
+                                                 config))
+
+    expected = sorted({os.path.join(str(tmp_path),
+                                    time.strftime(time_format) + '.csv')
+                       for time in times
+                       if start_time <= datetime.datetime.strptime(
+                           time.strftime(time_format), time_format) <
+                       end_time})
+
+    assert files == expected
+
+
+def test_get_files_between_manifest(tmp_path):
+    nlog = slurpy_daemon.get_slurpyd_logger(slurpy_daemon.NODE_LOG)
+
+    config = ConfigParser(interpolation=ExtendedInterpolation())
+    config['NodeTrack'] = {'out_dir_sh': str(tmp_path),
+                           'out_file': NODE_FMT}
+    config['MergeNode'] = {'out_dir_sh': str(tmp_path),
+                           'out_file': NODE_FMT,
+                           'out_compression': 'bzip2',
+                           'frequency': '1',
+                           'units': 'minute'}
+    node_config = config['NodeTrack']
+
+    manifest = slurpy_daemon.Manifest(
+        str(tmp_path / slurpy_daemon.MANIFEST_FILE))
+    node_writer = slurpy_daemon.df_writer('csv')
+
+    node_dir = os.path.expanduser(os.path.join(TEST_DIR, NODE_DIR))
+    for csv_path in sorted(glob(os.path.join(node_dir, '*.csv'))):
+        node_time = datetime.datetime.strptime(
+            os.path.splitext(os.path.basename(csv_path))[0], NODE_FMT)
+        node_path = os.path.join(str(tmp_path), node_time.strftime(NODE_FMT))
+
+        file_path = node_writer(nlog, pd.read_csv(csv_path), node_path)
+        manifest.add(os.path.basename(file_path))
+
+    # Files the manifest does not list are never found
+    (tmp_path / 'rnodes-20170823_000030.csv').rename(
+        tmp_path / 'rnodes-20170823_000031.csv')
+
+    start_time = time_generator(START_TIME)()
+    end_time = time_generator(END_TIME)()
+    listed = list(slurpy_daemon.get_files_between(start_time, end_time,
+                                                  node_config))
+    from_manifest = list(slurpy_daemon.get_files_between(
+        start_time, end_time, node_config, manifest))
+
+    assert len(manifest.names()) == 16
+    assert len(listed) == 12
+    assert len(from_manifest) == 11
+    assert set(listed) - set(from_manifest) == \
+        {str(tmp_path / 'rnodes-20170823_000031.csv')}
+
+    slurpy_daemon.merge_node(node_config, config['MergeNode'],
+                             slurpy_daemon.df_compressor('tar'),
+                             time_generator(END_TIME), manifest)
+
+    # Merged, and missing, files are dropped from the manifest
+    assert manifest.names() == ['rnodes-20170822_235950.csv',
+                                'rnodes-20170822_235955.csv',
+                                'rnodes-20170823_000100.csv',
+                                'rnodes-20170823_000105.csv']
+
+
+def test_job_track(tmp_path, fake_slurm):
+    config = ConfigParser(interpolation=ExtendedInterpolation())
+    config['JobOrders'] = {'out_dir_sh': str(tmp_path),
+                           'out_dir': str(tmp_path),
+                           'out_file': 'jobs-%Y%m%d_%H%M%S%f',
+                           'properties': 'JobIDRaw,State,ElapsedRaw'}
+    job_config = config['JobOrders']
+
+    state_path = str(tmp_path / slurpy_daemon.JOBS_MARK_FILE)
+    now = datetime.datetime.strptime(FAKE_NOW, '%Y-%m-%dT%H:%M:%S')
+    job_tracker = cache.JobTracker(job_config['properties'],
+                                   state_path=state_path,
+                                   now_eval=lambda: now)
+    job_writer = slurpy_daemon.df_writer('csv')
+
+    slurpy_daemon.job_track(job_config, job_writer, job_tracker)
+    slurpy_daemon.job_track(job_config, job_writer, job_tracker)
+
+    # Nothing changed between the two polls
+    csv_files = glob(str(tmp_path / '*.csv'))
+    assert len(csv_files) == 1
+    assert len(pd.read_csv(csv_files[0])) > 0
+    assert os.path.exists(state_path)
+
+
+def test_queue_track(tmp_path, fake_slurm):
+    config = ConfigParser(interpolation=ExtendedInterpolation())
+    config['QueueTrack'] = {'out_dir_sh': str(tmp_path),
+                            'out_dir': str(tmp_path),
+                            'out_file': 'queue-%Y%m%d_%H%M%S',
+                            'fields': 'JobID,StateCompact,TimeUsed',
+                            'partition': 'cpu'}
+    queue_config = config['QueueTrack']
+    queue_writer = slurpy_daemon.df_writer('csv')
+
+    file_path = slurpy_daemon.queue_track(queue_config, queue_writer)
+    queue_df = pd.read_csv(file_path)
+
+    assert list(queue_df['JobID']) == [1001, 1002]
+    assert list(queue_df['StateCompact']) == ['R', 'PD']
+    assert slurpy_daemon._queue_summary(queue_df) == ' (1 R, 1 PD)'
+
+
+def test_queue_track_async(tmp_path, fake_slurm, monkeypatch):
+    config = ConfigParser(interpolation=ExtendedInterpolation())
+    config['QueueTrack'] = {'out_dir_sh': str(tmp_path),
+                            'out_dir': str(tmp_path),
+                            'out_file': 'queue-%Y%m%d_%H%M%S',
+                            'fields': 'JobID,StateCompact,TimeUsed',
+                            'partition': 'cpu'}
+    queue_config = config['QueueTrack']
+    queue_writer = slurpy_daemon.df_writer('csv')
+
+    # squeue runs as an asyncio subprocess, not on the executor
+    def blocking(*args, **kwargs):
+        raise AssertionError('squeue run blocking')
+
+    monkeypatch.setattr(subprocess, 'check_output', blocking)
+
+    file_path = asyncio.run(slurpy_daemon.queue_track_async(queue_config,
+                                                            queue_writer))
+    queue_df = pd.read_csv(file_path)
+
+    assert list(queue_df['JobID']) == [1001, 1002]
+    assert list(queue_df['StateCompact']) == ['R', 'PD']
+
+
+def test_write_pipeline(tmp_path):
+    nlog = slurpy_daemon.get_slurpyd_logger(slurpy_daemon.NODE_LOG)
+
+    manifest = slurpy_daemon.Manifest(
+        str(tmp_path / slurpy_daemon.MANIFEST_FILE))
+    csv_writer = slurpy_daemon.df_writer('csv')
+    writing = threading.Event()
+    release = threading.Event()
+
+    # Hold the writer up until the queue has filled
+    def slow_writer(log, dataframe, path, timestamp=None):
+        writing.set()
+        release.wait()
+        return csv_writer(log, dataframe, path, timestamp)
+
+    pipeline = slurpy_daemon.WritePipeline(nlog, slow_writer, manifest,
+                                           max_queued=2, batch_size=2)
+    pipeline.start()
+
+    node_dir = os.path.expanduser(os.path.join(TEST_DIR, NODE_DIR))
+    csv_paths = sorted(glob(os.path.join(node_dir, '*.csv')))[:6]
+    for i, csv_path in enumerate(csv_paths):
+        node_time = datetime.datetime.strptime(
+            os.path.splitext(os.path.basename(csv_path))[0], NODE_FMT)
+        node_path = str(tmp_path / node_time.strftime(NODE_FMT))
+
+        pipeline.put(pd.read_csv(csv_path), node_path, node_time)
+
+        # The first snapshot is taken off the queue before it fills
+        if i == 0:
+            assert writing.wait(timeout=10)
+
+    release.set()
+    assert pipeline.stop(timeout=10)
+
+    assert pipeline.queued == 3
+    assert pipeline.dropped == 3
+    assert pipeline.written == pipeline.queued
+    assert pipeline.failed == 0
+    assert pipeline not in slurpy_daemon.OPEN_PIPELINES
+
+    written = sorted(name for name in os.listdir(str(tmp_path))
+                     if name.endswith('.csv'))
+    assert manifest.names() == written
+    assert written[0] == os.path.basename(csv_paths[0])
+
+
+def test_write_pipeline_stop(tmp_path):
+    nlog = slurpy_daemon.get_slurpyd_logger(slurpy_daemon.NODE_LOG)
+
+    manifest = slurpy_daemon.Manifest(
+        str(tmp_path / slurpy_daemon.MANIFEST_FILE))
+    release = threading.Event()
+
+    def blocked_writer(log, dataframe, path, timestamp=None):
+        release.wait()
+        return path
+
+    pipeline = slurpy_daemon.WritePipeline(nlog, blocked_writer, manifest,
+                                           max_queued=1, batch_size=1)
+    pipeline.start()
+
+    # Fill the queue behind the blocked write, so the stop cannot be queued
+    now = datetime.datetime.strptime(FAKE_NOW, '%Y-%m-%dT%H:%M:%S')
+    for i in range(3):
+        pipeline.put(pd.DataFrame(), str(tmp_path / str(i)), now)
+
+    # Queueing the stop and joining the writer share one timeout
+    start = time.monotonic()
+    assert not pipeline.stop(timeout=0.5)
+    assert time.monotonic() - start < 0.9
+
+    release.set()
+    assert pipeline.stop(timeout=10)
+
+    # Every open pipeline is stopped at exit, not every other one
+    pipelines = [slurpy_daemon.WritePipeline(nlog, blocked_writer, manifest)
+                 for _ in range(3)]
+    for pipeline in pipelines:
+        pipeline.start()
+
+    with pytest.raises(SystemExit):
+        slurpy_daemon.graceful_exit(signal.SIGTERM, None)
+
+    for pipeline in pipelines:
+        assert pipeline not in slurpy_daemon.OPEN_PIPELINES
+        assert not pipeline._thread.is_alive()
+
+
+def test_node_track_pipeline(tmp_path, fake_slurm):
+    nlog = slurpy_daemon.get_slurpyd_logger(slurpy_daemon.NODE_LOG)
+
+    config = ConfigParser(interpolation=ExtendedInterpolation())
+    config['NodeTrack'] = {'out_dir_sh': str(tmp_path),
+                           'out_dir': str(tmp_path),
+                           'out_file': NODE_FMT,
+                           'features': 'NodeHost,StateCompact,CPUsState'}
+    node_config = config['NodeTrack']
+
+    pipeline = slurpy_daemon.WritePipeline(
+        nlog, slurpy_daemon.df_writer('csv'))
+    pipeline.start()
+
+    slurpy_daemon.node_track(node_config, slurpy_daemon.df_writer('none'),
+                             pipeline=pipeline)
+    assert pipeline.stop(timeout=10)
+
+    csv_files = glob(str(tmp_path / '*.csv'))
+    assert pipeline.written == 1
+    assert len(csv_files) == 1
+    assert list(pd.read_csv(csv_files[0]).columns) == \
+        ['NodeHost', 'StateCompact', 'CPUsState']
+
+
+def test_tick_scheduler():
+    slog = slurpy_daemon.get_slurpyd_logger(slurpy_daemon.MAIN_LOG)
+    period = datetime.timedelta(milliseconds=100)
+
+    tick_times = []
+    slow_starts = []
+
+    async def record():
+        tick_times.append(datetime.datetime.now())
+
+    async def slow():
+        slow_starts.append(datetime.datetime.now())
+        await asyncio.sleep(0.35)
+
+    async def failing():
+        raise RuntimeError('failed tick')
+
+    scheduler = slurpy_daemon.TickScheduler(slog)
+    scheduler.add_job(record, period)
+    scheduler.add_job(slow, period, max_instances=1)
+    scheduler.add_job(failing, period)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(asyncio.wait_for(scheduler.run(), timeout=1.05))
+
+    # Ticks fall on multiples of period, and skip while a run is going
+    offsets = [(time - time.replace(microsecond=0)) % period
+               for time in tick_times]
+    assert 8 <= len(tick_times) <= 11
+    assert all(offset < datetime.timedelta(milliseconds=50)
+               for offset in offsets)
+    assert 2 <= len(slow_starts) <= 3
+
+    with pytest.raises(ValueError):
+        scheduler.add_job(record, datetime.timedelta(0))
+
+
+def test_next_tick():
+    period = datetime.timedelta(seconds=5)
+    time = datetime.datetime(2017, 8, 23, 12, 0, 3, 500)
+
+    assert slurpy_daemon._next_tick(time, period) == \
+        datetime.datetime(2017, 8, 23, 12, 0, 5)
+    assert slurpy_daemon._next_tick(
+        datetime.datetime(2017, 8, 23, 12, 0, 5), period) == \
+        datetime.datetime(2017, 8, 23, 12, 0, 10)
+    assert slurpy_daemon._next_tick(time, datetime.timedelta(days=1)) == \
+        datetime.datetime(2017, 8, 24)
+
+
+def test_node_track_async(tmp_path, fake_slurm):
+    config = ConfigParser(interpolation=ExtendedInterpolation())
+    config['NodeTrack'] = {'out_dir_sh': str(tmp_path),
+                           'out_dir': str(tmp_path),
+                           'out_file': NODE_FMT,
+                           'features': 'NodeHost,StateCompact,CPUsState'}
+    node_config = config['NodeTrack']
+
+    manifest = slurpy_daemon.Manifest(
+        str(tmp_path / slurpy_daemon.MANIFEST_FILE))
+
+    asyncio.run(slurpy_daemon.node_track_async(
+        node_config, slurpy_daemon.df_writer('csv'), manifest=manifest))
+
+    csv_files = glob(str(tmp_path / '*.csv'))
+    assert len(csv_files) == 1
+    assert manifest.names() == [os.path.basename(csv_files[0])]
+    assert list(pd.read_csv(csv_files[0]).columns) == \
+        ['NodeHost', 'StateCompact', 'CPUsState']
+
+
 @pytest.mark.parametrize('test_pair', BYTE_PAIRS)
 def test_to_bytes(test_pair):
     assert slurpy_daemon._to_bytes(test_pair[0]) == test_pair[1]